@@ -18,20 +18,41 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import time
+
+_IMPORT_STARTED = time.monotonic()
+
 import json
 import datetime
-import dateutil.parser
+import email.utils
+import functools
 import logging
+import random
 import re
+import signal
 import math
+import collections
 import configparser
+import contextlib
+import csv
+import dataclasses
 import getopt
+import glob
+import itertools
 import sys
+import sqlite3
+import threading
+import os
+from concurrent.futures import ThreadPoolExecutor
 from getpass import getpass
 
-from togglwrapper import Toggl
-from jira import Worklog
-from jira import JIRA, JIRAError
+import requests
+import urllib.parse
+import urllib3
+
+# jira and dateutil are imported when they are needed, since most of the scheduled runs have nothing to insert
+
+_IMPORT_TIME = time.monotonic() - _IMPORT_STARTED
 
 # TODO: Testen ausserhalb der IDE
 # TODO: Remaining Estimate pro Worklog oder pro Projekt konfigurierbar machen (Tags?)
@@ -45,6 +66,58 @@ from jira import JIRA, JIRAError
 
 _logger = logging.getLogger(__name__)
 
+TOGGL_API_URL = "https://api.track.toggl.com/api/v9"
+TOGGL_REPORTS_API_URL = "https://api.track.toggl.com/reports/api/v3"
+# maximum number of rows the Reports API returns per page
+TOGGL_REPORTS_PAGE_SIZE = 50
+# maximum number of days the Reports API accepts in one search
+TOGGL_REPORTS_MAX_DAYS = 365
+# maximum number of time entry ids Toggl accepts in one bulk edit request
+TOGGL_BULK_EDIT_CHUNK_SIZE = 100
+TOGGL_PROCESSED_TAG = "jiraprocessed"
+TOGGL_ERROR_TAG = "jiraerror"
+# a time entry is either processed or has an error, the other tag is removed when one of them is added
+TOGGL_OPPOSITE_TAGS = {TOGGL_PROCESSED_TAG: TOGGL_ERROR_TAG, TOGGL_ERROR_TAG: TOGGL_PROCESSED_TAG}
+# number of issue keys which are validated with one JQL search
+JIRA_JQL_CHUNK_SIZE = 100
+JIRA_ISSUE_CACHE_TTL = 24 * 60 * 60
+# number of distinct project names and descriptions whose issue keys are memoized
+ISSUE_KEY_CACHE_SIZE = 65536
+# maximum number of worklog ids JIRA accepts in one worklog list request
+JIRA_WORKLOG_LIST_CHUNK_SIZE = 1000
+# Toggl accepts a "since" parameter up to three months in the past
+TOGGL_SINCE_MAX_AGE = 90 * 24 * 60 * 60
+# the watermark is taken from the local clock but compared with the modification times of Toggl, so it is moved back
+# by a few minutes to allow for clock skew; the processed time entries which are fetched again are skipped
+TOGGL_WATERMARK_MARGIN = 5 * 60
+# all Toggl projects are fetched again after a day, in between only the changed projects are fetched, at most once
+# per minute
+TOGGL_PROJECT_CACHE_TTL = 24 * 60 * 60
+TOGGL_PROJECT_SYNC_INTERVAL = 60
+# Toggl asks for no more than one request per second per API token, short bursts are tolerated
+TOGGL_RATE_LIMIT = 1.0
+TOGGL_RATE_LIMIT_BURST = 5
+HTTP_TIMEOUT = 60
+HTTP_MAX_RETRIES = 5
+HTTP_BACKOFF_FACTOR = 0.5
+HTTP_MAX_BACKOFF = 60
+HTTP_RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+HTTP_IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'PATCH', 'DELETE')
+# client errors after which JIRA may still have inserted the worklog
+HTTP_UNCERTAIN_CLIENT_ERRORS = (408, 429)
+# number of configurations which are processed at the same time when several configurations are given
+DEFAULT_PARALLEL_USERS = 4
+DEFAULT_POLL_INTERVAL = 5 * 60
+DEFAULT_MAX_POLL_INTERVAL = 60 * 60
+# the poll interval of the daemon mode is varied randomly by this fraction
+POLL_JITTER = 0.1
+DEFAULT_BACKFILL_CHUNK_DAYS = 7
+DEFAULT_BACKFILL_FETCH_WORKERS = 2
+# the range of a run is fetched in chunks like a backfill, but in no more than this number of chunks
+TOGGL_FETCH_MAX_CHUNKS = 8
+# number of latencies per endpoint the percentiles of the run metrics are computed from
+METRICS_LATENCY_SAMPLES = 10000
+
 
 def read_configuration(config_file_name):
     configuration = {'configFile': None,
@@ -52,22 +125,46 @@ def read_configuration(config_file_name):
                      'jiraPassword': None,
                      'jiraUrl': None,
                      'jiraRePolicy': None,
+                     'jiraIssueCacheFile': None,
+                     'jiraIssueCacheTtl': JIRA_ISSUE_CACHE_TTL,
+                     'jiraRateLimit': None,
+                     'jiraRateLimitBurst': 1,
+                     'duplicateCheck': 'off',
                      'myTogglApiToken': None,
+                     'togglApiUrl': TOGGL_API_URL,
+                     'togglReportsApiUrl': TOGGL_REPORTS_API_URL,
+                     'togglFetchEngine': 'timeEntries',
+                     'togglRateLimit': TOGGL_RATE_LIMIT,
+                     'togglRateLimitBurst': TOGGL_RATE_LIMIT_BURST,
+                     'togglProjectCacheFile': None,
+                     'togglProjectCacheTtl': TOGGL_PROJECT_CACHE_TTL,
                      'myWorkspace': None,
                      'myOrganization': None,
                      'togglStartTime': None,
+                     'togglMaxDays': None,
                      'useLogFile': False,
                      'logFile': None,
                      'logLevel': None,
                      'issue_number_regex_expression': None,
+                     'issueKeyMatcher': None,
                      'groupTimeEntriesBy': None,
-                     'max_days_go_back': None}
+                     'max_days_go_back': None,
+                     'workers': 1,
+                     'stateFile': None,
+                     'incrementalSync': False,
+                     'pollInterval': DEFAULT_POLL_INTERVAL,
+                     'maxPollInterval': DEFAULT_MAX_POLL_INTERVAL,
+                     'backfillChunkDays': DEFAULT_BACKFILL_CHUNK_DAYS,
+                     'backfillFetchWorkers': DEFAULT_BACKFILL_FETCH_WORKERS,
+                     'metricsFile': None,
+                     'prometheusFile': None}
 
     # read configuration and exit if configuration options are missing
 
     config = configparser.ConfigParser()
     config.read(config_file_name)
 
+    configuration['configFile'] = config_file_name
     try:
         configuration['jiraUser'] = config.get("Jira", "user")
         if (config.has_option('Jira', 'password')):
@@ -82,18 +179,59 @@ def read_configuration(config_file_name):
         else:
             configuration['jiraRePolicy'] = 'auto'
 
+        if config.has_option("Jira", "issueCacheFile"):
+            configuration['jiraIssueCacheFile'] = os.path.join(os.path.dirname(os.path.abspath(config_file_name)),
+                                                               config.get("Jira", "issueCacheFile"))
+        configuration['jiraIssueCacheTtl'] = config.getint("Jira", "issueCacheTtl", fallback=JIRA_ISSUE_CACHE_TTL)
+        configuration['jiraRateLimit'] = config.getfloat("Jira", "rateLimit", fallback=None)
+        configuration['jiraRateLimitBurst'] = config.getint("Jira", "rateLimitBurst", fallback=1)
+        configuration['duplicateCheck'] = config.get("Jira", "duplicateCheck", fallback='off')
+        if configuration['duplicateCheck'] not in ('off', 'skip', 'flag'):
+            configuration['duplicateCheck'] = 'off'
+
         configuration['myTogglApiToken'] = config.get("Toggl", "apitoken")
+        configuration['togglApiUrl'] = config.get("Toggl", "apiurl", fallback=TOGGL_API_URL)
+        configuration['togglReportsApiUrl'] = config.get("Toggl", "reportsApiUrl",
+                                                         fallback=get_toggl_reports_api_url(configuration['togglApiUrl']))
+        configuration['togglFetchEngine'] = config.get("Toggl", "fetchEngine", fallback='timeEntries')
+        if configuration['togglFetchEngine'] not in ('timeEntries', 'reports'):
+            configuration['togglFetchEngine'] = 'timeEntries'
+        configuration['togglRateLimit'] = config.getfloat("Toggl", "rateLimit", fallback=TOGGL_RATE_LIMIT)
+        configuration['togglRateLimitBurst'] = config.getint("Toggl", "rateLimitBurst",
+                                                             fallback=TOGGL_RATE_LIMIT_BURST)
+        if config.has_option("Toggl", "projectCacheFile"):
+            configuration['togglProjectCacheFile'] = os.path.join(os.path.dirname(os.path.abspath(config_file_name)),
+                                                                  config.get("Toggl", "projectCacheFile"))
+        configuration['togglProjectCacheTtl'] = config.getint("Toggl", "projectCacheTtl",
+                                                              fallback=TOGGL_PROJECT_CACHE_TTL)
         configuration['myWorkspace'] = config.get("Toggl", "workspace")
         configuration['myOrganization'] = config.get("Toggl", "organization")
         configuration['issue_number_regex_expression'] = config.get("Toggl", "regex")
+        # several patterns can be given, one per line, they are tried in order
+        configuration['issueKeyMatcher'] = IssueKeyMatcher(
+            config.get("Toggl", "projectRegex", fallback=configuration['issue_number_regex_expression']).split('\n'),
+            config.get("Toggl", "descriptionRegex", fallback=configuration['issue_number_regex_expression']).split('\n'),
+            [key.strip() for key in config.get("Jira", "projectKeys", fallback='').split(',') if key.strip()])
         configuration['groupTimeEntriesBy'] = config.get("Toggl", "groupTimeEntriesBy")
 
         if config.has_option("Common", "startdate"):
             configuration['togglStartTime'] = config.get("Common", "startdate")
         else:
-            configuration['togglStartTime'] = (
-                datetime.datetime.now(datetime.UTC) - datetime.timedelta(int(config.get("Common", "maxdays")))).strftime(
-                "%Y-%m-%dT%H:%M:%S+02:00")
+            # the start is derived from maxdays in every run, see get_toggl_start_time
+            configuration['togglMaxDays'] = int(config.get("Common", "maxdays"))
+
+        configuration['workers'] = max(1, config.getint("Common", "workers", fallback=1))
+        if config.has_option("Common", "stateFile"):
+            configuration['stateFile'] = os.path.join(os.path.dirname(os.path.abspath(config_file_name)),
+                                                      config.get("Common", "stateFile"))
+        configuration['incrementalSync'] = config.getboolean("Common", "incrementalSync", fallback=False)
+        configuration['pollInterval'] = config.getint("Common", "pollInterval", fallback=DEFAULT_POLL_INTERVAL)
+        configuration['maxPollInterval'] = max(configuration['pollInterval'], config.getint(
+            "Common", "maxPollInterval", fallback=DEFAULT_MAX_POLL_INTERVAL))
+        configuration['backfillChunkDays'] = config.getint("Common", "backfillChunkDays",
+                                                           fallback=DEFAULT_BACKFILL_CHUNK_DAYS)
+        configuration['backfillFetchWorkers'] = max(1, config.getint("Common", "backfillFetchWorkers",
+                                                                     fallback=DEFAULT_BACKFILL_FETCH_WORKERS))
 
         if config.get("Logging", "useLogFile") == 'true':
             configuration['useLogFile'] = True
@@ -101,6 +239,10 @@ def read_configuration(config_file_name):
             configuration['logLevel'] = config.get("Logging", "level")
         else:
             configuration['useLogFile'] = False
+        for key, option in (('metricsFile', 'metricsFile'), ('prometheusFile', 'prometheusFile')):
+            if config.has_option("Logging", option):
+                configuration[key] = os.path.join(os.path.dirname(os.path.abspath(config_file_name)),
+                                                  config.get("Logging", option))
 
     except configparser.NoOptionError as exception:
         print("Missing option in config.ini. Please refer to config_example.ini for the complete set of options.")
@@ -116,19 +258,95 @@ def read_configuration(config_file_name):
     return configuration
 
 
-def extract_jira_issue_number(issue_name, issue_number_regex_expression):
-    jira_issue_number = re.search(issue_number_regex_expression, issue_name)
-    if jira_issue_number:
-        return jira_issue_number.group(1)
-    else:
+def to_utc(value):
+    """Converts an ISO 8601 date to UTC, as the time entries endpoint of Toggl returns them, the days and weeks of the
+    groups depend on it."""
+    if value is None:
+        return None
+    return parse_datetime(value).astimezone(datetime.UTC).isoformat()
+
+
+def parse_datetime(value):
+    # Toggl and JIRA return ISO 8601 dates, dateutil is only needed for other formats in the configuration
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        import dateutil.parser
+        return dateutil.parser.parse(value)
+
+
+@dataclasses.dataclass(slots=True)
+class TimeEntry:
+    """The fields of a Toggl time entry which are needed to insert its worklog and to tag it."""
+    id: int
+    start_time: datetime.datetime
+    duration: int
+    description: str
+    project_id: int | None = None
+
+
+def get_group_key(project_id, description, start_time, group_time_entries_by):
+    """Returns the key of the worklog group of a time entry: its project, description and day or ISO week."""
+    if group_time_entries_by == 'day':
+        return project_id, description, start_time.date()
+    # the ISO year and week, the week of the first days of January can belong to the previous year
+    return (project_id, description) + tuple(start_time.isocalendar()[:2])
+
+
+class IssueKeyMatcher:
+    """Extracts JIRA issue keys from Toggl project names and time entry descriptions.
+
+    The patterns are compiled once and tried in order, the first group of the first match is the issue key. With an
+    allowlist of JIRA project keys, matches of other projects are ignored. The issue keys are memoized per distinct
+    project name and description.
+    """
+
+    def __init__(self, project_patterns, description_patterns, project_keys=None, cache_size=ISSUE_KEY_CACHE_SIZE):
+        self.project_patterns = [re.compile(pattern.strip()) for pattern in project_patterns if pattern.strip()]
+        self.description_patterns = [re.compile(pattern.strip()) for pattern in description_patterns
+                                     if pattern.strip()]
+        self.project_keys = frozenset(key.upper() for key in project_keys) if project_keys else None
+        self.match_project_name = functools.lru_cache(maxsize=cache_size)(
+            functools.partial(self._match, self.project_patterns))
+        self.match_description = functools.lru_cache(maxsize=cache_size)(
+            functools.partial(self._match, self.description_patterns))
+
+    def _match(self, patterns, value):
+        for pattern in patterns:
+            for match in pattern.finditer(value):
+                issue_key = match.group(1)
+                if issue_key is not None and (
+                        self.project_keys is None or issue_key.split('-', 1)[0].upper() in self.project_keys):
+                    return issue_key
         return None
 
 
+@functools.lru_cache(maxsize=None)
+def compile_issue_key_matcher(issue_number_regex_expression):
+    return IssueKeyMatcher([issue_number_regex_expression], [issue_number_regex_expression])
+
+
+def get_issue_key_matcher(configuration):
+    if configuration.get('issueKeyMatcher') is not None:
+        return configuration['issueKeyMatcher']
+    return compile_issue_key_matcher(configuration['issue_number_regex_expression'])
+
+
+def extract_jira_issue_number(issue_name, issue_number_regex_expression):
+    if isinstance(issue_number_regex_expression, IssueKeyMatcher):
+        return issue_number_regex_expression.match_description(issue_name)
+    return compile_issue_key_matcher(issue_number_regex_expression).match_description(issue_name)
+
+
 def extract_jira_issue_numbers(project_list_response, issue_number_regex_expression):
     global _logger
+    if isinstance(issue_number_regex_expression, IssueKeyMatcher):
+        issue_key_matcher = issue_number_regex_expression
+    else:
+        issue_key_matcher = compile_issue_key_matcher(issue_number_regex_expression)
     project_list = {}
     for project in project_list_response:
-        issue_number = extract_jira_issue_number(project['name'], issue_number_regex_expression)
+        issue_number = issue_key_matcher.match_project_name(project['name'])
         if issue_number is not None:
             project_list[project['id']] = issue_number
         else:
@@ -137,14 +355,6 @@ def extract_jira_issue_numbers(project_list_response, issue_number_regex_express
     return project_list
 
 
-def is_json(myjson):
-    try:
-        json.loads(json.dumps(myjson))
-    except ValueError:
-        return False
-    return True
-
-
 def insert_jira_worklog(issue, start_time, duration, work_description, jira_re_policy, jira):
     if duration != '0m':
         return jira.add_worklog(issue, adjustEstimate=jira_re_policy, timeSpent=duration,
@@ -154,141 +364,1401 @@ def insert_jira_worklog(issue, start_time, duration, work_description, jira_re_p
         return None
 
 
-def tag_timeentry_as_processed(time_entry_id, time_entry_description, toggl):
+class TokenBucket:
+    """Client-side throttling: allows rate requests per second on average and bursts of up to capacity requests."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class HttpStatistics:
+    """Counts the requests, retries and the latency per endpoint. Ids and issue keys in the paths are replaced by
+    placeholders, so that e.g. all worklog requests are counted for the same endpoint."""
+
+    def __init__(self, keep_latencies=False):
+        self.endpoints = {}
+        self.first_request_started = None
+        # the latencies are only kept for the percentiles of the run metrics
+        self.keep_latencies = keep_latencies
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def endpoint(method, url):
+        path = urllib.parse.urlsplit(url).path
+        # the API version, e.g. /rest/api/2, /api/v9 or /reports/api/v3, is kept, only the ids (or lists of ids) and
+        # issue keys after it are replaced
+        prefix = re.match(r'.*?/api/v?\d+(?=/|$)', path)
+        prefix_length = prefix.end() if prefix is not None else 0
+        return "{0} {1}{2}".format(method, path[:prefix_length], re.sub(
+            r'(?<=/)(\d+(?:,\d+)*|[A-Z][A-Z0-9_]*-\d+)(?=/|$)', '{id}', path[prefix_length:]))
+
+    def record(self, method, url, status_code, latency, retried=False):
+        with self._lock:
+            if self.first_request_started is None:
+                self.first_request_started = time.monotonic() - latency
+            statistics = self.endpoints.setdefault(self.endpoint(method, url),
+                                                   {"requests": 0, "retries": 0, "errors": 0, "latency": 0.0})
+            statistics["requests"] += 1
+            statistics["latency"] += latency
+            if self.keep_latencies:
+                statistics.setdefault("latencies", collections.deque(maxlen=METRICS_LATENCY_SAMPLES)).append(latency)
+            if retried:
+                statistics["retries"] += 1
+            if status_code is None or status_code >= 400:
+                statistics["errors"] += 1
+
+    def log_startup_timing(self):
+        global _logger
+        _logger.info("The imports took {0:.0f} ms, the first request has been sent after {1} and the run took "
+                     "{2:.0f} ms.".format(_IMPORT_TIME * 1000, "{0:.0f} ms".format(
+                         (self.first_request_started - _IMPORT_STARTED) * 1000)
+                         if self.first_request_started is not None else "(no request)",
+                         (time.monotonic() - _IMPORT_STARTED) * 1000))
+
+    def log_summary(self):
+        global _logger
+        for endpoint, statistics in sorted(self.endpoints.items()):
+            _logger.info("{0}: {1} requests, {2} retries, {3} errors, {4:.3f}s average latency".format(
+                endpoint, statistics["requests"], statistics["retries"], statistics["errors"],
+                statistics["latency"] / statistics["requests"]))
+
+
+def get_percentile(values, percentile):
+    """Returns the nearest-rank percentile of the values."""
+    values = sorted(values)
+    if len(values) == 0:
+        return None
+    return values[max(0, math.ceil(percentile / 100 * len(values)) - 1)]
+
+
+class RunMetrics:
+    """The wall time of the phases of the runs, the requests, retries, errors and latency percentiles per endpoint
+    and the processed time entries, groups and worklogs.
+
+    They are written as JSON summary and as textfile for the Prometheus node exporter. In daemon mode the values are
+    accumulated over all cycles. Without metrics, SharedClients.phase returns a reusable null context.
+
+    Phases can be nested, e.g. the stages of the pipeline pull the previous stage, the time of a nested phase is only
+    counted for the nested phase.
+    """
+
+    def __init__(self, http_statistics, json_file=None, prometheus_file=None):
+        self.http_statistics = http_statistics
+        self.json_file = json_file
+        self.prometheus_file = prometheus_file
+        self.started_at = time.time()
+        self.phases = {}
+        self.totals = {"runs": 0, "timeEntries": 0, "groups": 0, "worklogs": 0, "errors": 0,
+                       "failedConfigurations": 0}
+        self._lock = threading.Lock()
+        self._nested = threading.local()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        outer_nested_seconds = getattr(self._nested, "seconds", 0.0)
+        self._nested.seconds = 0.0
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            nested_seconds = self._nested.seconds
+            self._nested.seconds = outer_nested_seconds + elapsed
+            with self._lock:
+                phase = self.phases.setdefault(name, {"seconds": 0.0, "count": 0})
+                phase["seconds"] += elapsed - nested_seconds
+                phase["count"] += 1
+
+    def timed(self, name, iterable):
+        """Yields the items of the iterable and measures the time spent producing them as the given phase."""
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def record_summaries(self, summaries):
+        with self._lock:
+            self.totals["runs"] += 1
+            for summary in summaries.values():
+                if "error" in summary:
+                    self.totals["failedConfigurations"] += 1
+                    continue
+                for key in ("timeEntries", "groups", "worklogs", "errors"):
+                    self.totals[key] += summary.get(key, 0)
+
+    def get_summary(self):
+        with self._lock:
+            phases = {name: dict(phase) for name, phase in sorted(self.phases.items())}
+            totals = dict(self.totals)
+        endpoints = {}
+        for endpoint, statistics in sorted(list(self.http_statistics.endpoints.items())):
+            latencies = list(statistics.get("latencies", ()))
+            endpoints[endpoint] = {
+                "requests": statistics["requests"],
+                "retries": statistics["retries"],
+                "errors": statistics["errors"],
+                "latencySeconds": {"total": statistics["latency"], "p50": get_percentile(latencies, 50),
+                                   "p95": get_percentile(latencies, 95)}
+            }
+        return {
+            "startedAt": datetime.datetime.fromtimestamp(self.started_at, datetime.UTC).isoformat(),
+            "durationSeconds": time.time() - self.started_at,
+            "phases": phases,
+            "endpoints": endpoints,
+            "totals": totals
+        }
+
+    def get_prometheus_text(self, summary):
+        lines = []
+
+        def add(name, metric_type, description, samples):
+            """Adds a metric, the samples are tuples of the suffix of the name, the labels and the value."""
+            lines.append("# HELP toggl_jira_{0} {1}".format(name, description))
+            lines.append("# TYPE toggl_jira_{0} {1}".format(name, metric_type))
+            for suffix, labels, value in samples:
+                if value is None:
+                    continue
+                label_text = ",".join('{0}="{1}"'.format(key, str(label).replace('\\', '\\\\').replace('"', '\\"'))
+                                      for key, label in labels)
+                lines.append("toggl_jira_{0}{1}{2} {3!r}".format(name, suffix, "{" + label_text + "}" if label_text
+                                                                 else "", float(value)))
+
+        add("duration_seconds", "gauge", "Wall time since the start of the process.",
+            [("", (), summary["durationSeconds"])])
+        add("phase_seconds_total", "counter", "Wall time per phase, summed over parallel users and workers.",
+            [("", (("phase", name),), phase["seconds"]) for name, phase in summary["phases"].items()])
+        add("phase_runs_total", "counter", "Number of times a phase has been run.",
+            [("", (("phase", name),), phase["count"]) for name, phase in summary["phases"].items()])
+        for key, description in (("requests", "HTTP requests"), ("retries", "Retried HTTP requests"),
+                                 ("errors", "Failed HTTP requests")):
+            add("http_{0}_total".format(key), "counter", "{0} per endpoint.".format(description),
+                [("", (("endpoint", endpoint),), statistics[key])
+                 for endpoint, statistics in summary["endpoints"].items()])
+        add("http_latency_seconds", "summary", "Latency of the HTTP requests per endpoint.", [
+            sample for endpoint, statistics in summary["endpoints"].items() for sample in (
+                ("", (("endpoint", endpoint), ("quantile", "0.5")), statistics["latencySeconds"]["p50"]),
+                ("", (("endpoint", endpoint), ("quantile", "0.95")), statistics["latencySeconds"]["p95"]),
+                ("_sum", (("endpoint", endpoint),), statistics["latencySeconds"]["total"]),
+                ("_count", (("endpoint", endpoint),), statistics["requests"]))])
+        for key, name in (("timeEntries", "time_entries"), ("groups", "groups"), ("worklogs", "worklogs"),
+                          ("errors", "errors"), ("failedConfigurations", "failed_configurations"), ("runs", "runs")):
+            add("{0}_total".format(name), "counter", "Number of {0}.".format(name.replace('_', ' ')),
+                [("", (), summary["totals"][key])])
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _write_file(file_name, content):
+        # the file is replaced atomically, so that the node exporter never reads a partial file
+        try:
+            with open(file_name + '.tmp', 'w', encoding='utf-8') as output:
+                output.write(content)
+            os.replace(file_name + '.tmp', file_name)
+        except OSError as exception:
+            _logger.warning("The metrics file {0} could not be written: {1}".format(file_name, str(exception)))
+
+    def write(self):
+        summary = self.get_summary()
+        if self.json_file is not None:
+            self._write_file(self.json_file, json.dumps(summary, indent=2))
+        if self.prometheus_file is not None:
+            self._write_file(self.prometheus_file, self.get_prometheus_text(summary))
+        return summary
+
+
+class ThrottledHTTPAdapter(requests.adapters.HTTPAdapter):
+    """Transport adapter for the Toggl and JIRA sessions.
+
+    It keeps pooled keep-alive connections, throttles the requests with a token bucket and retries throttled (429)
+    requests and, for idempotent methods, server errors with an exponential backoff which honours Retry-After.
+    """
+
+    def __init__(self, rate_limit=None, burst=1, max_retries=HTTP_MAX_RETRIES, backoff_factor=HTTP_BACKOFF_FACTOR,
+                 max_backoff=HTTP_MAX_BACKOFF, statistics=None, pool_maxsize=requests.adapters.DEFAULT_POOLSIZE):
+        super().__init__(pool_maxsize=pool_maxsize,
+                         # only connection errors are retried by urllib3, TLS and proxy errors ("other") fail at once
+                         max_retries=urllib3.util.Retry(total=None, connect=max_retries, read=0, redirect=5,
+                                                        status=0, other=0, backoff_factor=backoff_factor))
+        self.token_bucket = TokenBucket(rate_limit, burst) if rate_limit else None
+        self.retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.statistics = statistics if statistics is not None else HttpStatistics()
+
+    def send(self, request, **kwargs):
+        attempt = 0
+        while True:
+            if self.token_bucket is not None:
+                self.token_bucket.acquire()
+            started = time.monotonic()
+            try:
+                response = super().send(request, **kwargs)
+            except requests.RequestException:
+                self.statistics.record(request.method, request.url, None, time.monotonic() - started, attempt > 0)
+                raise
+            self.statistics.record(request.method, request.url, response.status_code, time.monotonic() - started,
+                                   attempt > 0)
+            if attempt >= self.retries or not self._is_retryable(request, response):
+                return response
+            delay = self._get_delay(response, attempt)
+            _logger.warning("{0} {1} returned {2}, retrying in {3:.1f}s".format(
+                request.method, request.url, response.status_code, delay))
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def _is_retryable(request, response):
+        if response.status_code == 429:
+            return True
+        # a failed POST may have been processed nevertheless, so it must not be sent twice
+        return response.status_code in HTTP_RETRY_STATUS_CODES and request.method in HTTP_IDEMPOTENT_METHODS
+
+    def _get_delay(self, response, attempt):
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is not None:
+            try:
+                return min(self.max_backoff, max(0.0, float(retry_after)))
+            except ValueError:
+                try:
+                    retry_at = email.utils.parsedate_to_datetime(retry_after)
+                    return min(self.max_backoff, max(0.0, retry_at.timestamp() - time.time()))
+                except (TypeError, ValueError):
+                    pass
+        return min(self.max_backoff, self.backoff_factor * (2 ** attempt) * (1 + random.random() / 2))
+
+
+def mount_http_adapter(session, adapter):
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_toggl_reports_api_url(api_url):
+    """The Reports API (v3) is served by the same host as the Toggl API (v9)."""
+    return re.sub(r'/api/v9/?$', '/reports/api/v3', api_url.rstrip('/'))
+
+
+class TogglClient:
+    """Minimal client for the Toggl API (v9) which sends all requests through the given transport adapter."""
+
+    def __init__(self, api_url, api_token, workspace_id, adapter=None, timeout=HTTP_TIMEOUT, reports_api_url=None):
+        self.api_url = api_url.rstrip('/')
+        self.reports_api_url = (reports_api_url or get_toggl_reports_api_url(api_url)).rstrip('/')
+        self.workspace_id = workspace_id
+        self.timeout = timeout
+        self.session = mount_http_adapter(requests.Session(), adapter if adapter is not None else ThrottledHTTPAdapter())
+        self.session.auth = (api_token, 'api_token')
+
+    def request(self, method, uri, params=None, data=None):
+        response = self.session.request(method, self.api_url + uri, params=params, json=data, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def get(self, uri, params=None):
+        return self.request('GET', uri, params=params)
+
+    def put(self, uri, data):
+        return self.request('PUT', uri, data=data)
+
+    def patch(self, uri, data):
+        return self.request('PATCH', uri, data=data)
+
+    def get_time_entries(self, start_date, end_date):
+        return self.get("/me/time_entries", params={"start_date": start_date, "end_date": end_date})
+
+    def get_report_time_entries(self, start_date, end_date, page_size=TOGGL_REPORTS_PAGE_SIZE):
+        """Returns the time entries of the current user started between start_date and end_date like
+        get_time_entries, but fetches them from the detailed report of the Reports API.
+
+        The report groups similar time entries of a day into one row, so it has to transfer the project, the
+        description and the tags only once per row. The ids of the time entries are kept for the tagging, the tag ids
+        are mapped to their names. The running time entry is not part of the report and is fetched separately.
+        """
+        start_time, end_time = (date if date.tzinfo is not None else date.replace(tzinfo=datetime.UTC)
+                                for date in (parse_datetime(start_date), parse_datetime(end_date)))
+        tag_names = {tag['id']: tag['name']
+                     for tag in self.get("/workspaces/{0}/tags".format(self.workspace_id)) or []}
+        user_id = self.get("/me")['id']
+        time_entries = []
+        window_start = start_time
+        while window_start < end_time:
+            window_end = min(end_time, window_start + datetime.timedelta(days=TOGGL_REPORTS_MAX_DAYS - 2))
+            time_entries.extend(
+                time_entry for time_entry in self._search_time_entries(window_start, window_end, user_id, tag_names,
+                                                                       page_size)
+                if window_start <= parse_datetime(time_entry['start']) < window_end)
+            window_start = window_end
+
+        running_time_entry = self.get("/me/time_entries/current")
+        if running_time_entry and start_time <= parse_datetime(running_time_entry['start']) < end_time:
+            time_entries.append(running_time_entry)
+        return time_entries
+
+    def _search_time_entries(self, start_time, end_time, user_id, tag_names, page_size):
+        # the dates of the report are days in the time zone of the user, so the range is extended by a day
+        body = {
+            "start_date": (start_time - datetime.timedelta(days=1)).date().isoformat(),
+            "end_date": (end_time + datetime.timedelta(days=1)).date().isoformat(),
+            "user_ids": [user_id],
+            "grouped": True,
+            "hide_amounts": True,
+            "order_by": "date",
+            "order_dir": "ASC",
+            "page_size": page_size
+        }
+        uri = "{0}/workspace/{1}/search/time_entries".format(self.reports_api_url, self.workspace_id)
+        while True:
+            response = self.session.post(uri, json=body, timeout=self.timeout)
+            response.raise_for_status()
+            for row in response.json() or []:
+                tags = [tag_names.get(tag_id, str(tag_id)) for tag_id in row.get('tag_ids') or []]
+                for time_entry in row.get('time_entries') or []:
+                    yield {
+                        "id": time_entry['id'],
+                        "workspace_id": self.workspace_id,
+                        "project_id": row.get('project_id'),
+                        "description": row.get('description'),
+                        "start": to_utc(time_entry['start']),
+                        "stop": to_utc(time_entry.get('stop')),
+                        "duration": time_entry['seconds'],
+                        "tags": tags
+                    }
+            if not response.headers.get('X-Next-ID'):
+                break
+            body = dict(body, first_id=int(response.headers['X-Next-ID']),
+                        first_row_number=int(response.headers['X-Next-Row-Number']))
+
+
+class TogglTagger:
+    """Collects time entry ids per tag and tags them in Toggl using the bulk time entry endpoint.
+
+    Toggl accepts up to 100 ids per bulk request. The tags are added to the existing tags of the
+    time entries instead of replacing them, only the opposite tag (jiraerror for jiraprocessed and vice versa) is
+    removed in the same request.
+
+    As soon as chunk_size ids of a tag have been collected, they are sent, so that an interrupted run loses at most
+    one chunk of taggings. With send_full_chunks=False nothing is sent before flush, e.g. when planning.
+    """
+
+    def __init__(self, toggl, chunk_size=TOGGL_BULK_EDIT_CHUNK_SIZE, send_full_chunks=True):
+        self.toggl = toggl
+        self.chunk_size = chunk_size
+        self.send_full_chunks = send_full_chunks
+        self.pending = {}
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def add(self, tag, time_entry_id, time_entry_description):
+        with self._lock:
+            time_entries = self.pending.setdefault(tag, {})
+            time_entries[time_entry_id] = time_entry_description
+            if not self.send_full_chunks or len(time_entries) < self.chunk_size:
+                return
+            del self.pending[tag]
+        self._send(tag, time_entries)
+
+    def add_processed(self, time_entry_id, time_entry_description):
+        self.add(TOGGL_PROCESSED_TAG, time_entry_id, time_entry_description)
+
+    def add_error(self, time_entry_id, time_entry_description):
+        self.add(TOGGL_ERROR_TAG, time_entry_id, time_entry_description)
+
+    def flush(self):
+        """Sends all pending taggings and returns {tag: (succeeded ids, {failed id: message})} for the taggings which
+        have been sent since the last flush."""
+        with self._lock:
+            pending, self.pending = self.pending, {}
+        for tag, time_entries in pending.items():
+            self._send(tag, time_entries)
+        with self._lock:
+            results, self._results = self._results, {}
+        return results
+
+    def _send(self, tag, time_entries):
+        succeeded, failed = self._tag(tag, list(time_entries))
+        for time_entry_id in succeeded:
+            _logger.info("The time entry with the id \"{0}\" (\"{1}\") has been tagged as \"{2}\" in "
+                         "Toggl".format(str(time_entry_id), time_entries.get(time_entry_id), tag))
+        for time_entry_id, message in failed.items():
+            _logger.error("The time entry with the id \"{0}\" (\"{1}\") could not be tagged as \"{2}\" in "
+                          "Toggl: {3}".format(str(time_entry_id), time_entries.get(time_entry_id), tag, message))
+        with self._lock:
+            results = self._results.setdefault(tag, ([], {}))
+            results[0].extend(succeeded)
+            results[1].update(failed)
+
+    def _tag(self, tag, time_entry_ids):
+        succeeded = []
+        failed = {}
+        for offset in range(0, len(time_entry_ids), self.chunk_size):
+            chunk = time_entry_ids[offset:offset + self.chunk_size]
+            uri = "/workspaces/{0}/time_entries/{1}".format(
+                self.toggl.workspace_id, ",".join(str(time_entry_id) for time_entry_id in chunk))
+            operations = [{"op": "add", "path": "/tags", "value": [tag]}]
+            if tag in TOGGL_OPPOSITE_TAGS:
+                operations.append({"op": "remove", "path": "/tags", "value": [TOGGL_OPPOSITE_TAGS[tag]]})
+            try:
+                result = self.toggl.patch(uri, operations)
+            except (requests.RequestException, ValueError) as exception:
+                failed.update((time_entry_id, str(exception)) for time_entry_id in chunk)
+                continue
+            succeeded.extend(result.get('success') or [])
+            for failure in result.get('failure') or []:
+                failed[failure.get('id')] = failure.get('message')
+        return succeeded, failed
+
+
+class JiraIssueResolver:
+    """Validates JIRA issue numbers with chunked JQL searches and caches the results during a run.
+
+    Optionally, successfully resolved issue numbers are kept in a JSON file for cache_ttl seconds, so that
+    subsequent runs do not have to look them up again.
+    """
+
+    def __init__(self, jira, chunk_size=JIRA_JQL_CHUNK_SIZE, cache_file=None, cache_ttl=JIRA_ISSUE_CACHE_TTL,
+                 validated_issues=None):
+        self.jira = jira
+        self.chunk_size = chunk_size
+        self.cache_file = cache_file
+        self.cache_ttl = cache_ttl
+        self.issues = {}
+        self._lock = threading.Lock()
+        self._persistent_issues = self._read_cache_file()
+        # issues validated by other users of the same JIRA, only found issues are shared since the permissions differ
+        self.validated_issues = validated_issues if validated_issues is not None else {}
+
+    def _read_cache_file(self):
+        if self.cache_file is None:
+            return {}
+        try:
+            with open(self.cache_file, encoding='utf-8') as cache_file:
+                cached_issues = json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+        oldest = time.time() - self.cache_ttl
+        return {issue_number: cached_issue for issue_number, cached_issue in cached_issues.items()
+                if cached_issue.get('resolved_at', 0) >= oldest}
+
+    def _write_cache_file(self):
+        if self.cache_file is None:
+            return
+        try:
+            with open(self.cache_file, 'w', encoding='utf-8') as cache_file:
+                json.dump(self._persistent_issues, cache_file)
+        except OSError as exception:
+            _logger.warning("The JIRA issue cache file {0} could not be written: {1}".format(self.cache_file,
+                                                                                            str(exception)))
+
+    def resolve(self, issue_numbers):
+        """Resolves all issue numbers which are not known yet."""
+        global _logger
+        from jira import JIRAError
+        unknown = sorted(issue_number for issue_number in set(issue_numbers)
+                         if issue_number is not None and issue_number not in self.issues)
+        resolved_at = time.time()
+        found = {}
+        for issue_number in unknown:
+            if issue_number in self.validated_issues:
+                found[issue_number] = self.validated_issues[issue_number]
+            elif issue_number in self._persistent_issues:
+                found[issue_number] = self._persistent_issues[issue_number]['key']
+        unknown = [issue_number for issue_number in unknown if issue_number not in found]
+
+        for offset in range(0, len(unknown), self.chunk_size):
+            chunk = unknown[offset:offset + self.chunk_size]
+            jql = 'key in ({0})'.format(', '.join('"{0}"'.format(issue_number) for issue_number in chunk))
+            try:
+                # without validation, JIRA returns the existing issues instead of failing for unknown keys
+                issues = self.jira.search_issues(jql, maxResults=len(chunk), validate_query=False,
+                                                 fields='summary')
+            except JIRAError as exception:
+                _logger.warning("The JIRA issues could not be searched: {0}".format(str(exception)))
+                issues = []
+            for issue in issues:
+                if issue.key in chunk:
+                    found[issue.key] = issue.key
+
+        # issues which have been moved to another project are not found by their old key
+        for issue_number in unknown:
+            if issue_number not in found:
+                try:
+                    found[issue_number] = self.jira.issue(issue_number, fields='summary').key
+                except JIRAError:
+                    _logger.error("The issue {0} could not be found in JIRA.".format(str(issue_number)))
+
+        with self._lock:
+            for issue_number in unknown + list(found):
+                self.issues[issue_number] = found.get(issue_number)
+            self.validated_issues.update(found)
+            if any(issue_number not in self._persistent_issues for issue_number in found):
+                for issue_number, key in found.items():
+                    self._persistent_issues.setdefault(issue_number, {'key': key, 'resolved_at': resolved_at})
+                self._write_cache_file()
+
+    def forget_missing_issues(self):
+        """Missing issues are looked up again, e.g. in the next cycle of the daemon mode."""
+        with self._lock:
+            self.issues = {issue_number: key for issue_number, key in self.issues.items() if key is not None}
+
+    def get(self, issue_number):
+        """Returns the key of the JIRA issue or None, if there is no accessible issue with this number."""
+        if issue_number not in self.issues:
+            self.resolve([issue_number])
+        return self.issues.get(issue_number)
+
+
+class StateStore:
+    """Persistent state of the runs in a SQLite database: the ids of the processed time entries, the high-water
+    mark up to which time entries have been fetched from Toggl and the journal of the worklogs inserted in JIRA.
+
+    A worklog is recorded as "pending" before it is inserted and as "created" together with its id afterwards. It
+    is removed from the journal as soon as all of its time entries have been tagged in Toggl.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(
+            "CREATE TABLE IF NOT EXISTS processed_time_entries (id INTEGER PRIMARY KEY, processed_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value TEXT);"
+            "CREATE TABLE IF NOT EXISTS worklog_journal (id INTEGER PRIMARY KEY AUTOINCREMENT, issue TEXT NOT NULL, "
+            "started TEXT NOT NULL, time_spent TEXT NOT NULL, comment TEXT, time_entry_ids TEXT NOT NULL, "
+            "status TEXT NOT NULL, worklog_id TEXT, recorded_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS backfill_chunks (start TEXT NOT NULL, end TEXT NOT NULL, "
+            "processed_at REAL NOT NULL, PRIMARY KEY (start, end));")
+
+    def close(self):
+        self._connection.close()
+
+    def reset(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM processed_time_entries")
+            self._connection.execute("DELETE FROM state")
+
+    def get_value(self, name):
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_value(self, name, value):
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO state (name, value) VALUES (?, ?)", (name, value))
+
+    def get_watermark(self):
+        watermark = self.get_value('watermark')
+        return int(watermark) if watermark is not None else None
+
+    def set_watermark(self, watermark):
+        self.set_value('watermark', str(int(watermark)))
+
+    def is_processed(self, time_entry_id):
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM processed_time_entries WHERE id = ?",
+                                            (time_entry_id,)).fetchone() is not None
+
+    def mark_processed(self, time_entry_ids):
+        processed_at = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO processed_time_entries (id, processed_at) "
+                                         "VALUES (?, ?)",
+                                         ((time_entry_id, processed_at) for time_entry_id in time_entry_ids))
+
+    def is_backfill_chunk_done(self, start, end):
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM backfill_chunks WHERE start = ? AND end = ?",
+                                            (start.isoformat(), end.isoformat())).fetchone() is not None
+
+    def mark_backfill_chunk_done(self, start, end):
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO backfill_chunks (start, end, processed_at) "
+                                     "VALUES (?, ?, ?)", (start.isoformat(), end.isoformat(), time.time()))
+
+    def begin_worklog(self, issue, started, time_spent, comment, time_entry_ids):
+        with self._lock, self._connection:
+            return self._connection.execute(
+                "INSERT INTO worklog_journal (issue, started, time_spent, comment, time_entry_ids, status, "
+                "recorded_at) VALUES (?, ?, ?, ?, ?, 'pending', ?)",
+                (issue, started.isoformat(), time_spent, comment, json.dumps(list(time_entry_ids)),
+                 time.time())).lastrowid
+
+    def complete_worklog(self, journal_id, worklog_id):
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE worklog_journal SET status = 'created', worklog_id = ? WHERE id = ?",
+                                     (str(worklog_id), journal_id))
+
+    def abort_worklog(self, journal_id):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM worklog_journal WHERE id = ?", (journal_id,))
+
+    def get_journaled_worklogs(self):
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, issue, started, time_spent, comment, time_entry_ids, status, worklog_id "
+                "FROM worklog_journal ORDER BY id").fetchall()
+        return [{
+            "journal_id": row[0],
+            "issue": row[1],
+            "started": datetime.datetime.fromisoformat(row[2]),
+            "time_spent": row[3],
+            "comment": row[4],
+            "time_entry_ids": json.loads(row[5]),
+            "status": row[6],
+            "worklog_id": row[7]
+        } for row in rows]
+
+    def get_journaled_time_entry_ids(self):
+        return {time_entry_id for worklog in self.get_journaled_worklogs()
+                for time_entry_id in worklog["time_entry_ids"]}
+
+    def finish_worklogs(self):
+        """Removes the created worklogs whose time entries have all been tagged."""
+        for worklog in self.get_journaled_worklogs():
+            if worklog["status"] == 'created' and all(self.is_processed(time_entry_id)
+                                                      for time_entry_id in worklog["time_entry_ids"]):
+                self.abort_worklog(worklog["journal_id"])
+
+
+def reconcile_worklog_journal(state_store, jira, tagger):
+    """Completes the worklogs of an interrupted run before new worklogs are inserted.
+
+    The time entries of created worklogs are tagged again. For pending worklogs it is unknown whether JIRA has
+    inserted them, so the worklogs of the issue are searched for a matching one. Pending worklogs which cannot be
+    checked stay in the journal and their time entries are skipped in this run.
+    """
     global _logger
-    # JSON snipppet for tagging time tracking entries which have been added successfully to JIRA
-    payload_for_toggl_tag = {
-        "tags": ["jiraprocessed"]
-    }
-    tagging_response = toggl.put(
-        uri="/time_entries/{0}".format(str(time_entry_id)),
-        data=payload_for_toggl_tag)
-    if is_json(tagging_response):
-        _logger.info(
-            "The time entry with the id \"{0}\" (\"{1}\") has been tagged successfully in Toggl".format(
-                str(time_entry_id), time_entry_description))
-        return True
-    return False
+    from jira import JIRAError
+    for worklog in state_store.get_journaled_worklogs():
+        if worklog["status"] == 'pending':
+            try:
+                existing_worklog = find_jira_worklog(jira, worklog["issue"], worklog["started"],
+                                                     worklog["time_spent"], worklog["comment"])
+            except (JIRAError, requests.RequestException) as exception:
+                _logger.warning("The pending worklog for the issue {0} could not be checked: {1}".format(
+                    worklog["issue"], str(exception)))
+                continue
+            if existing_worklog is None:
+                _logger.info("The pending worklog for the issue {0} has not been inserted in JIRA and will be "
+                             "inserted again.".format(worklog["issue"]))
+                state_store.abort_worklog(worklog["journal_id"])
+                continue
+            state_store.complete_worklog(worklog["journal_id"], existing_worklog.id)
+        _logger.info("The worklog for the issue {0} has already been inserted in JIRA, its time entries are "
+                     "tagged again.".format(worklog["issue"]))
+        for time_entry_id in worklog["time_entry_ids"]:
+            tagger.add_processed(time_entry_id, worklog["comment"])
+
+
+def find_jira_worklog(jira, issue, started, time_spent, comment):
+    time_spent_seconds = int(time_spent.rstrip('m')) * 60
+    # JIRA may trim the comment, so the comments are compared like in ExistingWorklogIndex
+    for worklog in jira.worklogs(issue):
+        if (parse_datetime(worklog.started) == started
+                and int(worklog.timeSpentSeconds) == time_spent_seconds
+                and (getattr(worklog, 'comment', None) or '').strip() == (comment or '').strip()):
+            return worklog
+    return None
+
+
+def get_time_entries(toggl, configuration, start_date, end_date):
+    """Fetches the time entries of a range with the configured fetch engine."""
+    if configuration.get('togglFetchEngine') == 'reports':
+        return toggl.get_report_time_entries(start_date, end_date)
+    return toggl.get_time_entries(start_date=start_date, end_date=end_date)
 
 
-def tag_timeentry_as_error(time_entry_id, time_entry_description, toggl):
+def get_toggl_start_time(configuration, now):
+    """Returns the configured startdate or the start of the last maxdays days before now (a timestamp)."""
+    if configuration['togglStartTime'] is not None:
+        return configuration['togglStartTime']
+    return (datetime.datetime.fromtimestamp(now, datetime.UTC) - datetime.timedelta(
+        configuration['togglMaxDays'])).strftime("%Y-%m-%dT%H:%M:%S+02:00")
+
+
+def get_fetch_chunks(configuration, start_time, end_time):
+    """Splits the range of a run into chunks like a backfill, newest chunk first. The chunks are made longer than
+    backfillChunkDays if the range would need more than TOGGL_FETCH_MAX_CHUNKS chunks."""
+    # the first chunk starts at the preceding day or week boundary
+    chunk_days = max(configuration['backfillChunkDays'],
+                     math.ceil(((end_time - start_time).total_seconds() / 86400 + 7) / TOGGL_FETCH_MAX_CHUNKS))
+    return list(reversed(get_backfill_chunks(start_time, end_time, configuration['groupTimeEntriesBy'], chunk_days)))
+
+
+def fetch_time_entry_chunks(toggl, configuration, chunks, shared_clients, stop_event=None):
+    """Fetches the time entries of the chunks and yields each chunk with its time entries, newest first.
+
+    The chunks are fetched concurrently, but at most backfillFetchWorkers chunks ahead of the chunk which is yielded,
+    so the memory is bounded by the size of a few chunks. After a stop request no further chunk is yielded.
+    """
+    def fetch(chunk):
+        with shared_clients.phase("fetchTimeEntries"):
+            time_entries = get_time_entries(toggl, configuration, chunk[0].isoformat(), chunk[1].isoformat())
+        # newest first, as the time entries endpoint of Toggl returns them, so that the days or weeks are closed in
+        # turn
+        time_entries.sort(key=lambda time_entry: time_entry.get('start') or '', reverse=True)
+        return time_entries
+
+    with ThreadPoolExecutor(max_workers=configuration['backfillFetchWorkers']) as executor:
+        fetches = collections.deque()
+        remaining_chunks = iter(chunks)
+        try:
+            for chunk in itertools.islice(remaining_chunks, configuration['backfillFetchWorkers']):
+                fetches.append((chunk, executor.submit(fetch, chunk)))
+            while len(fetches) > 0 and not (stop_event is not None and stop_event.is_set()):
+                chunk, fetched = fetches.popleft()
+                time_entries = fetched.result()
+                for next_chunk in itertools.islice(remaining_chunks, 1):
+                    fetches.append((next_chunk, executor.submit(fetch, next_chunk)))
+                yield chunk, time_entries
+                del time_entries
+        finally:
+            for chunk, fetched in fetches:
+                fetched.cancel()
+
+
+def fetch_time_entries(toggl, configuration, toggl_start_time, toggl_end_time, state_store=None, shared_clients=None,
+                       stop_event=None):
+    """Yields the time entries of a run in chunks: the time entries which have been modified since the watermark of
+    the state store, or else the time entries of the range, see get_fetch_chunks."""
     global _logger
-    # JSON snippet for marking a time tracking entry using a non-existing or archived project
-    payload_for_toggl_error_tag = {
-        "tags": ["jiraerror"]
-    }
-    tagging_response = toggl.put(
-        uri="/time_entries/{0}".format(str(time_entry_id)),
-        data=payload_for_toggl_error_tag)
-    if is_json(tagging_response):
-        _logger.info("The time entry with the id \"{0}\" (\"{1}\") has been tagged as"
-                     "error in Toggl".format(str(time_entry_id), time_entry_description))
-        return True
-    return False
+    if shared_clients is None:
+        shared_clients = SharedClients()
+    watermark = state_store.get_watermark() if state_store is not None else None
+    if watermark is not None and watermark < time.time() - TOGGL_SINCE_MAX_AGE:
+        _logger.info("The last synchronisation is too long ago for an incremental synchronisation.")
+        watermark = None
+    if watermark is None:
+        chunks = get_fetch_chunks(configuration, parse_datetime(toggl_start_time), parse_datetime(toggl_end_time))
+        for chunk, time_entries in fetch_time_entry_chunks(toggl, configuration, chunks, shared_clients, stop_event):
+            yield time_entries
+            del time_entries
+        return
 
+    # only the time entries which have been modified since the last run, including deleted ones
+    start_time = parse_datetime(toggl_start_time)
+    with shared_clients.phase("fetchTimeEntries"):
+        time_entries = [time_entry for time_entry in toggl.get("/me/time_entries", params={"since": watermark})
+                        if time_entry.get('server_deleted_at') is None and time_entry.get('start') is not None
+                        and parse_datetime(time_entry['start']) >= start_time
+                        and not state_store.is_processed(time_entry.get('id'))]
+    time_entries.sort(key=lambda time_entry: time_entry['start'], reverse=True)
+    yield time_entries
 
-def tag_grouped_timeentry_as_error(time_entries, toggl):
-    for time_entry in time_entries:
-        tag_timeentry_as_error(time_entry['id'], time_entry['description'], toggl)
 
+class ExistingWorklogIndex:
+    """The worklogs of the current user in JIRA, indexed by issue, start, time spent and comment.
 
-def main():
+    The worklogs are fetched in bulk: one JQL search for the issues with worklogs of the current user in the date
+    range, the ids of the worklogs updated since the start of the range and the worklogs themselves in chunks of
+    1000. Worklogs which have been inserted before the start of the range are not found.
+    """
+
+    def __init__(self):
+        self._worklogs = set()
+
+    @staticmethod
+    def _key(issue, started, time_spent_seconds, comment):
+        return (str(issue), started.astimezone(datetime.UTC).replace(microsecond=0), int(time_spent_seconds),
+                (comment or '').strip())
+
+    def add(self, issue, started, time_spent_seconds, comment):
+        self._worklogs.add(self._key(issue, started, time_spent_seconds, comment))
+
+    def contains(self, issue, started, time_spent, comment):
+        return self._key(issue, started, int(time_spent.rstrip('m')) * 60, comment) in self._worklogs
+
+    def __len__(self):
+        return len(self._worklogs)
+
+    @classmethod
+    def fetch(cls, jira, start, end):
+        index = cls()
+        # the worklog dates are compared in the time zone of the user, so the range is extended by a day
+        jql = 'worklogAuthor = currentUser() AND worklogDate >= "{0}" AND worklogDate <= "{1}"'.format(
+            (start - datetime.timedelta(days=1)).date().isoformat(), (end + datetime.timedelta(days=1)).date().isoformat())
+        issue_keys = {str(issue.id): issue.key
+                      for issue in jira.search_issues(jql, maxResults=False, fields='summary')}
+        if len(issue_keys) == 0:
+            return index
+
+        myself = jira.myself()
+        worklog_ids = []
+        params = {'since': int(start.timestamp() * 1000)}
+        while True:
+            updated_worklogs = jira._get_json('worklog/updated', params=params)
+            worklog_ids.extend(value['worklogId'] for value in updated_worklogs.get('values', []))
+            if updated_worklogs.get('lastPage', True):
+                break
+            params = {'since': updated_worklogs['until']}
+
+        for offset in range(0, len(worklog_ids), JIRA_WORKLOG_LIST_CHUNK_SIZE):
+            response = jira._session.post(jira._get_url('worklog/list'), data=json.dumps(
+                {'ids': worklog_ids[offset:offset + JIRA_WORKLOG_LIST_CHUNK_SIZE]}))
+            response.raise_for_status()
+            for worklog in response.json():
+                author = worklog.get('author') or {}
+                if str(worklog.get('issueId')) in issue_keys and any(
+                        author.get(field) is not None and author.get(field) == myself.get(field)
+                        for field in ('accountId', 'key', 'name')):
+                    index.add(issue_keys[str(worklog['issueId'])], parse_datetime(worklog['started']),
+                              worklog['timeSpentSeconds'], worklog.get('comment'))
+        return index
+
+
+def get_issue_number(grouped_time_entry, all_toggl_projects, configuration):
+    if (grouped_time_entry["pid"] is not None) and (all_toggl_projects.get(grouped_time_entry["pid"]) is not None):
+        return all_toggl_projects[grouped_time_entry['pid']]
+    return get_issue_key_matcher(configuration).match_description(grouped_time_entry['description'])
+
+
+@dataclasses.dataclass(slots=True)
+class PlannedWorklog:
+    """What is done for a group of time entries: a worklog is inserted and the time entries are tagged as processed
+    ('worklog'), the time entries are tagged as error ('error') or as processed without a worklog ('processed')."""
+    config_file: str | None
+    action: str
+    issue: str | None
+    started: datetime.datetime | None
+    time_spent: str | None
+    comment: str
+    time_entry_ids: list
+    message: str = ''
+
+    def to_row(self):
+        return {
+            "configFile": self.config_file,
+            "action": self.action,
+            "issue": self.issue,
+            "started": self.started.isoformat() if self.started is not None else None,
+            "timeSpent": self.time_spent,
+            "comment": self.comment,
+            "timeEntryIds": self.time_entry_ids,
+            "message": self.message
+        }
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row["configFile"] or None, row["action"], row["issue"] or None,
+                   parse_datetime(row["started"]) if row["started"] else None, row["timeSpent"] or None,
+                   row["comment"] or '', [int(time_entry_id) for time_entry_id in row["timeEntryIds"]],
+                   row.get("message") or '')
+
+
+def plan_worklog_group(grouped_time_entry, all_toggl_projects, configuration, issue_resolver,
+                       existing_worklogs=None):
+    """Returns the PlannedWorklog of one group of time entries without writing anything, or None if the group is
+    skipped."""
     global _logger
-    config_file = "config.ini"
+    start_time = min(time_entry.start_time for time_entry in grouped_time_entry["time_entries"])
+    time_entry_ids = [time_entry.id for time_entry in grouped_time_entry["time_entries"]]
+
+    def planned_worklog(action, issue=None, time_spent=None, message=''):
+        return PlannedWorklog(configuration.get('configFile'), action, issue, start_time, time_spent,
+                              grouped_time_entry['description'], time_entry_ids, message)
+
+    # when Toggl is running (duration is negative), the entry should be skipped.
+    if any(time_entry.duration < 0 for time_entry in grouped_time_entry["time_entries"]):
+        return None
+
+    duration = sum(time_entry.duration for time_entry in grouped_time_entry["time_entries"])
+    duration = str(math.ceil(duration / (float(60) * 15)) * 15) + "m"
+
+    issue_number = get_issue_number(grouped_time_entry, all_toggl_projects, configuration)
+    if issue_number is None:
+        if grouped_time_entry["pid"] is not None:
+            _logger.error(
+                "The project with the id {0} is not in the list of active projects.".format(
+                    str(grouped_time_entry["pid"])))
+            return planned_worklog('error', message='inactive project {0}'.format(grouped_time_entry["pid"]))
+        _logger.error("No JIRA issue number could be extracted from time entry project or work description. "
+                      "Therefore no worklog will be inserted in JIRA.")
+        return planned_worklog('error', message='no issue number')
+
+    # unknown issues have already been reported by the issue resolver
+    issue = issue_resolver.get(issue_number)
+    if issue is None:
+        return planned_worklog('error', message='unknown issue {0}'.format(issue_number))
+
+    if duration == '0m':
+        _logger.error('No JIRA worklog could be created.')
+        return planned_worklog('error', issue, duration, 'no duration')
+
+    if existing_worklogs is not None and existing_worklogs.contains(issue, start_time, duration,
+                                                                    grouped_time_entry['description']):
+        if configuration['duplicateCheck'] == 'flag':
+            _logger.error("A worklog of {0} for the issue {1} starting at {2} already exists in JIRA.".format(
+                duration, issue, start_time.isoformat()))
+            return planned_worklog('error', issue, duration, 'duplicate worklog')
+        _logger.warning("A worklog of {0} for the issue {1} starting at {2} already exists in JIRA, its time entries "
+                        "are tagged as processed.".format(duration, issue, start_time.isoformat()))
+        return planned_worklog('processed', issue, duration, 'duplicate worklog')
+    return planned_worklog('worklog', issue, duration)
+
+
+# the result of submit_planned_worklog for each action
+PLANNED_RESULTS = {'worklog': True, 'error': False, 'processed': None}
+
+
+def is_rejected(exception):
+    """Whether JIRA has clearly rejected a request, so that it has certainly not been carried out. Timeouts and
+    connection errors are not."""
+    status_code = getattr(exception, 'status_code', None)
+    if status_code is None and getattr(exception, 'response', None) is not None:
+        status_code = exception.response.status_code
+    return status_code is not None and 400 <= status_code < 500 and status_code not in HTTP_UNCERTAIN_CLIENT_ERRORS
+
+
+def submit_planned_worklog(planned_worklog, configuration, jira, tagger, state_store=None):
+    """Inserts a planned worklog and tags its time entries.
+
+    Returns True if the worklog has been inserted, False if the entries have been tagged as error and None if
+    the entries have been tagged as processed without a worklog. If the insert fails without a clear rejection by
+    JIRA, the worklog stays pending in the journal of the state store and None is returned as well, the journal is
+    reconciled with JIRA in the next run.
+    """
+    global _logger
+    from jira import JIRAError, Worklog
+    if planned_worklog.action == 'error':
+        for time_entry_id in planned_worklog.time_entry_ids:
+            tagger.add_error(time_entry_id, planned_worklog.comment)
+        return False
+    if planned_worklog.action == 'processed':
+        for time_entry_id in planned_worklog.time_entry_ids:
+            tagger.add_processed(time_entry_id, planned_worklog.comment)
+        return None
+
+    journal_id = None
+    if state_store is not None:
+        journal_id = state_store.begin_worklog(planned_worklog.issue, planned_worklog.started,
+                                               planned_worklog.time_spent, planned_worklog.comment,
+                                               planned_worklog.time_entry_ids)
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "c:", ["configuration"])
-    except getopt.GetoptError:
-        print("processTimeTrackingEntries.py -c <configurationfile>")
-        sys.exit(2)
-    for opt, arg in opts:
-        if opt in ("-c", "--configuration"):
-            config_file = arg
+        jira_response = insert_jira_worklog(planned_worklog.issue, planned_worklog.started,
+                                            planned_worklog.time_spent, planned_worklog.comment,
+                                            configuration['jiraRePolicy'], jira)
+    except (JIRAError, requests.RequestException) as exception:
+        _logger.error("The worklog for the issue {0} could not be inserted: {1}".format(str(planned_worklog.issue),
+                                                                                        str(exception)))
+        if journal_id is not None and not is_rejected(exception):
+            _logger.warning("It is unknown whether the worklog for the issue {0} has been inserted, it is checked "
+                            "in the next run.".format(str(planned_worklog.issue)))
+            return None
+        jira_response = None
+    if journal_id is not None:
+        if isinstance(jira_response, Worklog):
+            state_store.complete_worklog(journal_id, jira_response.id)
+        else:
+            state_store.abort_worklog(journal_id)
+    if isinstance(jira_response, Worklog):
+        for time_entry_id in planned_worklog.time_entry_ids:
+            _logger.info(
+                "A worklog for the time entry with the id \"{0}\" and the description \"{1}\" has been "
+                "created successfully".format(
+                    str(time_entry_id), planned_worklog.comment))
+            tagger.add_processed(time_entry_id, planned_worklog.comment)
+        return True
+    _logger.error('No JIRA worklog could be created.')
+    for time_entry_id in planned_worklog.time_entry_ids:
+        tagger.add_error(time_entry_id, planned_worklog.comment)
+    return False
 
-    configuration = read_configuration(config_file)
 
-    if (configuration.get('useLogFile') == True):
-        logging.basicConfig(filename=configuration['logFile'], level=configuration['logLevel'])
-    else:
-        logging.basicConfig(level=configuration['logLevel'])
+def submit_worklog_group(grouped_time_entry, all_toggl_projects, configuration, issue_resolver, jira, tagger,
+                         state_store=None, existing_worklogs=None):
+    """Inserts the worklog for one group of time entries and tags its entries.
 
+    Returns True if the worklog has been inserted, False if the entries have been tagged as error and None if
+    the group has been skipped.
+    """
+    planned_worklog = plan_worklog_group(grouped_time_entry, all_toggl_projects, configuration, issue_resolver,
+                                         existing_worklogs)
+    if planned_worklog is None:
+        return None
+    return submit_planned_worklog(planned_worklog, configuration, jira, tagger, state_store)
 
-    all_toggl_projects = {}
 
-    toggl_end_time = datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%dT%H:%M:%S+00:00")
+def iter_submitted(submit, items, workers, stop_event=None):
+    """Calls submit for every item with the given number of workers and yields the items with their results in the
+    order of the items, so an item is yielded only after all items before it have been submitted."""
+    def submit_item(item):
+        # after a stop request the items which have not been started yet are skipped
+        if stop_event is not None and stop_event.is_set():
+            return None
+        return submit(item)
 
-    toggl = Toggl(
-        api_token=configuration['myTogglApiToken'],
-        organization_id=configuration['myOrganization'],
-        workspace_id=configuration['myWorkspace'])
+    if workers <= 1:
+        for item in items:
+            yield item, submit_item(item)
+        return
+    # the items may be produced by the pipeline while the first ones are submitted, so at most two items per worker
+    # are queued instead of consuming all items at once like executor.map
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        submissions = collections.deque()
+        for item in items:
+            submissions.append((item, executor.submit(submit_item, item)))
+            if len(submissions) >= 2 * workers:
+                submitted_item, submission = submissions.popleft()
+                yield submitted_item, submission.result()
+        for submitted_item, submission in submissions:
+            yield submitted_item, submission.result()
 
-    # we take the Projects from "/me/projects" directly,
-    # since toggl.Projects uses "/workspaces/{{workspace_id}}/projects"
-    # and returns different/wrong results
-    if toggl.get("/me/projects") is not None:
-        all_toggl_projects = extract_jira_issue_numbers(toggl.get("/me/projects"),
-                                                        configuration['issue_number_regex_expression'])
 
-    new_time_tracking_entries = toggl.TimeEntries.get(
-        start_date=configuration['togglStartTime'],
-        end_date=toggl_end_time)
+def submit_in_parallel(submit, items, workers, stop_event=None):
+    """Calls submit for every item with the given number of workers and returns the results in the order of the
+    items."""
+    return [result for item, result in iter_submitted(submit, items, workers, stop_event)]
 
-    jira = JIRA(configuration['jiraUrl'], basic_auth=(configuration['jiraUser'], configuration['jiraPassword']))
 
-    grouped_time_entries = {}
+def submit_worklog_groups(worklog_groups, all_toggl_projects, configuration, issue_resolver, jira, tagger,
+                          state_store=None, stop_event=None, existing_worklogs=None):
+    # groups are independent of each other, a group is tagged by submit_worklog_group only after its worklog
+    # has been inserted
+    return submit_in_parallel(
+        lambda grouped_time_entry: submit_worklog_group(grouped_time_entry, all_toggl_projects, configuration,
+                                                        issue_resolver, jira, tagger, state_store, existing_worklogs),
+        worklog_groups, configuration['workers'], stop_event)
 
-    for time_entry in new_time_tracking_entries:
-        tags = time_entry.get('tags')
-        if (tags is None) or ("jiraprocessed" not in tags):
-            pid = time_entry.get('project_id')
-            description = time_entry['description'] if 'description' in time_entry else ''
-            group_key = str(pid) + "_" + description
 
-            start_time = dateutil.parser.parse(time_entry['start'])
+def submit_worklog_batches(worklog_batches, all_toggl_projects, configuration, issue_resolver, jira, tagger,
+                           state_store=None, stop_event=None, existing_worklogs=None, window_closed=None):
+    """Submits the groups of each day or week like submit_worklog_groups and calls window_closed after all groups of
+    a day or week have been submitted, while the groups of the next day or week are already being submitted."""
+    end_of_window = object()
+    items = (item for worklog_groups in worklog_batches for item in itertools.chain(worklog_groups, [end_of_window]))
+    results = []
+    for item, result in iter_submitted(
+            lambda item: None if item is end_of_window else submit_worklog_group(
+                item, all_toggl_projects, configuration, issue_resolver, jira, tagger, state_store, existing_worklogs),
+            items, configuration['workers'], stop_event):
+        if item is not end_of_window:
+            results.append(result)
+        elif window_closed is not None:
+            window_closed()
+    return results
 
-            if configuration['groupTimeEntriesBy'] == 'day':
-                group_key = group_key + '_' + str(start_time.timetuple().tm_yday)
-            elif configuration['groupTimeEntriesBy'] == 'week':
-                group_key = group_key + '_' + str(start_time.isocalendar()[1])
-            else:
-                group_key = group_key + '_' + str(start_time.isocalendar()[1])
-
-            if group_key not in grouped_time_entries:
-                grouped_time_entries[group_key] = {
-                    "pid": pid,
-                    "description": description,
-                    "time_entries": []
-                }
+
+class TogglProjectCache:
+    """The names of the Toggl projects of one user, optionally kept in a JSON file between runs.
+
+    All projects are fetched when the cache is empty or older than cache_ttl seconds. Otherwise only the projects
+    which have changed since the last synchronization are fetched, and projects which are still unknown are fetched
+    one by one. Inactive projects are cached without a name. Projects which cannot be fetched, e.g. projects of
+    another workspace, are looked for in the changed projects and are only remembered as missing until the next
+    synchronization.
+    """
+
+    def __init__(self, cache_file=None, cache_ttl=TOGGL_PROJECT_CACHE_TTL, sync_interval=TOGGL_PROJECT_SYNC_INTERVAL):
+        self.cache_file = cache_file
+        self.cache_ttl = cache_ttl
+        self.sync_interval = sync_interval
+        self.projects = {}
+        self.missing_project_ids = set()
+        self.fetched_at = None
+        self.synced_at = None
+        self._lock = threading.Lock()
+        self._read_cache_file()
+
+    def _read_cache_file(self):
+        if self.cache_file is None:
+            return
+        try:
+            with open(self.cache_file, encoding='utf-8') as cache_file:
+                cached_projects = json.load(cache_file)
+            if cached_projects['fetched_at'] >= time.time() - self.cache_ttl:
+                self.projects = {int(project_id): name for project_id, name in cached_projects['projects'].items()}
+                self.fetched_at = cached_projects['fetched_at']
+                self.synced_at = cached_projects['synced_at']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def _write_cache_file(self):
+        if self.cache_file is None:
+            return
+        try:
+            with open(self.cache_file, 'w', encoding='utf-8') as cache_file:
+                json.dump({'fetched_at': self.fetched_at, 'synced_at': self.synced_at, 'projects': self.projects},
+                          cache_file)
+        except OSError as exception:
+            _logger.warning("The Toggl project cache file {0} could not be written: {1}".format(self.cache_file,
+                                                                                               str(exception)))
+
+    @staticmethod
+    def _get_name(project):
+        if project.get('server_deleted_at') is not None or project.get('active') is False:
+            return None
+        return project['name']
+
+    def _fetch_all(self, toggl, now):
+        # we take the Projects from "/me/projects" directly,
+        # since toggl.Projects uses "/workspaces/{{workspace_id}}/projects"
+        # and returns different/wrong results
+        self.projects = {project['id']: self._get_name(project) for project in toggl.get("/me/projects") or []}
+        self.missing_project_ids.clear()
+        self.fetched_at = self.synced_at = now
+
+    def _fetch_changed(self, toggl, now):
+        changed_projects = toggl.get("/me/projects", params={'since': int(self.synced_at)}) or []
+        self.projects.update((project['id'], self._get_name(project)) for project in changed_projects)
+        self.missing_project_ids.clear()
+        self.synced_at = now
+
+    def _fetch_project(self, toggl, project_id):
+        """Fetches a single project of the workspace, returns False if the project cannot be fetched from there."""
+        global _logger
+        try:
+            project = toggl.get("/workspaces/{0}/projects/{1}".format(toggl.workspace_id, project_id))
+        except requests.HTTPError as exception:
+            if exception.response is None or exception.response.status_code not in (403, 404):
+                raise
+            _logger.debug("The Toggl project with the id {0} could not be fetched from the workspace: {1}".format(
+                str(project_id), str(exception)))
+            return False
+        if not project:
+            return False
+        self.projects[project_id] = self._get_name(project)
+        return True
+
+    def get_issue_numbers(self, toggl, issue_key_matcher, project_ids):
+        """Returns the issue numbers of the given projects, the projects are fetched only if necessary."""
+        with self._lock:
+            if len(project_ids) > 0:
+                now = time.time()
+                unknown_project_ids = set(project_ids) - self.projects.keys()
+                if self.fetched_at is None or self.fetched_at < now - self.cache_ttl:
+                    self._fetch_all(toggl, now)
+                elif self.synced_at < now - self.sync_interval:
+                    self._fetch_changed(toggl, now)
+                missing_project_ids = [project_id for project_id in sorted(set(project_ids) - self.projects.keys()
+                                                                           - self.missing_project_ids)
+                                       if not self._fetch_project(toggl, project_id)]
+                # the projects of other workspaces are only returned by /me/projects
+                if len(missing_project_ids) > 0 and self.synced_at != now:
+                    self._fetch_changed(toggl, now)
+                for project_id in missing_project_ids:
+                    if project_id not in self.projects:
+                        _logger.warning("The Toggl project with the id {0} could not be fetched.".format(
+                            str(project_id)))
+                        self.missing_project_ids.add(project_id)
+                if self.synced_at == now or len(unknown_project_ids) > 0:
+                    self._write_cache_file()
+            projects = [{'id': project_id, 'name': self.projects[project_id]} for project_id in project_ids
+                        if self.projects.get(project_id) is not None]
+        return extract_jira_issue_numbers(projects, issue_key_matcher)
+
+
+NO_PHASE = contextlib.nullcontext()
+
+
+class SharedClients:
+    """The clients and caches which are shared by all configurations processed in one process and, in daemon mode,
+    by all cycles.
+
+    The JIRA adapters are shared per JIRA URL, the Toggl adapters per API token, since Toggl throttles per token.
+    The Toggl and JIRA clients, the Toggl projects and the issue resolvers are kept per configuration. With a metrics
+    or Prometheus file, the run metrics are collected as well.
+    """
+
+    def __init__(self, metrics_file=None, prometheus_file=None):
+        metrics_enabled = metrics_file is not None or prometheus_file is not None
+        self.http_statistics = HttpStatistics(keep_latencies=metrics_enabled)
+        self.metrics = RunMetrics(self.http_statistics, metrics_file, prometheus_file) if metrics_enabled else None
+        self._adapters = {}
+        self._server_infos = {}
+        self._issues = {}
+        self._toggl_clients = {}
+        self._jira_clients = {}
+        self._issue_resolvers = {}
+        self._projects = {}
+        self._lock = threading.Lock()
+
+    def phase(self, name):
+        """Measures the enclosed block as the given phase, if the run metrics are collected."""
+        return NO_PHASE if self.metrics is None else self.metrics.phase(name)
+
+    def timed(self, name, iterable):
+        """Measures the time spent producing the items of the iterable, e.g. a pipeline stage, as the given phase."""
+        return iterable if self.metrics is None else self.metrics.timed(name, iterable)
+
+    def get_toggl_adapter(self, configuration):
+        return self._get_adapter(('toggl', configuration['myTogglApiToken']), configuration['togglRateLimit'],
+                                 configuration['togglRateLimitBurst'], requests.adapters.DEFAULT_POOLSIZE)
+
+    def get_jira_adapter(self, configuration):
+        return self._get_adapter(('jira', configuration['jiraUrl']), configuration['jiraRateLimit'],
+                                 configuration['jiraRateLimitBurst'],
+                                 max(requests.adapters.DEFAULT_POOLSIZE, configuration['workers']))
+
+    def _get_adapter(self, key, rate_limit, burst, pool_maxsize):
+        with self._lock:
+            if key not in self._adapters:
+                self._adapters[key] = ThrottledHTTPAdapter(rate_limit, burst, statistics=self.http_statistics,
+                                                           pool_maxsize=pool_maxsize)
+            return self._adapters[key]
+
+    def get_toggl_client(self, configuration):
+        with self._lock:
+            toggl = self._toggl_clients.get(configuration['configFile'])
+        if toggl is None:
+            toggl = TogglClient(configuration['togglApiUrl'], configuration['myTogglApiToken'],
+                                configuration['myWorkspace'], self.get_toggl_adapter(configuration),
+                                reports_api_url=configuration.get('togglReportsApiUrl'))
+            with self._lock:
+                toggl = self._toggl_clients.setdefault(configuration['configFile'], toggl)
+        return toggl
+
+    def get_jira_client(self, configuration):
+        with self._lock:
+            jira = self._jira_clients.get(configuration['configFile'])
+            server_info = self._server_infos.get(configuration['jiraUrl'])
+        if jira is None:
+            jira, server_info = create_jira_client(configuration, self.get_jira_adapter(configuration), server_info)
+            with self._lock:
+                self._server_infos[configuration['jiraUrl']] = server_info
+                jira = self._jira_clients.setdefault(configuration['configFile'], jira)
+        return jira
+
+    def get_validated_issues(self, configuration):
+        with self._lock:
+            return self._issues.setdefault(configuration['jiraUrl'], {})
+
+    def get_issue_resolver(self, configuration, jira):
+        with self._lock:
+            issue_resolver = self._issue_resolvers.get(configuration['configFile'])
+        if issue_resolver is None:
+            issue_resolver = JiraIssueResolver(jira, cache_file=configuration['jiraIssueCacheFile'],
+                                               cache_ttl=configuration['jiraIssueCacheTtl'],
+                                               validated_issues=self.get_validated_issues(configuration))
+            with self._lock:
+                issue_resolver = self._issue_resolvers.setdefault(configuration['configFile'], issue_resolver)
+        return issue_resolver
+
+    def get_project_issue_numbers(self, configuration, toggl, project_ids):
+        """Returns the issue numbers of the given Toggl projects, see TogglProjectCache."""
+        with self._lock:
+            project_cache = self._projects.get(configuration['configFile'])
+            if project_cache is None:
+                project_cache = self._projects[configuration['configFile']] = TogglProjectCache(
+                    configuration.get('togglProjectCacheFile'),
+                    configuration.get('togglProjectCacheTtl', TOGGL_PROJECT_CACHE_TTL))
+        return project_cache.get_issue_numbers(toggl, get_issue_key_matcher(configuration), project_ids)
+
+
+def create_jira_client(configuration, adapter, server_info=None):
+    from jira import JIRA
+    # the retries are done by the adapter, so the session of the JIRA client must not retry on its own
+    jira = JIRA(configuration['jiraUrl'], basic_auth=(configuration['jiraUser'], configuration['jiraPassword']),
+                get_server_info=False, max_retries=0, timeout=HTTP_TIMEOUT)
+    mount_http_adapter(jira._session, adapter)
+    # what JIRA() does with get_server_info=True, but through the adapter and only once per JIRA
+    if server_info is None:
+        server_info = jira.server_info()
+    jira._version = tuple(server_info["versionNumbers"])
+    jira.deploymentType = server_info.get("deploymentType")
+    return jira, server_info
+
+
+def process_time_entries(configuration, full_resync=False, shared_clients=None, stop_event=None, plan=None):
+    """Inserts the new time entries of one configuration as worklogs in JIRA and returns a summary of the run. With
+    a plan list, the worklogs are only planned, see submit_time_entries."""
+    global _logger
+    if shared_clients is None:
+        shared_clients = SharedClients()
+
+    run_start_time = time.time()
+    # with maxdays the start moves with every run, e.g. every cycle of the daemon
+    toggl_start_time = get_toggl_start_time(configuration, run_start_time)
+    toggl_end_time = datetime.datetime.fromtimestamp(run_start_time, datetime.UTC).strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+    state_store = None
+    if configuration['stateFile'] is not None:
+        state_store = StateStore(configuration['stateFile'])
+        if full_resync and plan is None:
+            _logger.info("The state in {0} is rebuilt with a full synchronisation.".format(configuration['stateFile']))
+            state_store.reset()
+
+    toggl = shared_clients.get_toggl_client(configuration)
+    summary = {"timeEntries": 0, "groups": 0, "worklogs": 0, "errors": 0}
+    unfinished_since = run_start_time
+    try:
+        # the worklogs of the newest chunk are inserted while the next chunk is being fetched
+        for new_time_tracking_entries in fetch_time_entries(
+                toggl, configuration, toggl_start_time, toggl_end_time,
+                state_store if configuration['incrementalSync'] else None, shared_clients, stop_event):
+            chunk_summary = submit_time_entries(configuration, new_time_tracking_entries, toggl, shared_clients,
+                                                state_store, stop_event, plan)
+            del new_time_tracking_entries
+            unfinished_since = min(unfinished_since, chunk_summary.pop("unfinishedSince", None) or unfinished_since)
+            for key in summary:
+                summary[key] += chunk_summary[key]
+
+        # the time entries which are still to be processed are fetched again in the next run, after a stop request
+        # the chunks which have not been fetched are unknown, so the watermark is kept
+        if state_store is not None and plan is None and not (stop_event is not None and stop_event.is_set()):
+            state_store.set_watermark(unfinished_since - TOGGL_WATERMARK_MARGIN)
+    finally:
+        if state_store is not None:
+            state_store.close()
+    return summary
+
+
+def validate_time_entries(time_entries, tagger, state_store=None, journaled_time_entry_ids=()):
+    """Yields the time entries which have not been processed yet. Time entries with missing fields are tagged as
+    error."""
+    global _logger
+    for time_entry in time_entries:
+        tags = time_entry.get('tags')
+        if ((tags is None) or (TOGGL_PROCESSED_TAG not in tags)) and not (
+                state_store is not None and state_store.is_processed(time_entry.get('id'))) and (
+                time_entry.get('id') not in journaled_time_entry_ids):
+            start = time_entry.get('start')
+            start_time = parse_datetime(start) if start is not None else None
             error_flag = False
             if (time_entry.get('id') is None):
                 error_flag = True
                 _logger.warning(
-                    'The time entry with the description "{1}" has has no id and cannot be transmitted to JIRA. Skipping next checks.'.format(
-                        time_entry['description']))
+                    'The time entry with the description "{0}" has has no id and cannot be transmitted to JIRA. Skipping next checks.'.format(
+                        time_entry.get('description')))
             if (not error_flag and start_time is None):
                 error_flag = True
-                tag_timeentry_as_error(time_entry['id'], '(missing start time)', toggl)
+                tagger.add_error(time_entry['id'], '(missing start time)')
                 _logger.warning(
                     'The time entry with the id "{0}" and the description "{1}" has has no start time and cannot be transmitted to JIRA'.format(
-                        str(time_entry['id']), time_entry['description']))
+                        str(time_entry['id']), time_entry.get('description')))
             if (not error_flag and time_entry.get('duration') is None):
                 error_flag = True
-                tag_timeentry_as_error(time_entry['id'], '(missing duration)', toggl)
+                tagger.add_error(time_entry['id'], '(missing duration)')
                 _logger.warning(
                     'The time entry with the id "{0}" and the description "{1}" has has no time entry and cannot be transmitted to JIRA'.format(
-                        str(time_entry['id']), time_entry['description']))
+                        str(time_entry['id']), time_entry.get('description')))
             if (not error_flag and time_entry.get('description') is None):
                 error_flag = True
-                tag_timeentry_as_error(time_entry['id'], '(missing description)', toggl)
+                tagger.add_error(time_entry['id'], '(missing description)')
                 _logger.warning(
                     'The time entry with the id "{0}" has has no description and cannot be transmitted to JIRA'.format(
                         str(time_entry['id'])))
             if not(error_flag):
-                grouped_time_entries[group_key]["time_entries"].append({
-                    "start_time": start_time,
-                    "duration": time_entry['duration'],
-                    "id": time_entry['id'],
-                    "description": time_entry['description']
-                })
+                yield TimeEntry(time_entry['id'], start_time, time_entry['duration'], time_entry['description'],
+                                time_entry.get('project_id'))
 
         else:
             _logger.info(
@@ -296,61 +1766,608 @@ def main():
                 'created as worklog in JIRA and subsequently tagged in Toggl'.format(
                     str(time_entry['id']), time_entry['description']))
 
-    for key, grouped_time_entry in grouped_time_entries.items():
-        if (len(grouped_time_entry["time_entries"]) > 0):
-            start_time = min(time_entry["start_time"] for time_entry in grouped_time_entry["time_entries"])
 
-            # when Toggl is running (duration is negative), the entry should be skipped.
-            if (time_entry["duration"] < 0):
-                continue
+def group_time_entries(time_entries, group_time_entries_by):
+    """Groups the time entries by project, description and day or week and yields the groups of each day or week as
+    soon as it is closed.
 
-            duration = sum(time_entry["duration"] for time_entry in grouped_time_entry["time_entries"])
-            duration = str(math.ceil(duration / (float(60) * 15)) * 15) + "m"
+    The time entries are expected newest first, as Toggl returns them, so a day or week is closed when a time entry
+    of an earlier day or week arrives. Time entries in any other order are grouped correctly as well, but their
+    groups are only yielded at the end.
+    """
+    open_windows = {}
+    for time_entry in time_entries:
+        group_key = get_group_key(time_entry.project_id, time_entry.description, time_entry.start_time,
+                                  group_time_entries_by)
+        window = group_key[2:]
+        grouped_time_entries = open_windows.get(window)
+        if grouped_time_entries is None:
+            for closed_window in sorted((open_window for open_window in open_windows if open_window > window),
+                                        reverse=True):
+                yield list(open_windows.pop(closed_window).values())
+            grouped_time_entries = open_windows[window] = {}
+        grouped_time_entry = grouped_time_entries.get(group_key)
+        if grouped_time_entry is None:
+            grouped_time_entry = grouped_time_entries[group_key] = {
+                "pid": time_entry.project_id,
+                "description": time_entry.description,
+                "time_entries": []
+            }
+        grouped_time_entry["time_entries"].append(time_entry)
+    for window in sorted(open_windows, reverse=True):
+        yield list(open_windows[window].values())
 
-            if (grouped_time_entry["pid"] is not None) and (all_toggl_projects.get(grouped_time_entry["pid"]) is not None):
-                issue = jira.issue(all_toggl_projects[grouped_time_entry['pid']])
-            elif extract_jira_issue_number(grouped_time_entry['description'],
-                                           configuration['issue_number_regex_expression']) is not None:
-                issue_number = extract_jira_issue_number(grouped_time_entry['description'],
-                                                         configuration['issue_number_regex_expression'])
-                try:
-                    issue = jira.issue(issue_number)
-                except JIRAError:
-                    _logger.error("The issue {0} could not be found in JIRA.".format(str(issue_number)))
-                    tag_grouped_timeentry_as_error(grouped_time_entry["time_entries"], toggl)
-                    continue
-            elif (grouped_time_entry["pid"] is not None) and (all_toggl_projects.get(grouped_time_entry["pid"]) is None):
-                _logger.error(
-                    "The project with the id {0} is not in the list of active projects.".format(
-                        str(grouped_time_entry["pid"])))
-                tag_grouped_timeentry_as_error(grouped_time_entry["time_entries"], toggl)
-                continue
+
+def resolve_worklog_batches(worklog_batches, all_toggl_projects, configuration, issue_resolver):
+    """Resolves the issue numbers of each batch of groups, which are not known yet, with one search and yields the
+    batches."""
+    for worklog_groups in worklog_batches:
+        issue_resolver.resolve(get_issue_number(grouped_time_entry, all_toggl_projects, configuration)
+                               for grouped_time_entry in worklog_groups)
+        yield worklog_groups
+
+
+def resolve_worklog_groups(worklog_batches, all_toggl_projects, configuration, issue_resolver):
+    """Like resolve_worklog_batches, but yields the groups."""
+    for worklog_groups in resolve_worklog_batches(worklog_batches, all_toggl_projects, configuration, issue_resolver):
+        yield from worklog_groups
+
+
+def get_start_time_range(time_entries):
+    """Returns the earliest and the latest start of the time entries which have not been tagged as processed."""
+    start_times = [parse_datetime(time_entry['start']) for time_entry in time_entries
+                   if time_entry.get('start') is not None
+                   and TOGGL_PROCESSED_TAG not in (time_entry.get('tags') or [])]
+    return min(start_times), max(start_times)
+
+
+def flush_taggings(tagger, state_store, shared_clients):
+    """Sends the pending taggings and records the time entries which have been tagged as processed."""
+    with shared_clients.phase("tagTimeEntries"):
+        tagging_results = tagger.flush()
+    if state_store is not None:
+        state_store.mark_processed(tagging_results.get(TOGGL_PROCESSED_TAG, ([], {}))[0])
+        state_store.finish_worklogs()
+    return tagging_results
+
+
+def get_unfinished_since(time_entries, tagged_time_entry_ids, state_store):
+    """Returns when the earliest of the time entries which have neither been processed nor tagged, e.g. the groups
+    with a running time entry or the groups skipped after a stop request, has been modified, or None.
+
+    The watermark must not be moved past it, otherwise the unchanged time entries of such a group would not be
+    fetched again by the incremental synchronisation.
+    """
+    modified_at = [parse_datetime(time_entry.get('at') or time_entry['start']).timestamp()
+                   for time_entry in time_entries
+                   if time_entry.get('id') is not None and time_entry.get('start') is not None
+                   and time_entry['id'] not in tagged_time_entry_ids
+                   and TOGGL_PROCESSED_TAG not in (time_entry.get('tags') or [])
+                   and not state_store.is_processed(time_entry['id'])]
+    return min(modified_at, default=None)
+
+
+def get_planned_taggings(configuration, tagger):
+    """Returns the taggings which have been collected by the tagger, but not sent, as planned worklogs."""
+    return [PlannedWorklog(configuration['configFile'], 'error' if tag == TOGGL_ERROR_TAG else 'processed', None,
+                           None, None, '', [time_entry_id], message)
+            for tag, time_entries in tagger.pending.items() for time_entry_id, message in time_entries.items()]
+
+
+def submit_time_entries(configuration, new_time_tracking_entries, toggl, shared_clients, state_store=None,
+                        stop_event=None, plan=None, existing_worklogs=None):
+    """Inserts the time entries as worklogs in JIRA and tags them in Toggl.
+
+    The time entries flow through a pipeline of generators: they are validated, grouped, their issues are resolved
+    and the groups are submitted as soon as their day or week is closed, while the later groups are still being
+    grouped. The taggings are sent in bulk after each day or week. The time entries are expected newest first, as
+    Toggl returns them, otherwise the groups are only submitted at the end, see group_time_entries.
+
+    With a plan list, nothing is written to JIRA, Toggl or the state file: the planned worklogs and taggings are
+    appended to the list instead. The existing worklogs of JIRA are fetched for the duplicate check, unless an
+    ExistingWorklogIndex which covers the time entries is given.
+    """
+    global _logger
+    tagger = TogglTagger(toggl, send_full_chunks=plan is None)
+    tagged_time_entry_ids = set()
+
+    def tag_time_entries():
+        tagging_results = flush_taggings(tagger, state_store, shared_clients)
+        tagged_time_entry_ids.update(time_entry_id for succeeded, failed in tagging_results.values()
+                                     for time_entry_id in succeeded)
+
+    # the projects are only needed for time entries which have not been processed yet
+    with shared_clients.phase("fetchProjects"):
+        all_toggl_projects = shared_clients.get_project_issue_numbers(
+            configuration, toggl, {time_entry['project_id'] for time_entry in new_time_tracking_entries
+                                   if time_entry.get('project_id') is not None
+                                   and TOGGL_PROCESSED_TAG not in (time_entry.get('tags') or [])})
+
+    jira = None
+    journaled_time_entry_ids = set()
+    if state_store is not None and len(state_store.get_journaled_worklogs()) > 0:
+        if plan is None:
+            with shared_clients.phase("connectJira"):
+                jira = shared_clients.get_jira_client(configuration)
+            with shared_clients.phase("reconcileJournal"):
+                reconcile_worklog_journal(state_store, jira, tagger)
+        journaled_time_entry_ids = state_store.get_journaled_time_entry_ids()
+
+    worklog_batches = shared_clients.timed("groupTimeEntries", group_time_entries(
+        validate_time_entries(new_time_tracking_entries, tagger, state_store, journaled_time_entry_ids),
+        configuration['groupTimeEntriesBy']))
+    results = []
+    unfinished_since = None
+    try:
+        first_worklog_batch = next(worklog_batches, None)
+        # the JIRA client is only created, and the jira module imported, if there is something to insert
+        if first_worklog_batch is not None:
+            if jira is None:
+                with shared_clients.phase("connectJira"):
+                    jira = shared_clients.get_jira_client(configuration)
+            issue_resolver = shared_clients.get_issue_resolver(configuration, jira)
+            issue_resolver.forget_missing_issues()
+            # the issues of the projects are known in advance, so only the issues in the descriptions are left to be
+            # resolved per day or week
+            with shared_clients.phase("resolveIssues"):
+                issue_resolver.resolve(all_toggl_projects.values())
+            if existing_worklogs is None and configuration['duplicateCheck'] != 'off':
+                with shared_clients.phase("checkDuplicates"):
+                    existing_worklogs = ExistingWorklogIndex.fetch(
+                        jira, *get_start_time_range(new_time_tracking_entries))
+                _logger.info("{0} existing worklogs have been found in JIRA.".format(len(existing_worklogs)))
+            resolved_batches = shared_clients.timed("resolveIssues", resolve_worklog_batches(
+                itertools.chain([first_worklog_batch], worklog_batches), all_toggl_projects, configuration,
+                issue_resolver))
+            if plan is not None:
+                for grouped_time_entry in itertools.chain.from_iterable(resolved_batches):
+                    planned_worklog = plan_worklog_group(grouped_time_entry, all_toggl_projects, configuration,
+                                                         issue_resolver, existing_worklogs)
+                    if planned_worklog is not None:
+                        plan.append(planned_worklog)
+                    results.append(PLANNED_RESULTS[planned_worklog.action] if planned_worklog is not None else None)
             else:
-                _logger.error("No JIRA issue number could be extracted from time entry project or work description. "
-                              "Therefore no worklog will be inserted in JIRA.")
-                tag_grouped_timeentry_as_error(grouped_time_entry["time_entries"], toggl)
-                continue
-            if issue is not None:
-                jira_response = insert_jira_worklog(issue, start_time, duration, grouped_time_entry['description'],
-                                                    configuration['jiraRePolicy'], jira)
-                if isinstance(jira_response, Worklog):
-                    for timeEntry in grouped_time_entry["time_entries"]:
-                        _logger.info(
-                            "A worklog for the time entry with the id \"{0}\" and the description \"{1}\" has been "
-                            "created successfully".format(
-                                str(timeEntry['id']), timeEntry['description']))
-                        tag_timeentry_as_processed(timeEntry['id'], timeEntry['description'], toggl)
+                # the time entries of each day or week are tagged as soon as its worklogs have been inserted
+                with shared_clients.phase("submitWorklogs"):
+                    results = submit_worklog_batches(resolved_batches, all_toggl_projects, configuration,
+                                                     issue_resolver, jira, tagger, state_store, stop_event,
+                                                     existing_worklogs, tag_time_entries)
+    finally:
+        if plan is not None:
+            plan.extend(get_planned_taggings(configuration, tagger))
+        else:
+            tag_time_entries()
+            if state_store is not None:
+                unfinished_since = get_unfinished_since(new_time_tracking_entries, tagged_time_entry_ids,
+                                                        state_store)
+
+    if results.count(False) > 0:
+        _logger.error("{0} of {1} grouped time entries could not be transmitted to JIRA.".format(
+            str(results.count(False)), str(len(results))))
+    return {
+        "timeEntries": len(new_time_tracking_entries),
+        "groups": len(results),
+        "worklogs": results.count(True),
+        "errors": results.count(False),
+        "unfinishedSince": unfinished_since
+    }
+
+
+def get_backfill_chunks(start, end, group_time_entries_by, chunk_days):
+    """Splits the range into chunks whose boundaries are day or, when grouping by week, week boundaries (UTC), so that
+    no group of time entries is split between two chunks. Only the first and the last chunk are cut at start and
+    end."""
+    if group_time_entries_by == 'day':
+        boundary = start.astimezone(datetime.UTC).replace(hour=0, minute=0, second=0, microsecond=0)
+        chunk_length = datetime.timedelta(days=max(1, chunk_days))
+    else:
+        boundary = start.astimezone(datetime.UTC).replace(hour=0, minute=0, second=0, microsecond=0)
+        boundary -= datetime.timedelta(days=boundary.weekday())
+        chunk_length = datetime.timedelta(weeks=max(1, math.ceil(chunk_days / 7)))
+    chunks = []
+    chunk_start = start
+    while chunk_start < end:
+        boundary += chunk_length
+        chunk_end = min(boundary, end)
+        if chunk_end > chunk_start:
+            chunks.append((chunk_start, chunk_end))
+            chunk_start = chunk_end
+    return chunks
+
+
+def parse_backfill_date(value, is_end=False):
+    """Parses the start or end of the backfill range. A date without time is the start of the day for the start and
+    the end of the day for the end of the range, dates without time zone are UTC."""
+    date = parse_datetime(value)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.UTC)
+    if is_end and re.fullmatch(r'\d{4}-\d{2}-\d{2}', value.strip()):
+        date += datetime.timedelta(days=1)
+    return date
+
+
+def backfill_time_entries(configuration, start, end, shared_clients=None, stop_event=None, plan=None):
+    """Inserts the time entries of a large range chunk by chunk.
+
+    The chunks are fetched ahead of the chunk which is submitted, see fetch_time_entry_chunks. With a state file, the
+    processed chunks are recorded and skipped when the backfill is started again.
+    """
+    global _logger
+    if shared_clients is None:
+        shared_clients = SharedClients()
+    state_store = StateStore(configuration['stateFile']) if configuration['stateFile'] is not None else None
+    if state_store is None:
+        _logger.warning("Without a state file the backfill cannot be resumed.")
+    toggl = shared_clients.get_toggl_client(configuration)
+
+    chunks = [(chunk_start, chunk_end) for chunk_start, chunk_end in get_backfill_chunks(
+        start, end, configuration['groupTimeEntriesBy'], configuration['backfillChunkDays'])
+              if state_store is None or not state_store.is_backfill_chunk_done(chunk_start, chunk_end)]
+    _logger.info("{0} chunks between {1} and {2} are backfilled.".format(len(chunks), start.isoformat(),
+                                                                          end.isoformat()))
+
+    summary = {"timeEntries": 0, "groups": 0, "worklogs": 0, "errors": 0, "chunks": 0}
+    try:
+        # the existing worklogs are fetched once for the whole range instead of once per chunk
+        existing_worklogs = None
+        if len(chunks) > 0 and configuration['duplicateCheck'] != 'off':
+            with shared_clients.phase("connectJira"):
+                jira = shared_clients.get_jira_client(configuration)
+            with shared_clients.phase("checkDuplicates"):
+                existing_worklogs = ExistingWorklogIndex.fetch(jira, chunks[0][0], chunks[-1][1])
+            _logger.info("{0} existing worklogs have been found in JIRA.".format(len(existing_worklogs)))
+        for chunk, time_entries in fetch_time_entry_chunks(toggl, configuration, chunks, shared_clients,
+                                                           stop_event):
+            _logger.info("Backfilling the time entries between {0} and {1}".format(chunk[0].isoformat(),
+                                                                                   chunk[1].isoformat()))
+            chunk_summary = submit_time_entries(configuration, time_entries, toggl, shared_clients, state_store,
+                                                stop_event, plan, existing_worklogs)
+            del time_entries
+            for key in ("timeEntries", "groups", "worklogs", "errors"):
+                summary[key] += chunk_summary[key]
+            if state_store is not None and plan is None and not (stop_event is not None and stop_event.is_set()):
+                state_store.mark_backfill_chunk_done(*chunk)
+            summary["chunks"] += 1
+    finally:
+        if state_store is not None:
+            state_store.close()
+    return summary
+
+
+PLAN_FIELDS = ("configFile", "action", "issue", "started", "timeSpent", "comment", "timeEntryIds", "message")
+
+
+def write_plan(plan_file, plan):
+    """Writes the planned worklogs as CSV, if the file name ends with .csv, or as JSON."""
+    rows = [planned_worklog.to_row() for planned_worklog in plan]
+    if plan_file.lower().endswith('.csv'):
+        with open(plan_file, 'w', newline='', encoding='utf-8') as output:
+            writer = csv.DictWriter(output, fieldnames=PLAN_FIELDS)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(dict(row, timeEntryIds=" ".join(str(time_entry_id)
+                                                                for time_entry_id in row["timeEntryIds"])))
+    else:
+        with open(plan_file, 'w', encoding='utf-8') as output:
+            json.dump(rows, output, indent=2)
+
+
+def read_plan(plan_file):
+    """Reads the planned worklogs written by write_plan."""
+    with open(plan_file, newline='', encoding='utf-8') as plan_input:
+        if plan_file.lower().endswith('.csv'):
+            rows = [dict(row, timeEntryIds=row["timeEntryIds"].split()) for row in csv.DictReader(plan_input)]
+        else:
+            rows = json.load(plan_input)
+    return [PlannedWorklog.from_row(row) for row in rows]
+
+
+def execute_plan(configuration, planned_worklogs, shared_clients=None, stop_event=None):
+    """Inserts the planned worklogs of one configuration and tags their time entries exactly as planned.
+
+    With a state file, the planned worklogs whose time entries have been processed since the plan has been made are
+    skipped. The planned worklogs which already exist in JIRA, e.g. because the plan has been executed before, are
+    only tagged as processed. The plan is not executed if the existing worklogs cannot be fetched and there is no
+    state file either.
+    """
+    global _logger
+    from jira import JIRAError
+    if shared_clients is None:
+        shared_clients = SharedClients()
+    state_store = StateStore(configuration['stateFile']) if configuration['stateFile'] is not None else None
+    tagger = TogglTagger(shared_clients.get_toggl_client(configuration))
+    jira = None
+    results = []
+    try:
+        if state_store is not None:
+            if len(state_store.get_journaled_worklogs()) > 0:
+                with shared_clients.phase("connectJira"):
+                    jira = shared_clients.get_jira_client(configuration)
+                with shared_clients.phase("reconcileJournal"):
+                    reconcile_worklog_journal(state_store, jira, tagger)
+            journaled_time_entry_ids = state_store.get_journaled_time_entry_ids()
+            unprocessed_worklogs = []
+            for planned_worklog in planned_worklogs:
+                if any(state_store.is_processed(time_entry_id) or time_entry_id in journaled_time_entry_ids
+                       for time_entry_id in planned_worklog.time_entry_ids):
+                    _logger.warning("The time entries {0} have been processed since the plan has been made, the "
+                                    "planned {1} is skipped.".format(planned_worklog.time_entry_ids,
+                                                                     planned_worklog.action))
                 else:
-                    _logger.error('No JIRA worklog could be created.')
-                    tag_grouped_timeentry_as_error(grouped_time_entry["time_entries"], toggl)
-                    continue
+                    unprocessed_worklogs.append(planned_worklog)
+            planned_worklogs = unprocessed_worklogs
+        started = [planned_worklog.started for planned_worklog in planned_worklogs
+                   if planned_worklog.action == 'worklog']
+        if len(started) > 0:
+            if jira is None:
+                with shared_clients.phase("connectJira"):
+                    jira = shared_clients.get_jira_client(configuration)
+            try:
+                with shared_clients.phase("checkDuplicates"):
+                    existing_worklogs = ExistingWorklogIndex.fetch(jira, min(started), max(started))
+            except (JIRAError, requests.RequestException) as exception:
+                if state_store is None:
+                    raise RuntimeError("The existing worklogs could not be fetched from JIRA and there is no state "
+                                       "file, the plan is not executed: {0}".format(str(exception))) from exception
+                _logger.warning("The existing worklogs could not be fetched from JIRA, only the state file is "
+                                "checked: {0}".format(str(exception)))
             else:
-                _logger.error('No JIRA issue could be created with the given information.')
-                tag_grouped_timeentry_as_error(grouped_time_entry["time_entries"], toggl)
-                continue
+                planned_worklogs = list(planned_worklogs)
+                for index, planned_worklog in enumerate(planned_worklogs):
+                    if planned_worklog.action == 'worklog' and existing_worklogs.contains(
+                            planned_worklog.issue, planned_worklog.started, planned_worklog.time_spent,
+                            planned_worklog.comment):
+                        _logger.warning("The planned worklog of {0} for the issue {1} starting at {2} already exists "
+                                        "in JIRA, its time entries are tagged as processed.".format(
+                                            planned_worklog.time_spent, planned_worklog.issue,
+                                            planned_worklog.started.isoformat()))
+                        planned_worklogs[index] = dataclasses.replace(planned_worklog, action='processed',
+                                                                      message='duplicate worklog')
+        with shared_clients.phase("submitWorklogs"):
+            results = submit_in_parallel(
+                lambda planned_worklog: submit_planned_worklog(planned_worklog, configuration, jira, tagger,
+                                                               state_store),
+                planned_worklogs, configuration['workers'], stop_event)
+    finally:
+        flush_taggings(tagger, state_store, shared_clients)
+        if state_store is not None:
+            state_store.close()
+    return {
+        "timeEntries": sum(len(planned_worklog.time_entry_ids) for planned_worklog in planned_worklogs),
+        "groups": len(results),
+        "worklogs": results.count(True),
+        "errors": results.count(False)
+    }
+
+
+def execute_plans(configurations, planned_worklogs, shared_clients=None):
+    """Executes the planned worklogs of each configuration and returns a summary per configuration. The planned
+    worklogs of configurations which are not given are skipped."""
+    global _logger
+    config_files = {os.path.abspath(config_file): config_file for config_file in configurations}
+    plans = {}
+    for planned_worklog in planned_worklogs:
+        config_file = config_files.get(os.path.abspath(planned_worklog.config_file or ''))
+        if config_file is None and len(configurations) == 1:
+            config_file = next(iter(configurations))
+        if config_file is None:
+            _logger.warning("The configuration {0} of the planned {1} for the time entries {2} is not given, it is "
+                            "skipped.".format(planned_worklog.config_file, planned_worklog.action,
+                                              planned_worklog.time_entry_ids))
+            continue
+        plans.setdefault(config_file, []).append(planned_worklog)
+
+    summaries = {}
+    for config_file, plan in plans.items():
+        if configurations[config_file] is None:
+            summaries[config_file] = {"error": "invalid configuration"}
+            continue
+        try:
+            _logger.info("Executing the plan of the configuration {0}".format(config_file))
+            summaries[config_file] = execute_plan(configurations[config_file], plan, shared_clients)
+        except Exception as exception:
+            _logger.exception("The plan of the configuration {0} could not be executed".format(config_file))
+            summaries[config_file] = {"error": str(exception)}
+    return summaries
+
+
+def read_configuration_files(config_file_arguments):
+    """Expands directories to the configuration files (*.ini) they contain."""
+    config_files = []
+    for config_file_argument in config_file_arguments:
+        if os.path.isdir(config_file_argument):
+            config_files.extend(sorted(glob.glob(os.path.join(config_file_argument, '*.ini'))))
+        else:
+            config_files.append(config_file_argument)
+    return config_files
+
+
+# the files which are written during a run, they cannot be shared between configurations which are processed in
+# parallel
+PER_CONFIGURATION_FILE_OPTIONS = (('stateFile', 'stateFile'), ('jiraIssueCacheFile', 'issueCacheFile'),
+                                  ('togglProjectCacheFile', 'projectCacheFile'))
+
+
+def read_configurations(config_files):
+    """Reads all configurations, a configuration which cannot be read is None. Configurations which share a state or
+    cache file with another configuration are None as well."""
+    configurations = {}
+    for config_file in config_files:
+        try:
+            configurations[config_file] = read_configuration(config_file)
+        except SystemExit:
+            configurations[config_file] = None
+
+    for key, option in PER_CONFIGURATION_FILE_OPTIONS:
+        config_files_by_path = {}
+        for config_file, configuration in configurations.items():
+            if configuration is not None and configuration[key] is not None:
+                config_files_by_path.setdefault(os.path.normcase(configuration[key]), []).append(config_file)
+        for path, shared_config_files in config_files_by_path.items():
+            if len(shared_config_files) > 1:
+                print("The configurations {0} use the same {1} {2}. Please configure a separate file per "
+                      "configuration.".format(", ".join(shared_config_files), option, path))
+                for config_file in shared_config_files:
+                    configurations[config_file] = None
+    return configurations
+
+
+def process_configurations(configurations, parallel_users, full_resync=False, shared_clients=None, stop_event=None,
+                           plan=None):
+    """Processes several configurations, e.g. one per user, in one process and returns a summary per configuration."""
+    global _logger
+    if shared_clients is None:
+        shared_clients = SharedClients()
+
+    def process(config_file):
+        if configurations[config_file] is None:
+            return {"error": "invalid configuration"}
+        try:
+            _logger.info("Processing the time entries of the configuration {0}".format(config_file))
+            return process_time_entries(configurations[config_file], full_resync, shared_clients, stop_event, plan)
+        except Exception as exception:
+            _logger.exception("The time entries of the configuration {0} could not be processed".format(config_file))
+            return {"error": str(exception)}
+
+    with ThreadPoolExecutor(max_workers=max(1, parallel_users)) as executor:
+        return dict(zip(configurations, executor.map(process, configurations)))
+
+
+def run_daemon(configurations, parallel_users, shared_clients, stop_event, full_resync=False):
+    """Processes the configurations again and again until stop_event is set.
+
+    The clients and caches are kept between the cycles. The poll interval is doubled, up to maxPollInterval, as long
+    as there are no new time entries and jittered, so that several daemons do not poll Toggl at the same time.
+    """
+    global _logger
+    configuration = next(configuration for configuration in configurations.values() if configuration is not None)
+    poll_interval = configuration['pollInterval']
+    while not stop_event.is_set():
+        summaries = process_configurations(configurations, parallel_users, full_resync, shared_clients, stop_event)
+        full_resync = False
+        log_summaries(summaries)
+        if shared_clients.metrics is not None:
+            shared_clients.metrics.record_summaries(summaries)
+            shared_clients.metrics.write()
+        if any(summary.get("groups", 0) > 0 for summary in summaries.values()):
+            poll_interval = configuration['pollInterval']
+        else:
+            poll_interval = min(poll_interval * 2, configuration['maxPollInterval'])
+        delay = poll_interval * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+        _logger.debug("Next poll in {0:.0f} seconds".format(delay))
+        stop_event.wait(delay)
+    _logger.info("The daemon has been stopped.")
+
+
+def log_summaries(summaries):
+    global _logger
+    for config_file, summary in summaries.items():
+        if "error" in summary:
+            _logger.error("{0}: failed ({1})".format(config_file, summary["error"]))
         else:
-            grouped_time_entry["time_entries"]
+            _logger.info("{0}: {1} time entries, {2} groups, {3} worklogs, {4} errors".format(
+                config_file, summary["timeEntries"], summary["groups"], summary["worklogs"], summary["errors"]))
 
 
+def main():
+    global _logger
+    config_file_arguments = []
+    full_resync = False
+    daemon = False
+    backfill_from = None
+    plan_file = None
+    execute_plan_file = None
+    parallel_users = DEFAULT_PARALLEL_USERS
+    usage = ("processTimeTrackingEntries.py -c <configurationfile or directory> [-c ...] [--full-resync] "
+             "[--parallel-users <number>] [--daemon] [--backfill <from> [<to>]] [--plan <plan.json|plan.csv>] "
+             "[--execute-plan <plan.json|plan.csv>]")
+    try:
+        # the options may follow the <to> date of --backfill, so the arguments are parsed in the GNU style
+        opts, args = getopt.gnu_getopt(sys.argv[1:], "c:", ["configuration=", "full-resync", "parallel-users=",
+                                                            "daemon", "backfill=", "plan=", "execute-plan="])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-c", "--configuration"):
+            config_file_arguments.append(arg)
+        elif opt == "--full-resync":
+            full_resync = True
+        elif opt == "--parallel-users":
+            parallel_users = int(arg)
+        elif opt == "--daemon":
+            daemon = True
+        elif opt == "--backfill":
+            backfill_from = arg
+        elif opt == "--plan":
+            plan_file = arg
+        elif opt == "--execute-plan":
+            execute_plan_file = arg
+    # the only positional argument is the <to> date of --backfill
+    if len(args) > (1 if backfill_from is not None else 0):
+        print(usage)
+        sys.exit(2)
+    # a plan is made or executed once, and not both at the same time
+    if (daemon and (plan_file is not None or execute_plan_file is not None)) or (
+            plan_file is not None and execute_plan_file is not None):
+        print(usage)
+        sys.exit(2)
+
+    config_files = read_configuration_files(config_file_arguments or ["config.ini"])
+    if len(config_files) == 0:
+        print("No configuration files found in {0}".format(", ".join(config_file_arguments)))
+        sys.exit(2)
+
+    if len(config_files) == 1:
+        configurations = {config_files[0]: read_configuration(config_files[0])}
+    else:
+        configurations = read_configurations(config_files)
+        if all(configuration is None for configuration in configurations.values()):
+            sys.exit(2)
+
+    # logging is configured once per process, so the logging options of the first configuration are used
+    configuration = next(configuration for configuration in configurations.values() if configuration is not None)
+
+    if (configuration.get('useLogFile') == True):
+        logging.basicConfig(filename=configuration['logFile'], level=configuration['logLevel'])
+    else:
+        logging.basicConfig(level=configuration['logLevel'])
+
+    # the run metrics are collected for the whole process, so the metrics files of the first configuration are used
+    shared_clients = SharedClients(configuration['metricsFile'], configuration['prometheusFile'])
+    summaries = None
+    # in planning mode nothing is written, the planned worklogs are collected for the plan file instead
+    plan = [] if plan_file is not None else None
+    if execute_plan_file is not None:
+        summaries = execute_plans(configurations, read_plan(execute_plan_file), shared_clients)
+        log_summaries(summaries)
+    elif backfill_from is not None:
+        start = parse_backfill_date(backfill_from)
+        end = parse_backfill_date(args[0], is_end=True) if len(args) > 0 else datetime.datetime.now(datetime.UTC)
+        summaries = {config_file: backfill_time_entries(configuration, start, end, shared_clients, plan=plan)
+                     for config_file, configuration in configurations.items() if configuration is not None}
+        log_summaries(summaries)
+    elif daemon:
+        stop_event = threading.Event()
+        # the worklogs which are being inserted are finished, the remaining ones are left for the next start
+        signal.signal(signal.SIGTERM, lambda signal_number, frame: stop_event.set())
+        signal.signal(signal.SIGINT, lambda signal_number, frame: stop_event.set())
+        run_daemon(configurations, parallel_users, shared_clients, stop_event, full_resync)
+    elif len(config_files) == 1:
+        summaries = {config_files[0]: process_time_entries(configuration, full_resync, shared_clients, plan=plan)}
+    else:
+        summaries = process_configurations(configurations, parallel_users, full_resync, shared_clients, plan=plan)
+        log_summaries(summaries)
+    if plan is not None:
+        write_plan(plan_file, plan)
+        _logger.info("{0} worklogs and {1} taggings have been planned in {2}".format(
+            sum(1 for planned_worklog in plan if planned_worklog.action == 'worklog'),
+            sum(1 for planned_worklog in plan if planned_worklog.action != 'worklog'), plan_file))
+    if shared_clients.metrics is not None and summaries is not None:
+        shared_clients.metrics.record_summaries(summaries)
+        shared_clients.metrics.write()
+    shared_clients.http_statistics.log_summary()
+    shared_clients.http_statistics.log_startup_timing()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,90 @@
+"""Compares the grouping of the time entries with dateutil, string keys and a dict per entry to the typed entry model.
+
+Usage: python test/benchmark_entry_model.py [number of time entries, default 100000]
+"""
+import datetime
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import processTimeTrackingEntries
+
+
+def create_time_entries(count):
+    start = datetime.datetime(2024, 1, 1, 8, tzinfo=datetime.UTC)
+    return [{
+        'id': 1000000 + index,
+        'project_id': 4711 + index % 5,
+        'description': 'JIRA-{0} - Development'.format(index // 7 % 10),
+        'start': (start + datetime.timedelta(minutes=5 * index)).strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+        'duration': 900 + index % 3600,
+        'tags': []
+    } for index in range(count)]
+
+
+def group_with_dicts(time_entries, group_time_entries_by):
+    import dateutil.parser
+    grouped_time_entries = {}
+    for time_entry in time_entries:
+        pid = time_entry.get('project_id')
+        description = time_entry['description'] if 'description' in time_entry else ''
+        group_key = str(pid) + "_" + description
+        start_time = dateutil.parser.parse(time_entry['start'])
+        if group_time_entries_by == 'day':
+            group_key = group_key + '_' + str(start_time.timetuple().tm_yday)
+        else:
+            group_key = group_key + '_' + str(start_time.isocalendar()[1])
+        if group_key not in grouped_time_entries:
+            grouped_time_entries[group_key] = {"pid": pid, "description": description, "time_entries": []}
+        grouped_time_entries[group_key]["time_entries"].append({
+            "start_time": start_time,
+            "duration": time_entry['duration'],
+            "id": time_entry['id'],
+            "description": time_entry['description']
+        })
+    return grouped_time_entries
+
+
+def group_with_entry_model(time_entries, group_time_entries_by):
+    grouped_time_entries = {}
+    for time_entry in time_entries:
+        pid = time_entry.get('project_id')
+        description = time_entry['description']
+        start_time = processTimeTrackingEntries.parse_datetime(time_entry['start'])
+        group_key = processTimeTrackingEntries.get_group_key(pid, description, start_time, group_time_entries_by)
+        grouped_time_entry = grouped_time_entries.get(group_key)
+        if grouped_time_entry is None:
+            grouped_time_entry = grouped_time_entries[group_key] = {
+                "pid": pid, "description": description, "time_entries": []}
+        grouped_time_entry["time_entries"].append(
+            processTimeTrackingEntries.TimeEntry(time_entry['id'], start_time, time_entry['duration'], description))
+    return grouped_time_entries
+
+
+def measure(group, time_entries, group_time_entries_by):
+    started = time.perf_counter()
+    group(time_entries, group_time_entries_by)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    grouped_time_entries = group(time_entries, group_time_entries_by)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, retained, peak, len(grouped_time_entries)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    time_entries = create_time_entries(count)
+    for group_time_entries_by in ('day', 'week'):
+        for name, group in (('dicts', group_with_dicts), ('entry model', group_with_entry_model)):
+            elapsed, retained, peak, groups = measure(group, time_entries, group_time_entries_by)
+            print('{0:>5} {1:<12} {2:8.3f} s {3:8.2f} µs/entry {4:8.1f} MiB retained {5:8.1f} MiB peak '
+                  '{6:6} groups'.format(group_time_entries_by, name, elapsed, elapsed / count * 1e6,
+                                        retained / 2 ** 20, peak / 2 ** 20, groups))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Compares the issue key extraction with re.search on every call to the memoized issue key matcher.
+
+Usage: python test/benchmark_issue_key_matcher.py [number of projects, default 5000] [number of time entries,
+default 100000]
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import processTimeTrackingEntries
+
+REGEX = '([A-Z0-9]+-[0-9]+) -.*'
+
+
+def extract_with_search(issue_name, issue_number_regex_expression):
+    jira_issue_number = re.search(issue_number_regex_expression, issue_name)
+    if jira_issue_number:
+        return jira_issue_number.group(1)
+    return None
+
+
+def measure(name, extract_project, extract_description, projects, descriptions):
+    started = time.perf_counter()
+    project_issue_numbers = {project['id']: extract_project(project['name']) for project in projects}
+    projects_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    # the issue key of a group is extracted once for the issue resolution and once for the submission
+    for description in descriptions:
+        extract_description(description)
+        extract_description(description)
+    descriptions_elapsed = time.perf_counter() - started
+    print('{0:<24} {1:8.3f} s for {2} projects {3:8.3f} s for {4} descriptions'.format(
+        name, projects_elapsed, len(project_issue_numbers), descriptions_elapsed, len(descriptions)))
+
+
+def main():
+    project_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    entry_count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    projects = [{'id': index, 'name': 'PRJ{0}-{1} - Project {1}'.format(index % 40, index)}
+                for index in range(project_count)]
+    descriptions = ['OPS-{0} - Support ticket {0}'.format(index % 2000) if index % 3 else 'Daily standup'
+                    for index in range(entry_count)]
+
+    search = lambda value: extract_with_search(value, REGEX)
+    measure('re.search', search, search, projects, descriptions)
+    matcher = processTimeTrackingEntries.IssueKeyMatcher([REGEX], [REGEX])
+    measure('matcher', matcher.match_project_name, matcher.match_description, projects, descriptions)
+    matcher = processTimeTrackingEntries.IssueKeyMatcher(
+        [REGEX], [REGEX, r'\[([A-Z0-9]+-[0-9]+)\]'], ['PRJ{0}'.format(index) for index in range(20)] + ['OPS'])
+    measure('matcher with allowlist', matcher.match_project_name, matcher.match_description, projects,
+            descriptions)
+
+
+if __name__ == '__main__':
+    main()
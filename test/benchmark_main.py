@@ -0,0 +1,177 @@
+"""Runs main() against local fake Toggl and JIRA servers and reports the wall time, the requests per endpoint and
+the peak memory, so that the throughput can be compared between commits.
+
+Usage: python test/benchmark_main.py [--time-entries <number>] [--projects <number>] [--days <number>]
+       [--latency <seconds>] [--toggl-rate-limit <requests per second>] [--jira-rate-limit <requests per second>]
+       [--fetch-engine timeEntries|reports] [--workers <number>] [--json <file>]
+"""
+import collections
+import datetime
+import getopt
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import processTimeTrackingEntries
+from fake_servers import FakeJiraServer, FakeTogglServer
+
+CONFIGURATION = """
+[Common]
+startdate={start_date}
+workers={workers}
+[Logging]
+useLogFile=false
+level=WARNING
+[Jira]
+url={jira_url}
+user=foo
+password=bar
+remainingEstimatePolicy=auto
+rateLimit={jira_client_rate_limit}
+rateLimitBurst=10
+[Toggl]
+apitoken=token
+apiurl={toggl_api_url}
+rateLimit={toggl_client_rate_limit}
+rateLimitBurst=10
+fetchEngine={fetch_engine}
+workspace=123456
+organization=1234567
+regex=([A-Z]+-[0-9]+) -.*
+groupTimeEntriesBy=day
+"""
+
+
+def create_projects(project_count):
+    return [{'id': 1000 + index, 'name': 'PRJ-{0} - Project {0}'.format(index + 1), 'active': True}
+            for index in range(project_count)]
+
+
+def create_time_entries(time_entry_count, project_count, days, start):
+    """Spreads the time entries over the days, every tenth time entry has no project but an issue in the description
+    and every fiftieth can not be assigned to an issue."""
+    time_entries = []
+    for index in range(time_entry_count):
+        started = start + datetime.timedelta(days=index % days, hours=8, minutes=index // days % 600)
+        if index % 50 == 0:
+            project_id, description = None, 'Unassigned work'
+        elif index % 10 == 0:
+            project_id, description = None, 'OPS-{0} - Support'.format(index % 20 + 1)
+        else:
+            project_id, description = 1000 + index % project_count, 'Development'
+        time_entries.append({
+            'id': 100000 + index,
+            'workspace_id': 123456,
+            'project_id': project_id,
+            'description': description,
+            'start': started.strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+            'stop': (started + datetime.timedelta(minutes=25)).strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+            'duration': 25 * 60,
+            'tags': []
+        })
+    return time_entries
+
+
+def run_benchmark(time_entry_count=2000, project_count=200, days=20, latency=0.002, toggl_rate_limit=None,
+                  jira_rate_limit=None, fetch_engine='timeEntries', workers=1):
+    start = datetime.datetime.now(datetime.UTC).replace(hour=0, minute=0, second=0, microsecond=0) - \
+        datetime.timedelta(days=days + 1)
+    issues = ['PRJ-{0}'.format(index + 1) for index in range(project_count)] + \
+        ['OPS-{0}'.format(index + 1) for index in range(20)]
+    with tempfile.TemporaryDirectory() as directory, FakeTogglServer(
+            create_time_entries(time_entry_count, project_count, days, start), create_projects(project_count),
+            latency=latency, rate_limit=toggl_rate_limit, rate_limit_burst=10) as toggl_server, FakeJiraServer(
+            issues, latency=latency, rate_limit=jira_rate_limit, rate_limit_burst=10) as jira_server:
+        config_file = os.path.join(directory, 'config.ini')
+        with open(config_file, 'w') as config:
+            config.write(CONFIGURATION.format(
+                start_date=start.isoformat(), workers=workers, jira_url=jira_server.url,
+                toggl_api_url=toggl_server.api_url, fetch_engine=fetch_engine,
+                # the clients are throttled a little below the limits of the servers, or not at all
+                jira_client_rate_limit=jira_rate_limit * 0.9 if jira_rate_limit else 1000,
+                toggl_client_rate_limit=toggl_rate_limit * 0.9 if toggl_rate_limit else 1000))
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        with mock.patch.object(sys, 'argv', ['processTimeTrackingEntries.py', '-c', config_file]):
+            processTimeTrackingEntries.main()
+        wall_time = time.perf_counter() - started
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        requests = collections.Counter(processTimeTrackingEntries.HttpStatistics.endpoint(method, path)
+                                       for server in (toggl_server, jira_server) for method, path in server.requests)
+        return {
+            'timeEntries': time_entry_count,
+            'projects': project_count,
+            'fetchEngine': fetch_engine,
+            'workers': workers,
+            'wallTime': wall_time,
+            'peakMemory': peak_memory,
+            'requests': dict(sorted(requests.items())),
+            'rateLimitedRequests': toggl_server.rate_limited_requests + jira_server.rate_limited_requests,
+            'worklogs': len(jira_server.worklogs),
+            'taggedTimeEntries': sum(1 for time_entry in toggl_server.time_entries.values() if time_entry['tags'])
+        }
+
+
+def print_result(result):
+    print('{0} time entries, {1} projects, fetch engine {2}, {3} workers'.format(
+        result['timeEntries'], result['projects'], result['fetchEngine'], result['workers']))
+    print('  wall time     {0:10.3f} s'.format(result['wallTime']))
+    print('  peak memory   {0:10.1f} MiB'.format(result['peakMemory'] / 2 ** 20))
+    print('  worklogs      {0:10}'.format(result['worklogs']))
+    print('  tagged        {0:10}'.format(result['taggedTimeEntries']))
+    print('  rate limited  {0:10}'.format(result['rateLimitedRequests']))
+    print('  requests      {0:10}'.format(sum(result['requests'].values())))
+    for endpoint, count in result['requests'].items():
+        print('    {0:8} {1}'.format(count, endpoint))
+
+
+def main():
+    options = {}
+    json_file = None
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "", ["time-entries=", "projects=", "days=", "latency=",
+                                                      "toggl-rate-limit=", "jira-rate-limit=", "fetch-engine=",
+                                                      "workers=", "json="])
+    except getopt.GetoptError:
+        print(__doc__)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "--time-entries":
+            options['time_entry_count'] = int(arg)
+        elif opt == "--projects":
+            options['project_count'] = int(arg)
+        elif opt == "--days":
+            options['days'] = int(arg)
+        elif opt == "--latency":
+            options['latency'] = float(arg)
+        elif opt == "--toggl-rate-limit":
+            options['toggl_rate_limit'] = float(arg)
+        elif opt == "--jira-rate-limit":
+            options['jira_rate_limit'] = float(arg)
+        elif opt == "--fetch-engine":
+            options['fetch_engine'] = arg
+        elif opt == "--workers":
+            options['workers'] = int(arg)
+        elif opt == "--json":
+            json_file = arg
+
+    logging.disable(logging.CRITICAL)
+    result = run_benchmark(**options)
+    print_result(result)
+    if json_file is not None:
+        with open(json_file, 'w', encoding='utf-8') as output:
+            json.dump(result, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+import datetime
+import json
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeServerHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def _inject_failure(self):
+        """Answers with the next injected status code or 429 if the rate limit is exceeded, if any, and delays the
+        response by the configured latency."""
+        server = self.server
+        server.record(self.command, self.path)
+        time.sleep(server.latency)
+        with server.lock:
+            failure = server.failures.pop(0) if server.failures else server.check_rate_limit()
+        if failure is None:
+            return False
+        status, retry_after = failure
+        payload = b'{"error": "injected"}'
+        self.send_response(status)
+        if retry_after is not None:
+            self.send_header('Retry-After', str(retry_after))
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        return True
+
+
+class FakeTogglHandler(FakeServerHandler):
+
+    def do_GET(self):
+        if self._inject_failure():
+            return
+        path, _, query = self.path.partition('?')
+        project = re.fullmatch(r'/api/v9/workspaces/\d+/projects/(\d+)', path)
+        if path == '/api/v9/me/projects':
+            since = urllib.parse.parse_qs(query).get('since')
+            self._send_json(200, [project for project in self.server.projects
+                                  if since is None or project.get('at', 0) >= int(since[0])])
+        elif project is not None:
+            projects = [value for value in self.server.projects if value['id'] == int(project.group(1))]
+            self._send_json(200 if projects else 404, projects[0] if projects else {'error': 'not found'})
+        elif path == '/api/v9/me/time_entries':
+            # with since, only the time entries modified since then, time entries without "at" are always returned,
+            # with start_date and end_date only the time entries started in between
+            parameters = urllib.parse.parse_qs(query)
+            since = parameters.get('since')
+            start_date, end_date = ([datetime.datetime.fromisoformat(value) for value in parameters[name]]
+                                    if name in parameters else None for name in ('start_date', 'end_date'))
+            self._send_json(200, [time_entry for time_entry in self.server.time_entries.values()
+                                  if (since is None or time_entry.get('at') is None
+                                      or datetime.datetime.fromisoformat(time_entry['at']).timestamp() >= int(since[0]))
+                                  and (start_date is None
+                                       or start_date[0] <= datetime.datetime.fromisoformat(time_entry['start']))
+                                  and (end_date is None
+                                       or datetime.datetime.fromisoformat(time_entry['start']) < end_date[0])])
+        elif path == '/api/v9/me/time_entries/current':
+            self._send_json(200, next((time_entry for time_entry in self.server.time_entries.values()
+                                       if time_entry['duration'] < 0), None))
+        elif path == '/api/v9/me':
+            self._send_json(200, {'id': self.server.user_id})
+        elif re.fullmatch(r'/api/v9/workspaces/\d+/tags', path):
+            self._send_json(200, self.server.get_tags())
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self._inject_failure():
+            return
+        if re.fullmatch(r'/reports/api/v3/workspace/\d+/search/time_entries', self.path) is None:
+            self._send_json(404, {'error': 'not found'})
+            return
+        body = self._read_json()
+        rows = self.server.get_report_rows()
+        offset = body.get('first_row_number', 1) - 1
+        page_size = body.get('page_size', 50)
+        headers = {}
+        if offset + page_size < len(rows):
+            headers = {'X-Next-ID': str(rows[offset + page_size]['time_entries'][0]['id']),
+                       'X-Next-Row-Number': str(offset + page_size + 1)}
+        self._send_json(200, rows[offset:offset + page_size], headers)
+
+    def do_PATCH(self):
+        if self._inject_failure():
+            return
+        server = self.server
+        match = re.fullmatch(r'/api/v9/workspaces/(\d+)/time_entries/([\d,]+)', self.path)
+        if match is None:
+            self._send_json(404, {'error': 'not found'})
+            return
+        operations = self._read_json()
+        success = []
+        failure = []
+        for time_entry_id in (int(value) for value in match.group(2).split(',')):
+            time_entry = server.time_entries.get(time_entry_id)
+            if time_entry is None:
+                failure.append({'id': time_entry_id, 'message': 'Time entry not found'})
+                continue
+            for operation in operations:
+                if operation['op'] == 'add' and operation['path'] == '/tags':
+                    tags = time_entry['tags'] = time_entry.get('tags') or []
+                    tags.extend(tag for tag in operation['value'] if tag not in tags)
+                elif operation['op'] == 'remove' and operation['path'] == '/tags':
+                    time_entry['tags'] = [tag for tag in time_entry.get('tags') or [] if tag not in operation['value']]
+            if time_entry.get('at') is not None:
+                time_entry['at'] = datetime.datetime.now(datetime.UTC).isoformat()
+            success.append(time_entry_id)
+        self._send_json(200, {'success': success, 'failure': failure})
+
+
+class FakeServer(ThreadingHTTPServer):
+    """Records every request it receives, delays the responses by latency seconds and answers with 429 when more
+    than rate_limit requests per second (bursts of up to rate_limit_burst requests) are sent."""
+
+    daemon_threads = True
+
+    def __init__(self, handler_class, latency=0.0, rate_limit=None, rate_limit_burst=1):
+        super().__init__(('127.0.0.1', 0), handler_class)
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_limit_burst = max(1, rate_limit_burst)
+        self.rate_limited_requests = 0
+        self._tokens = self.rate_limit_burst
+        self._updated = time.monotonic()
+        # (status code, Retry-After) answered instead of the next requests
+        self.failures = []
+        self.requests = []
+        self.lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+
+    def check_rate_limit(self):
+        """Returns (429, Retry-After) if the request exceeds the rate limit, must be called with the lock held."""
+        if self.rate_limit is None:
+            return None
+        now = time.monotonic()
+        self._tokens = min(self.rate_limit_burst, self._tokens + (now - self._updated) * self.rate_limit)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return None
+        self.rate_limited_requests += 1
+        return 429, '{0:.3f}'.format((1 - self._tokens) / self.rate_limit)
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:{0}'.format(self.server_address[1])
+
+    def record(self, method, path):
+        with self.lock:
+            self.requests.append((method, path))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeTogglServer(FakeServer):
+    """Local stand-in for the Toggl v9 API and the detailed report of the Reports API v3.
+
+    The report is built from the time entries, unless recorded report rows are given.
+    """
+
+    def __init__(self, time_entries=(), projects=(), latency=0.0, tags=(), report_rows=None, user_id=1,
+                 rate_limit=None, rate_limit_burst=1):
+        super().__init__(FakeTogglHandler, latency, rate_limit, rate_limit_burst)
+        self.time_entries = {time_entry['id']: time_entry for time_entry in time_entries}
+        self.projects = list(projects)
+        self.tags = {tag['name']: tag['id'] for tag in tags}
+        self.report_rows = report_rows
+        self.user_id = user_id
+
+    @property
+    def api_url(self):
+        return self.base_url + '/api/v9'
+
+    def get_tag_id(self, name):
+        with self.lock:
+            return self.tags.setdefault(name, max(self.tags.values(), default=0) + 1)
+
+    def get_tags(self):
+        for time_entry in self.time_entries.values():
+            for tag in time_entry.get('tags') or []:
+                self.get_tag_id(tag)
+        return [{'id': tag_id, 'name': name} for name, tag_id in self.tags.items()]
+
+    def get_report_rows(self):
+        """Groups the stopped time entries by project, description, tags and day like the grouped detailed report."""
+        if self.report_rows is not None:
+            return self.report_rows
+        rows = {}
+        for time_entry in sorted(self.time_entries.values(), key=lambda time_entry: time_entry['start']):
+            if time_entry['duration'] < 0:
+                continue
+            tag_ids = sorted(self.get_tag_id(tag) for tag in time_entry.get('tags') or [])
+            row = rows.setdefault((time_entry.get('project_id'), time_entry.get('description'), tuple(tag_ids),
+                                   time_entry['start'][:10]), {
+                'user_id': self.user_id,
+                'project_id': time_entry.get('project_id'),
+                'description': time_entry.get('description'),
+                'tag_ids': tag_ids,
+                'time_entries': []
+            })
+            row['time_entries'].append({'id': time_entry['id'], 'seconds': time_entry['duration'],
+                                        'start': time_entry['start'], 'stop': time_entry.get('stop')})
+        return [dict(row, row_number=row_number) for row_number, row in enumerate(rows.values(), 1)]
+
+
+class FakeJiraHandler(FakeServerHandler):
+
+    def _send_issue(self, key):
+        self._send_json(200, {'id': str(self.server.issues[key]), 'key': key,
+                              'self': '{0}/rest/api/2/issue/{1}'.format(self.server.base_url, key),
+                              'fields': {'summary': 'Issue ' + key}})
+
+    def do_GET(self):
+        if self._inject_failure():
+            return
+        server = self.server
+        path, _, query = self.path.partition('?')
+        params = urllib.parse.parse_qs(query)
+        issue = re.fullmatch(r'/rest/api/2/issue/([^/]+)', path)
+        worklogs = re.fullmatch(r'/rest/api/2/issue/([^/]+)/worklog', path)
+        if path == '/rest/api/2/serverInfo':
+            self._send_json(200, {'version': '9.4.0', 'versionNumbers': [9, 4, 0], 'deploymentType': 'Server'})
+        elif path == '/rest/api/2/field':
+            self._send_json(200, [{'id': 'summary', 'name': 'Summary', 'custom': False}])
+        elif path == '/rest/api/2/myself':
+            self._send_json(200, {'name': server.user, 'key': server.user})
+        elif path == '/rest/api/2/search':
+            jql = params['jql'][0]
+            if 'worklogAuthor' in jql:
+                keys = sorted({worklog['issue'] for worklog in server.worklogs.values()})
+            else:
+                keys = [key for key in re.findall(r'"([^"]+)"', jql) if key in server.issues]
+            self._send_json(200, {'startAt': 0, 'maxResults': len(keys), 'total': len(keys), 'issues': [
+                {'id': str(server.issues[key]), 'key': key, 'fields': {'summary': 'Issue ' + key}} for key in keys]})
+        elif issue is not None and issue.group(1) in server.issues:
+            self._send_issue(issue.group(1))
+        elif worklogs is not None and worklogs.group(1) in server.issues:
+            issue_worklogs = [server.get_worklog(worklog_id) for worklog_id, worklog in server.worklogs.items()
+                              if worklog['issue'] == worklogs.group(1)]
+            self._send_json(200, {'startAt': 0, 'maxResults': len(issue_worklogs), 'total': len(issue_worklogs),
+                                  'worklogs': issue_worklogs})
+        elif path == '/rest/api/2/worklog/updated':
+            self._send_json(200, {'values': [{'worklogId': worklog_id} for worklog_id in server.worklogs],
+                                  'lastPage': True})
+        else:
+            self._send_json(404, {'errorMessages': ['Issue does not exist or you do not have permission to see it.'],
+                                  'errors': {}})
+
+    def do_POST(self):
+        if self._inject_failure():
+            return
+        server = self.server
+        path = self.path.split('?', 1)[0]
+        worklogs = re.fullmatch(r'/rest/api/2/issue/([^/]+)/worklog', path)
+        if worklogs is not None and worklogs.group(1) in server.issues:
+            self._send_json(201, server.add_worklog(worklogs.group(1), self._read_json()))
+        elif path == '/rest/api/2/worklog/list':
+            self._send_json(200, [server.get_worklog(worklog_id) for worklog_id in self._read_json()['ids']
+                                  if worklog_id in server.worklogs])
+        else:
+            self._send_json(404, {'errorMessages': ['Issue does not exist or you do not have permission to see it.'],
+                                  'errors': {}})
+
+
+class FakeJiraServer(FakeServer):
+    """Local stand-in for the JIRA REST API (version 2) with the resources used to look up issues and to insert and
+    find worklogs."""
+
+    def __init__(self, issues=(), latency=0.0, rate_limit=None, rate_limit_burst=1, user='foo'):
+        super().__init__(FakeJiraHandler, latency, rate_limit, rate_limit_burst)
+        self.issues = {key: 10000 + index for index, key in enumerate(issues)}
+        self.user = user
+        self.worklogs = {}
+
+    @property
+    def url(self):
+        return self.base_url
+
+    def add_worklog(self, key, worklog):
+        with self.lock:
+            worklog_id = len(self.worklogs) + 1
+            self.worklogs[worklog_id] = {
+                'issue': key,
+                'started': worklog['started'],
+                'timeSpentSeconds': int(worklog['timeSpentSeconds']) if 'timeSpentSeconds' in worklog else
+                parse_time_spent(worklog['timeSpent']),
+                'comment': worklog.get('comment')
+            }
+        return self.get_worklog(worklog_id)
+
+    def get_worklog(self, worklog_id):
+        worklog = self.worklogs[worklog_id]
+        return {'id': str(worklog_id), 'issueId': str(self.issues[worklog['issue']]),
+                'self': '{0}/rest/api/2/issue/{1}/worklog/{2}'.format(self.base_url, worklog['issue'], worklog_id),
+                'author': {'name': self.user, 'key': self.user}, 'started': worklog['started'],
+                'timeSpentSeconds': worklog['timeSpentSeconds'], 'comment': worklog['comment'],
+                'updated': datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%dT%H:%M:%S.000+0000')}
+
+
+def parse_time_spent(time_spent):
+    units = {'w': 5 * 8 * 3600, 'd': 8 * 3600, 'h': 3600, 'm': 60}
+    return sum(int(value) * units[unit] for value, unit in re.findall(r'(\d+)([wdhm])', time_spent))
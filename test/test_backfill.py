@@ -0,0 +1,116 @@
+import datetime
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import processTimeTrackingEntries
+from test_no_op_run import CONFIGURATION
+from test_duplicate_detection import FakeBulkWorklogJira
+from test_state_store import FakeToggl
+
+
+def utc(*args):
+    return datetime.datetime(*args, tzinfo=datetime.UTC)
+
+
+class BackfillTest(unittest.TestCase):
+
+    def test_chunks_are_aligned_to_days(self):
+        chunks = processTimeTrackingEntries.get_backfill_chunks(utc(2024, 1, 1, 12), utc(2024, 1, 10), 'day', 4)
+        self.assertEqual(chunks, [(utc(2024, 1, 1, 12), utc(2024, 1, 5)), (utc(2024, 1, 5), utc(2024, 1, 9)),
+                                  (utc(2024, 1, 9), utc(2024, 1, 10))])
+
+    def test_chunks_are_aligned_to_weeks(self):
+        # 2024-01-03 is a Wednesday, the weeks start on Monday
+        chunks = processTimeTrackingEntries.get_backfill_chunks(utc(2024, 1, 3), utc(2024, 1, 31), 'week', 10)
+        self.assertEqual(chunks, [(utc(2024, 1, 3), utc(2024, 1, 15)), (utc(2024, 1, 15), utc(2024, 1, 29)),
+                                  (utc(2024, 1, 29), utc(2024, 1, 31))])
+
+    def test_end_date_includes_the_whole_day(self):
+        self.assertEqual(processTimeTrackingEntries.parse_backfill_date('2024-01-31', is_end=True), utc(2024, 2, 1))
+        self.assertEqual(processTimeTrackingEntries.parse_backfill_date('2024-01-31T12:00:00+00:00', is_end=True),
+                         utc(2024, 1, 31, 12))
+
+    def test_backfill_is_resumed_after_the_last_processed_chunk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            configuration = {'configFile': 'config.ini', 'stateFile': os.path.join(directory, 'state.sqlite'),
+                             'groupTimeEntriesBy': 'day', 'backfillChunkDays': 7, 'backfillFetchWorkers': 2,
+                             'duplicateCheck': 'skip'}
+            toggl = FakeToggl([])
+            jira = FakeBulkWorklogJira({'JIRA-1'}, [])
+            shared_clients = processTimeTrackingEntries.SharedClients()
+            shared_clients.get_toggl_client = lambda configuration: toggl
+            shared_clients.get_jira_client = lambda configuration: jira
+            stop_event = threading.Event()
+            submitted = []
+            indexes = []
+
+            def submit_time_entries(configuration, time_entries, toggl, shared_clients, state_store, stop_event,
+                                    plan=None, existing_worklogs=None):
+                submitted.append(time_entries)
+                indexes.append(existing_worklogs)
+                if len(submitted) == 2:
+                    stop_event.set()
+                return {"timeEntries": 0, "groups": 0, "worklogs": 0, "errors": 0}
+
+            with mock.patch.object(processTimeTrackingEntries, 'submit_time_entries', submit_time_entries):
+                processTimeTrackingEntries.backfill_time_entries(configuration, utc(2024, 1, 1), utc(2024, 1, 29),
+                                                                 shared_clients, stop_event)
+                self.assertEqual(len(submitted), 2)
+                toggl.requests.clear()
+                summary = processTimeTrackingEntries.backfill_time_entries(configuration, utc(2024, 1, 1),
+                                                                           utc(2024, 1, 29), shared_clients)
+            self.assertEqual(summary["chunks"], 3)
+            # the existing worklogs are fetched once per backfill for the remaining range, not per chunk
+            self.assertEqual(jira.searches, [
+                'worklogAuthor = currentUser() AND worklogDate >= "2023-12-31" AND worklogDate <= "2024-01-30"',
+                'worklogAuthor = currentUser() AND worklogDate >= "2024-01-07" AND worklogDate <= "2024-01-30"'])
+            self.assertIs(indexes[2], indexes[4])
+            self.assertEqual([start for request, start, end in toggl.requests],
+                             [chunk_start.isoformat() for chunk_start in
+                              (utc(2024, 1, 8), utc(2024, 1, 15), utc(2024, 1, 22))])
+
+
+class BackfillOptionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.config_file = os.path.join(self.directory.name, 'config.ini')
+        with open(self.config_file, 'w') as config:
+            config.write(CONFIGURATION.format(api_url='http://127.0.0.1:9/api/v9'))
+        self.plan_file = os.path.join(self.directory.name, 'plan.csv')
+        self.backfills = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_main(self, *arguments):
+        def backfill_time_entries(configuration, start, end, shared_clients=None, stop_event=None, plan=None):
+            self.backfills.append((start, end, plan))
+            return {"timeEntries": 0, "groups": 0, "worklogs": 0, "errors": 0, "chunks": 0}
+
+        with mock.patch.object(sys, 'argv', ['processTimeTrackingEntries.py', '-c', self.config_file] +
+                               list(arguments)), \
+                mock.patch.object(processTimeTrackingEntries, 'backfill_time_entries', backfill_time_entries):
+            processTimeTrackingEntries.main()
+
+    def test_options_after_the_end_date_are_parsed(self):
+        self.run_main('--backfill', '2024-01-01', '2024-12-31', '--plan', self.plan_file)
+        self.assertEqual(self.backfills, [(utc(2024, 1, 1), utc(2025, 1, 1), [])])
+        self.assertTrue(os.path.exists(self.plan_file))
+
+    def test_unexpected_arguments_are_rejected(self):
+        for arguments in (('--backfill', '2024-01-01', '2024-12-31', '2025-01-01'), ('2024-12-31',)):
+            with self.assertRaises(SystemExit) as raised:
+                self.run_main(*arguments)
+            self.assertEqual(raised.exception.code, 2)
+        self.assertEqual(self.backfills, [])
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import processTimeTrackingEntries
+from test_worklog_submission import FakeJira
+
+CONFIGURATION = """
+[Common]
+startdate=2017-03-29T15:00:00+02:00
+[Logging]
+useLogFile=false
+level=DEBUG
+[Jira]
+url={jira_url}
+user={user}
+password=bar
+remainingEstimatePolicy=auto
+[Toggl]
+apitoken={user}-token
+workspace=123456
+organization=1234567
+regex=([A-Z]+-[0-9]+) -.*
+groupTimeEntriesBy=day
+"""
+
+
+class BatchModeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        for user, jira_url in (('alice', 'https://jira.example.com'), ('bob', 'https://jira.example.com'),
+                               ('carol', 'https://other-jira.example.com')):
+            with open(os.path.join(self.directory.name, user + '.ini'), 'w') as config_file:
+                config_file.write(CONFIGURATION.format(user=user, jira_url=jira_url))
+        with open(os.path.join(self.directory.name, 'broken.ini'), 'w') as config_file:
+            config_file.write('[Common]\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def config_file(self, name):
+        return os.path.join(self.directory.name, name + '.ini')
+
+    def test_directory_is_expanded_to_configuration_files(self):
+        self.assertEqual(
+            processTimeTrackingEntries.read_configuration_files([self.directory.name, 'config.ini']),
+            [self.config_file(name) for name in ('alice', 'bob', 'broken', 'carol')] + ['config.ini'])
+
+    def test_summary_per_configuration(self):
+        def process_time_entries(configuration, full_resync, shared_clients, stop_event, plan=None):
+            if configuration['jiraUser'] == 'bob':
+                raise ValueError('JIRA is not available')
+            return {"timeEntries": 3, "groups": 2, "worklogs": 2, "errors": 0}
+
+        with mock.patch.object(processTimeTrackingEntries, 'process_time_entries', process_time_entries):
+            summaries = processTimeTrackingEntries.process_configurations(
+                processTimeTrackingEntries.read_configurations(
+                    processTimeTrackingEntries.read_configuration_files([self.directory.name])), 2)
+        self.assertEqual(summaries[self.config_file('alice')]["worklogs"], 2)
+        self.assertEqual(summaries[self.config_file('bob')], {"error": "JIRA is not available"})
+        self.assertIn("error", summaries[self.config_file('broken')])
+        self.assertEqual(summaries[self.config_file('carol')]["worklogs"], 2)
+
+    def test_state_and_cache_files_are_not_shared(self):
+        for name, options in (('dave', 'stateFile=state.sqlite'), ('erin', 'stateFile=state.sqlite'),
+                              ('frank', 'stateFile=frank.sqlite')):
+            with open(self.config_file(name), 'w') as config_file:
+                config_file.write(CONFIGURATION.format(user=name, jira_url='https://jira.example.com').replace(
+                    '[Common]\n', '[Common]\n' + options + '\n'))
+        configurations = processTimeTrackingEntries.read_configurations(
+            [self.config_file(name) for name in ('alice', 'bob', 'dave', 'erin', 'frank')])
+        self.assertEqual([name for name in ('alice', 'bob', 'dave', 'erin', 'frank')
+                          if configurations[self.config_file(name)] is None], ['dave', 'erin'])
+
+    def test_adapters_are_shared_per_jira_url(self):
+        shared_clients = processTimeTrackingEntries.SharedClients()
+        alice, bob, carol = (processTimeTrackingEntries.read_configuration(self.config_file(name))
+                             for name in ('alice', 'bob', 'carol'))
+        self.assertIs(shared_clients.get_jira_adapter(alice), shared_clients.get_jira_adapter(bob))
+        self.assertIsNot(shared_clients.get_jira_adapter(alice), shared_clients.get_jira_adapter(carol))
+        self.assertIsNot(shared_clients.get_toggl_adapter(alice), shared_clients.get_toggl_adapter(bob))
+        self.assertIs(shared_clients.get_validated_issues(alice), shared_clients.get_validated_issues(bob))
+
+    def test_validated_issues_are_shared(self):
+        validated_issues = {}
+        processTimeTrackingEntries.JiraIssueResolver(FakeJira({'JIRA-1'}), validated_issues=validated_issues).resolve(
+            ['JIRA-1', 'JIRA-2'])
+        jira = FakeJira({'JIRA-1'})
+        resolver = processTimeTrackingEntries.JiraIssueResolver(jira, validated_issues=validated_issues)
+        self.assertEqual(resolver.get('JIRA-1'), 'JIRA-1')
+        self.assertEqual(jira.searches, [])
+        self.assertIsNone(resolver.get('JIRA-2'))
+        self.assertEqual(len(jira.searches), 1)
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+import datetime
+import unittest
+from benchmark_main import create_time_entries, run_benchmark
+
+
+class BenchmarkMainTest(unittest.TestCase):
+    """Runs the benchmark harness with a small volume, so that main() is covered end to end against the fake
+    servers."""
+
+    def test_all_time_entries_are_processed(self):
+        for fetch_engine in ('timeEntries', 'reports'):
+            result = run_benchmark(time_entry_count=120, project_count=10, days=3, latency=0.0,
+                                   jira_rate_limit=500, fetch_engine=fetch_engine, workers=2)
+            # one worklog per day and issue, the unassigned work is tagged as error
+            self.assertEqual(result['worklogs'], len(
+                {(time_entry['start'][:10], time_entry['project_id'], time_entry['description']) for time_entry in
+                 create_time_entries(120, 10, 3, datetime.datetime(2024, 1, 1, tzinfo=datetime.UTC))
+                 if time_entry['description'] != 'Unassigned work'}))
+            self.assertEqual(result['taggedTimeEntries'], 120)
+            self.assertEqual(result['requests']['POST /rest/api/2/issue/{id}/worklog'], result['worklogs'])
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import os
+import tempfile
+import threading
+import unittest
+import urllib.parse
+from unittest import mock
+import processTimeTrackingEntries
+from fake_servers import FakeTogglServer
+from test_no_op_run import CONFIGURATION
+from test_project_cache import FakeProjectToggl
+from test_worklog_submission import FakeJira, FakeTagger, create_group
+
+
+class CountingStopEvent(threading.Event):
+    """Stops the daemon after the given number of cycles and records the delays between the cycles."""
+
+    def __init__(self, cycles):
+        super().__init__()
+        self.cycles = cycles
+        self.delays = []
+
+    def wait(self, timeout=None):
+        self.delays.append(timeout)
+        if len(self.delays) >= self.cycles:
+            self.set()
+        return self.is_set()
+
+
+class DaemonModeTest(unittest.TestCase):
+
+    configuration = {
+        'configFile': 'config.ini',
+        'pollInterval': 100,
+        'maxPollInterval': 350,
+        'issue_number_regex_expression': '([A-Z]+-[0-9]+) -.*',
+        'jiraRePolicy': 'auto',
+        'workers': 1
+    }
+
+    def test_poll_interval_backs_off_while_nothing_changes(self):
+        summaries = iter({"timeEntries": groups, "groups": groups, "worklogs": groups, "errors": 0}
+                         for groups in [0, 0, 0, 2, 0])
+        stop_event = CountingStopEvent(5)
+        with mock.patch.object(processTimeTrackingEntries, 'process_configurations',
+                               lambda *args: {'config.ini': next(summaries)}):
+            processTimeTrackingEntries.run_daemon({'config.ini': self.configuration}, 1,
+                                                  processTimeTrackingEntries.SharedClients(), stop_event)
+        for delay, expected in zip(stop_event.delays, [200, 350, 350, 100, 200]):
+            self.assertAlmostEqual(delay, expected, delta=expected * processTimeTrackingEntries.POLL_JITTER)
+
+    def test_start_date_moves_with_every_cycle(self):
+        clock = [1704700800.0]
+
+        class NextDayStopEvent(CountingStopEvent):
+
+            def wait(self, timeout=None):
+                clock[0] += 86400
+                return super().wait(timeout)
+
+        with tempfile.TemporaryDirectory() as directory, FakeTogglServer([]) as server:
+            config_file = os.path.join(directory, 'config.ini')
+            with open(config_file, 'w') as config:
+                config.write(CONFIGURATION.format(api_url=server.api_url).replace(
+                    'startdate=2017-03-29T15:00:00+02:00', 'maxdays=7'))
+            configuration = processTimeTrackingEntries.read_configuration(config_file)
+            with mock.patch.object(processTimeTrackingEntries.time, 'time', lambda: clock[0]):
+                processTimeTrackingEntries.run_daemon({config_file: configuration}, 1,
+                                                      processTimeTrackingEntries.SharedClients(), NextDayStopEvent(2))
+        # the range of each cycle is fetched in chunks, which are fetched concurrently
+        self.assertEqual(sorted((query['start_date'], query['end_date'])
+                                for query in (urllib.parse.parse_qs(urllib.parse.urlsplit(path).query)
+                                              for method, path in server.requests)),
+                         [(['2024-01-01T08:00:00+02:00'], ['2024-01-08T00:00:00+00:00']),
+                          (['2024-01-02T08:00:00+02:00'], ['2024-01-09T00:00:00+00:00']),
+                          (['2024-01-08T00:00:00+00:00'], ['2024-01-08T08:00:00+00:00']),
+                          (['2024-01-09T00:00:00+00:00'], ['2024-01-09T08:00:00+00:00'])])
+
+    def test_projects_are_only_fetched_for_unknown_project_ids(self):
+        shared_clients = processTimeTrackingEntries.SharedClients()
+        toggl = FakeProjectToggl([{'id': 1, 'name': 'JIRA-1 - Project'},
+                                  {'id': 2, 'name': 'Project without issue'}])
+        self.assertEqual(shared_clients.get_project_issue_numbers(self.configuration, toggl, set()), {})
+        self.assertEqual(toggl.requests, [])
+        self.assertEqual(shared_clients.get_project_issue_numbers(self.configuration, toggl, {1}), {1: 'JIRA-1'})
+        shared_clients.get_project_issue_numbers(self.configuration, toggl, {1, 2})
+        self.assertEqual(len(toggl.requests), 1)
+        # the unknown project is fetched by itself and looked for in the changed projects, but only once
+        shared_clients.get_project_issue_numbers(self.configuration, toggl, {3})
+        self.assertEqual(len(toggl.requests), 3)
+        shared_clients.get_project_issue_numbers(self.configuration, toggl, {3})
+        self.assertEqual(len(toggl.requests), 3)
+
+    def test_remaining_groups_are_skipped_after_stop(self):
+        jira = FakeJira({'JIRA-1'})
+        stop_event = threading.Event()
+        stop_event.set()
+        results = processTimeTrackingEntries.submit_worklog_groups(
+            [create_group(4711, 'Meeting', (1, 0, 600))], {4711: 'JIRA-1'}, self.configuration,
+            processTimeTrackingEntries.JiraIssueResolver(jira), jira, FakeTagger(), stop_event=stop_event)
+        self.assertEqual(results, [None])
+        self.assertEqual(jira.added_worklogs, [])
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import datetime
+import json
+import unittest
+import processTimeTrackingEntries
+from types import SimpleNamespace
+from test_worklog_submission import FakeJira, FakeTagger, create_group
+
+
+class FakeBulkWorklogJira(FakeJira):
+    """A fake JIRA which serves the existing worklogs through the bulk worklog resources."""
+
+    def __init__(self, existing_issues, existing_worklogs, page_size=2):
+        super().__init__(existing_issues)
+        self.existing_worklogs = existing_worklogs
+        self.page_size = page_size
+        self.worklog_list_requests = []
+        self._session = SimpleNamespace(post=self._post)
+
+    def search_issues(self, jql_str, maxResults=50, validate_query=True, fields=None):
+        if 'worklogAuthor' not in jql_str:
+            return super().search_issues(jql_str, maxResults, validate_query, fields)
+        self.searches.append(jql_str)
+        return [SimpleNamespace(id=str(10000 + index), key=key)
+                for index, key in enumerate(sorted(self.existing_issues))]
+
+    def myself(self):
+        return {'accountId': 'me'}
+
+    def _get_url(self, path):
+        return path
+
+    def _get_json(self, path, params=None):
+        offset = params['since'] if params['since'] < len(self.existing_worklogs) else 0
+        values = [{'worklogId': index} for index in range(offset, min(offset + self.page_size,
+                                                                      len(self.existing_worklogs)))]
+        return {'values': values, 'until': offset + self.page_size,
+                'lastPage': offset + self.page_size >= len(self.existing_worklogs)}
+
+    def _post(self, url, data=None):
+        ids = json.loads(data)['ids']
+        self.worklog_list_requests.append(ids)
+        issue_ids = {key: str(10000 + index) for index, key in enumerate(sorted(self.existing_issues))}
+        worklogs = []
+        for worklog_id in ids:
+            issue, started, time_spent, comment, author = self.existing_worklogs[worklog_id]
+            worklogs.append({'id': str(worklog_id), 'issueId': issue_ids[issue], 'author': {'accountId': author},
+                             'started': started.strftime("%Y-%m-%dT%H:%M:%S.000%z"),
+                             'timeSpentSeconds': int(time_spent.rstrip('m')) * 60, 'comment': comment})
+        return SimpleNamespace(json=lambda: worklogs, raise_for_status=lambda: None)
+
+
+class DuplicateDetectionTest(unittest.TestCase):
+
+    configuration = {
+        'issue_number_regex_expression': '([A-Z]+-[0-9]+) -.*',
+        'jiraRePolicy': 'auto',
+        'workers': 1,
+        'duplicateCheck': 'skip'
+    }
+
+    start = datetime.datetime(2024, 1, 8, 9, tzinfo=datetime.UTC)
+
+    def create_jira(self):
+        return FakeBulkWorklogJira({'JIRA-1', 'JIRA-2'}, [
+            ('JIRA-1', self.start, '30m', 'Meeting', 'me'),
+            ('JIRA-2', self.start, '15m', 'Review', 'me'),
+            ('JIRA-1', self.start + datetime.timedelta(hours=1), '15m', 'Call', 'someone else')
+        ])
+
+    def test_index_contains_worklogs_of_current_user(self):
+        jira = self.create_jira()
+        index = processTimeTrackingEntries.ExistingWorklogIndex.fetch(jira, self.start, self.start)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(jira.worklog_list_requests, [[0, 1, 2]])
+        self.assertTrue(index.contains('JIRA-1', self.start.astimezone(datetime.timezone(datetime.timedelta(hours=1))),
+                                       '30m', 'Meeting '))
+        self.assertFalse(index.contains('JIRA-1', self.start, '45m', 'Meeting'))
+        self.assertFalse(index.contains('JIRA-1', self.start + datetime.timedelta(hours=1), '15m', 'Call'))
+
+    def test_duplicate_is_skipped(self):
+        jira = self.create_jira()
+        tagger = FakeTagger()
+        group = create_group(4711, 'Meeting', (1, 0, 600), (2, 1, 1200))
+        index = processTimeTrackingEntries.ExistingWorklogIndex.fetch(jira, self.start, self.start)
+        self.assertIsNone(processTimeTrackingEntries.submit_worklog_group(
+            group, {4711: 'JIRA-1'}, self.configuration, processTimeTrackingEntries.JiraIssueResolver(jira), jira,
+            tagger, existing_worklogs=index))
+        self.assertEqual(jira.added_worklogs, [])
+        self.assertEqual(tagger.processed, [1, 2])
+
+    def test_duplicate_is_flagged(self):
+        jira = self.create_jira()
+        tagger = FakeTagger()
+        group = create_group(4711, 'Meeting', (1, 0, 1800))
+        index = processTimeTrackingEntries.ExistingWorklogIndex.fetch(jira, self.start, self.start)
+        self.assertFalse(processTimeTrackingEntries.submit_worklog_group(
+            group, {4711: 'JIRA-1'}, dict(self.configuration, duplicateCheck='flag'),
+            processTimeTrackingEntries.JiraIssueResolver(jira), jira, tagger, existing_worklogs=index))
+        self.assertEqual(jira.added_worklogs, [])
+        self.assertEqual(tagger.errors, [1])
+
+    def test_new_worklog_is_inserted(self):
+        jira = self.create_jira()
+        tagger = FakeTagger()
+        group = create_group(4711, 'Planning', (1, 0, 1800))
+        index = processTimeTrackingEntries.ExistingWorklogIndex.fetch(jira, self.start, self.start)
+        self.assertTrue(processTimeTrackingEntries.submit_worklog_group(
+            group, {4711: 'JIRA-1'}, self.configuration, processTimeTrackingEntries.JiraIssueResolver(jira), jira,
+            tagger, existing_worklogs=index))
+        self.assertEqual(len(jira.added_worklogs), 1)
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+import processTimeTrackingEntries
+from fake_servers import FakeTogglServer
+from test_worklog_submission import FakeJira
+
+FIXTURES = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'fixtures')
+
+CONFIGURATION = """
+[Common]
+startdate=2024-01-01T00:00:00+00:00
+[Logging]
+useLogFile=false
+level=DEBUG
+[Jira]
+url=https://jira.example.com
+user=foo
+password=bar
+remainingEstimatePolicy=auto
+[Toggl]
+apitoken=token
+apiurl={api_url}
+rateLimit=1000
+rateLimitBurst=100
+fetchEngine={fetch_engine}
+workspace=123456
+organization=1234567
+regex=([A-Z]+-[0-9]+) -.*
+groupTimeEntriesBy={group_by}
+"""
+
+PROJECTS = [{'id': 201, 'name': 'PRJ-1 - Development'}, {'id': 202, 'name': 'PRJ-2 - Reviews'}]
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as fixture:
+        return json.load(fixture)
+
+
+class FetchEngineTest(unittest.TestCase):
+    """Runs the recorded time entries and the recorded report of the same time entries through both fetch engines."""
+
+    def run_fetch_engine(self, fetch_engine, group_by='day'):
+        report = read_fixture('toggl_report.json')
+        jira = FakeJira({'PRJ-1', 'PRJ-2', 'OPS-7'})
+        with tempfile.TemporaryDirectory() as directory, FakeTogglServer(
+                read_fixture('toggl_time_entries.json'), PROJECTS, tags=report['tags'], report_rows=report['rows'],
+                user_id=5000001) as server:
+            config_file = os.path.join(directory, 'config.ini')
+            with open(config_file, 'w') as config:
+                config.write(CONFIGURATION.format(api_url=server.api_url, fetch_engine=fetch_engine,
+                                                  group_by=group_by))
+            shared_clients = processTimeTrackingEntries.SharedClients()
+            with mock.patch.object(shared_clients, 'get_jira_client', return_value=jira):
+                summary = processTimeTrackingEntries.process_time_entries(
+                    processTimeTrackingEntries.read_configuration(config_file), shared_clients=shared_clients)
+            tags = {time_entry_id: sorted(time_entry['tags']) for time_entry_id, time_entry in
+                    server.time_entries.items()}
+            paths = [path.split('?')[0] for method, path in server.requests]
+        return sorted(jira.added_worklogs), tags, summary, paths
+
+    def test_both_fetch_engines_insert_the_same_worklogs(self):
+        for group_by in ('day', 'week'):
+            worklogs, tags, summary, paths = self.run_fetch_engine('timeEntries', group_by)
+            self.assertNotIn('/reports/api/v3/workspace/123456/search/time_entries', paths)
+            self.assertEqual(self.run_fetch_engine('reports', group_by)[:3], (worklogs, tags, summary))
+
+    def test_worklogs_of_recorded_time_entries(self):
+        worklogs, tags, summary, paths = self.run_fetch_engine('reports')
+        self.assertEqual([(issue, started.isoformat(), time_spent) for issue, started, time_spent, comment in worklogs],
+                         [('OPS-7', '2024-01-08T10:00:00+00:00', '30m'), ('OPS-7', '2024-01-09T09:00:00+00:00', '15m'),
+                          ('PRJ-1', '2024-01-08T08:00:00+00:00', '150m'), ('PRJ-2', '2024-01-08T15:00:00+00:00', '15m'),
+                          ('PRJ-2', '2024-01-09T14:00:00+00:00', '60m')])
+        self.assertEqual(tags[3006], ['jiraerror'])
+        self.assertEqual(tags[3007], [])
+        self.assertEqual(tags[3008], [])
+        self.assertNotIn('/api/v9/me/time_entries', paths)
+
+    def test_report_pages_are_fetched(self):
+        time_entries = read_fixture('toggl_time_entries.json')
+        with FakeTogglServer(time_entries) as server:
+            toggl = processTimeTrackingEntries.TogglClient(server.api_url, 'token', 123456)
+            report_time_entries = toggl.get_report_time_entries('2024-01-08T00:00:00+00:00',
+                                                                '2024-01-10T00:00:00+00:00', page_size=2)
+            searches = [path for method, path in server.requests if method == 'POST']
+        self.assertEqual(sorted(time_entry['id'] for time_entry in report_time_entries),
+                         sorted(time_entry['id'] for time_entry in time_entries))
+        self.assertEqual(len(searches), 5)
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import time
+import unittest
+import processTimeTrackingEntries
+from fake_servers import FakeTogglServer
+
+
+class HttpTransportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeTogglServer(projects=[{'id': 1, 'name': 'JIRA-1 - Project'}])
+        self.server.__enter__()
+        self.statistics = processTimeTrackingEntries.HttpStatistics()
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+
+    def create_client(self, **adapter_options):
+        adapter_options.setdefault('backoff_factor', 0.01)
+        adapter = processTimeTrackingEntries.ThrottledHTTPAdapter(statistics=self.statistics, **adapter_options)
+        return processTimeTrackingEntries.TogglClient(self.server.api_url, 'token', 123456, adapter)
+
+    def test_throttled_request_is_retried_after_retry_after(self):
+        self.server.failures = [(429, 1)]
+        started = time.monotonic()
+        self.assertEqual(self.create_client().get('/me/projects'), [{'id': 1, 'name': 'JIRA-1 - Project'}])
+        self.assertGreaterEqual(time.monotonic() - started, 1)
+        self.assertEqual(len(self.server.requests), 2)
+        statistics = self.statistics.endpoints['GET /api/v9/me/projects']
+        self.assertEqual((statistics['requests'], statistics['retries'], statistics['errors']), (2, 1, 1))
+
+    def test_server_errors_are_retried_with_backoff(self):
+        self.server.failures = [(503, None), (502, None)]
+        self.assertEqual(len(self.create_client().get('/me/projects')), 1)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_retries_are_limited(self):
+        self.server.failures = [(503, None)] * 3
+        with self.assertRaises(processTimeTrackingEntries.requests.HTTPError):
+            self.create_client(max_retries=2).get('/me/projects')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_ssl_errors_are_not_retried(self):
+        adapter = processTimeTrackingEntries.ThrottledHTTPAdapter(statistics=self.statistics, backoff_factor=0.01)
+        client = processTimeTrackingEntries.TogglClient(self.server.api_url.replace('http://', 'https://'), 'token',
+                                                        123456, adapter)
+        started = time.monotonic()
+        with self.assertRaises(processTimeTrackingEntries.requests.exceptions.SSLError):
+            client.get('/me/projects')
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_post_is_not_retried_on_server_errors(self):
+        self.server.failures = [(503, None)]
+        with self.assertRaises(processTimeTrackingEntries.requests.HTTPError):
+            self.create_client().request('POST', '/me/projects')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_requests_are_throttled(self):
+        client = self.create_client(rate_limit=20, burst=1)
+        started = time.monotonic()
+        for _ in range(6):
+            client.get('/me/projects')
+        self.assertGreaterEqual(time.monotonic() - started, 5 / 20)
+
+    def test_latency_is_recorded_per_endpoint(self):
+        self.server.latency = 0.05
+        client = self.create_client()
+        client.patch('/workspaces/123456/time_entries/1,2', [])
+        client.patch('/workspaces/123456/time_entries/3', [])
+        statistics = self.statistics.endpoints['PATCH /api/v9/workspaces/{id}/time_entries/{id}']
+        self.assertEqual(statistics['requests'], 2)
+        self.assertGreaterEqual(statistics['latency'], 0.1)
+
+    def test_api_version_is_kept_in_endpoints(self):
+        endpoint = processTimeTrackingEntries.HttpStatistics.endpoint
+        self.assertEqual(endpoint('GET', 'https://jira.example.com/jira/rest/api/2/issue/PRJ-12/worklog/10001'),
+                         'GET /jira/rest/api/2/issue/{id}/worklog/{id}')
+        self.assertEqual(endpoint('POST', 'https://api.track.toggl.com/reports/api/v3/workspace/123456/search/'
+                                          'time_entries'), 'POST /reports/api/v3/workspace/{id}/search/time_entries')
+        self.assertEqual(endpoint('GET', 'https://api.track.toggl.com/api/v9/me/time_entries?since=1704700800'),
+                         'GET /api/v9/me/time_entries')
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
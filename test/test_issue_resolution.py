@@ -0,0 +1,54 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+import processTimeTrackingEntries
+from test_worklog_submission import FakeJira
+
+
+class IssueResolutionTest(unittest.TestCase):
+
+    def test_issues_are_resolved_in_chunks(self):
+        jira = FakeJira({'JIRA-{0}'.format(number) for number in range(150)})
+        resolver = processTimeTrackingEntries.JiraIssueResolver(jira, chunk_size=100)
+        resolver.resolve('JIRA-{0}'.format(number) for number in list(range(150)) * 3)
+        self.assertEqual(len(jira.searches), 2)
+        self.assertEqual(jira.issue_requests, [])
+        self.assertEqual(resolver.get('JIRA-42'), 'JIRA-42')
+        self.assertEqual(len(jira.searches), 2)
+
+    def test_missing_issue_is_looked_up_once(self):
+        jira = FakeJira({'JIRA-1'})
+        resolver = processTimeTrackingEntries.JiraIssueResolver(jira)
+        with self.assertLogs(processTimeTrackingEntries._logger, level='ERROR') as logs:
+            resolver.resolve(['JIRA-1', 'JIRA-2', 'JIRA-2'])
+            self.assertIsNone(resolver.get('JIRA-2'))
+            self.assertIsNone(resolver.get('JIRA-2'))
+        self.assertEqual(len(logs.output), 1)
+        self.assertEqual(jira.issue_requests, ['JIRA-2'])
+
+    def test_cache_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache_file = os.path.join(directory, 'issue_cache.json')
+            processTimeTrackingEntries.JiraIssueResolver(FakeJira({'JIRA-1'}), cache_file=cache_file).resolve(
+                ['JIRA-1', 'JIRA-2'])
+            with open(cache_file) as cache:
+                self.assertEqual(list(json.load(cache)), ['JIRA-1'])
+
+            jira = FakeJira({'JIRA-1'})
+            self.assertEqual(processTimeTrackingEntries.JiraIssueResolver(jira, cache_file=cache_file).get('JIRA-1'),
+                             'JIRA-1')
+            self.assertEqual(jira.searches, [])
+
+            with open(cache_file, 'w') as cache:
+                json.dump({'JIRA-1': {'key': 'JIRA-1', 'resolved_at': time.time() - 7200}}, cache)
+            processTimeTrackingEntries.JiraIssueResolver(jira, cache_file=cache_file, cache_ttl=3600).get('JIRA-1')
+            self.assertEqual(len(jira.searches), 1)
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -102,6 +102,30 @@ class JiraTest(unittest.TestCase):
         project_list = processTimeTrackingEntries.extract_jira_issue_numbers(project_list_response, self.configuration['issue_number_regex_expression'])
         self.assertEquals(len(project_list), 4)
 
+    def test_issue_extraction_with_several_patterns(self):
+        matcher = processTimeTrackingEntries.IssueKeyMatcher(['([A-Z]+-[0-9]+) -.*'],
+                                                             ['([A-Z]+-[0-9]+) -.*', r'\[([A-Z]+-[0-9]+)\]'])
+        self.assertEqual("JIRA-1", matcher.match_description("JIRA-1 - Meeting"))
+        self.assertEqual("JIRA-2", matcher.match_description("Meeting [JIRA-2]"))
+        self.assertIsNone(matcher.match_project_name("Meeting [JIRA-2]"))
+
+    def test_issue_extraction_with_project_allowlist(self):
+        matcher = processTimeTrackingEntries.IssueKeyMatcher([], [r'([A-Z]+-[0-9]+)'], ['ops'])
+        self.assertEqual("OPS-7", matcher.match_description("ISO-9001 audit for OPS-7"))
+        self.assertIsNone(matcher.match_description("ISO-9001 audit"))
+
+    def test_issue_extraction_is_memoized(self):
+        matcher = processTimeTrackingEntries.IssueKeyMatcher([], ['([A-Z]+-[0-9]+) -.*'])
+        for _ in range(3):
+            matcher.match_description("JIRA-4711 - FooBar")
+        self.assertEqual(matcher.match_description.cache_info().hits, 2)
+
+    def test_issue_key_matcher_from_configuration(self):
+        self.assertIs(processTimeTrackingEntries.get_issue_key_matcher(self.configuration),
+                      self.configuration['issueKeyMatcher'])
+        self.assertEqual("JIRA-4711", processTimeTrackingEntries.get_issue_key_matcher(
+            {'issue_number_regex_expression': '([A-Z]+-[0-9]+) -.*'}).match_description("JIRA-4711 - FooBar"))
+
 
 def main():
     unittest.main()
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import processTimeTrackingEntries
+from fake_servers import FakeTogglServer
+
+CONFIGURATION = """
+[Common]
+startdate=2017-03-29T15:00:00+02:00
+[Logging]
+useLogFile=false
+level=DEBUG
+[Jira]
+url=https://jira.example.com
+user=foo
+password=bar
+remainingEstimatePolicy=auto
+[Toggl]
+apitoken=token
+apiurl={api_url}
+rateLimit=100
+workspace=123456
+organization=1234567
+regex=([A-Z]+-[0-9]+) -.*
+groupTimeEntriesBy=day
+"""
+
+
+class NoOpRunTest(unittest.TestCase):
+
+    def test_run_without_new_time_entries(self):
+        time_entries = [{'id': 1, 'project_id': 4711, 'description': 'Meeting', 'tags': ['jiraprocessed'],
+                         'start': '2024-01-08T09:00:00+00:00', 'duration': 600}]
+        with tempfile.TemporaryDirectory() as directory, FakeTogglServer(time_entries) as server:
+            config_file = os.path.join(directory, 'config.ini')
+            with open(config_file, 'w') as config:
+                config.write(CONFIGURATION.format(api_url=server.api_url))
+            shared_clients = processTimeTrackingEntries.SharedClients()
+            with mock.patch.object(shared_clients, 'get_jira_client', side_effect=AssertionError('JIRA is not needed')):
+                summary = processTimeTrackingEntries.process_time_entries(
+                    processTimeTrackingEntries.read_configuration(config_file), shared_clients=shared_clients)
+            self.assertEqual(summary, {"timeEntries": 1, "groups": 0, "worklogs": 0, "errors": 0})
+            # the range since 2017 is fetched in a few chunks
+            paths = [path.split('?')[0] for method, path in server.requests]
+            self.assertEqual(set(paths), {'/api/v9/me/time_entries'})
+            self.assertLessEqual(len(paths), processTimeTrackingEntries.TOGGL_FETCH_MAX_CHUNKS)
+            self.assertIsNotNone(shared_clients.http_statistics.first_request_started)
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+import datetime
+import unittest
+import processTimeTrackingEntries
+from test_worklog_submission import FakeJira, FakeTagger, create_group
+
+
+def create_time_entry(time_entry_id, project_id, description, start, tags=None):
+    return {'id': time_entry_id, 'project_id': project_id, 'description': description, 'start': start,
+            'duration': 600, 'tags': tags or []}
+
+
+def create_entry(time_entry_id, project_id, description, day, hour=9):
+    return processTimeTrackingEntries.TimeEntry(
+        time_entry_id, datetime.datetime(2024, 1, day, hour, tzinfo=datetime.UTC), 600, description, project_id)
+
+
+class ValidationStageTest(unittest.TestCase):
+
+    def test_invalid_time_entries_are_tagged_as_error(self):
+        tagger = FakeTagger()
+        time_entries = [
+            create_time_entry(1, 4711, 'Meeting', '2024-01-08T09:00:00+00:00'),
+            create_time_entry(2, 4711, 'Meeting', None),
+            create_time_entry(3, 4711, None, '2024-01-08T10:00:00+00:00'),
+            create_time_entry(4, 4711, 'Meeting', '2024-01-08T11:00:00+00:00',
+                              tags=[processTimeTrackingEntries.TOGGL_PROCESSED_TAG]),
+            create_time_entry(5, None, 'JIRA-1 - Review', '2024-01-08T12:00:00+00:00')
+        ]
+        entries = list(processTimeTrackingEntries.validate_time_entries(time_entries, tagger,
+                                                                        journaled_time_entry_ids={5}))
+        self.assertEqual(entries, [create_entry(1, 4711, 'Meeting', 8)])
+        self.assertEqual(tagger.errors, [2, 3])
+
+    def test_time_entries_are_validated_lazily(self):
+        time_entries = iter([create_time_entry(1, 4711, 'Meeting', '2024-01-08T09:00:00+00:00'),
+                             create_time_entry(2, 4711, 'Meeting', '2024-01-07T09:00:00+00:00')])
+        next(processTimeTrackingEntries.validate_time_entries(time_entries, FakeTagger()))
+        self.assertEqual(len(list(time_entries)), 1)
+
+
+class GroupingStageTest(unittest.TestCase):
+
+    def test_days_are_yielded_when_they_are_closed(self):
+        entries = iter([create_entry(1, 4711, 'Meeting', 9, 15), create_entry(2, 4712, 'Review', 9, 10),
+                        create_entry(3, 4711, 'Meeting', 9, 8), create_entry(4, 4711, 'Meeting', 8, 16),
+                        create_entry(5, 4711, 'Meeting', 5)])
+        batches = processTimeTrackingEntries.group_time_entries(entries, 'day')
+        first_batch = next(batches)
+        self.assertEqual([[time_entry.id for time_entry in group['time_entries']] for group in first_batch],
+                         [[1, 3], [2]])
+        # the first day is closed by the first time entry of the previous day
+        self.assertEqual([time_entry.id for time_entry in entries], [5])
+        self.assertEqual([[[time_entry.id for time_entry in group['time_entries']] for group in batch]
+                          for batch in batches], [[[4]]])
+
+    def test_weeks_are_yielded_when_they_are_closed(self):
+        entries = [create_entry(1, 4711, 'Meeting', 12), create_entry(2, 4711, 'Meeting', 8),
+                   create_entry(3, 4711, 'Meeting', 5)]
+        batches = list(processTimeTrackingEntries.group_time_entries(entries, 'week'))
+        self.assertEqual([[[time_entry.id for time_entry in group['time_entries']] for group in batch]
+                          for batch in batches], [[[1, 2]], [[3]]])
+
+    def test_unordered_time_entries_are_not_split(self):
+        entries = [create_entry(1, 4711, 'Meeting', 5), create_entry(2, 4711, 'Meeting', 9),
+                   create_entry(3, 4711, 'Meeting', 5, 11), create_entry(4, 4711, 'Meeting', 9, 12)]
+        batches = list(processTimeTrackingEntries.group_time_entries(entries, 'day'))
+        self.assertEqual([[[time_entry.id for time_entry in group['time_entries']] for group in batch]
+                          for batch in batches], [[[2, 4]], [[1, 3]]])
+
+
+class ResolutionStageTest(unittest.TestCase):
+
+    configuration = {'issue_number_regex_expression': '([A-Z]+-[0-9]+) -.*'}
+
+    def test_issues_are_resolved_per_batch(self):
+        jira = FakeJira({'JIRA-1', 'JIRA-2'})
+        issue_resolver = processTimeTrackingEntries.JiraIssueResolver(jira)
+        batches = iter([[create_group(4711, 'Meeting', (1, 0, 600)),
+                         create_group(None, 'JIRA-2 - Review', (2, 1, 60))],
+                        [create_group(4711, 'Meeting', (3, 24, 600))]])
+        groups = processTimeTrackingEntries.resolve_worklog_groups(batches, {4711: 'JIRA-1'}, self.configuration,
+                                                                   issue_resolver)
+        self.assertEqual(next(groups)['pid'], 4711)
+        self.assertEqual(jira.searches, ['key in ("JIRA-1", "JIRA-2")'])
+        self.assertEqual(issue_resolver.get('JIRA-2'), 'JIRA-2')
+        self.assertEqual(len(list(groups)), 2)
+        # the issues of the second batch are known already
+        self.assertEqual(len(jira.searches), 1)
+
+
+class SubmissionStageTest(unittest.TestCase):
+
+    configuration = {
+        'issue_number_regex_expression': '([A-Z]+-[0-9]+) -.*',
+        'jiraRePolicy': 'auto',
+        'workers': 2
+    }
+
+    def test_groups_are_submitted_while_they_are_produced(self):
+        jira = FakeJira({'JIRA-1'})
+        produced = []
+
+        def produce():
+            for index in range(20):
+                produced.append(index)
+                # at most two groups per worker are queued ahead of the submitted groups
+                self.assertLessEqual(len(produced) - len(jira.added_worklogs), 2 * self.configuration['workers'])
+                yield create_group(4711, 'Meeting {0}'.format(index), (index, 0, 600))
+
+        results = processTimeTrackingEntries.submit_worklog_groups(
+            produce(), {4711: 'JIRA-1'}, self.configuration, processTimeTrackingEntries.JiraIssueResolver(jira), jira,
+            FakeTagger())
+        self.assertEqual(results, [True] * 20)
+
+
+class TaggingStageTest(unittest.TestCase):
+
+    configuration = SubmissionStageTest.configuration
+
+    def test_time_entries_are_tagged_after_each_day(self):
+        jira = FakeJira({'JIRA-1'})
+        tagger = FakeTagger()
+        tagged = []
+        batches = [[create_group(4711, 'Meeting', (1, 0, 600)), create_group(4711, 'Review', (2, 1, 600))],
+                   [create_group(4711, 'Meeting', (3, -24, 600))]]
+        results = processTimeTrackingEntries.submit_worklog_batches(
+            batches, {4711: 'JIRA-1'}, self.configuration, processTimeTrackingEntries.JiraIssueResolver(jira), jira,
+            tagger, window_closed=lambda: tagged.append(list(tagger.processed)))
+        self.assertEqual(results, [True] * 3)
+        self.assertEqual([sorted(time_entry_ids) for time_entry_ids in tagged], [[1, 2], [1, 2, 3]])
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import contextlib
+import datetime
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+import requests
+import processTimeTrackingEntries
+from benchmark_main import CONFIGURATION, create_projects, create_time_entries
+from fake_servers import FakeJiraServer, FakeTogglServer
+
+
+class PlanTest(unittest.TestCase):
+    """Plans the worklogs against the fake servers with --plan and inserts them later with --execute-plan."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        start = datetime.datetime.now(datetime.UTC).replace(hour=0, minute=0, second=0, microsecond=0) - \
+            datetime.timedelta(days=4)
+        self.time_entries = create_time_entries(60, 5, 3, start)
+        self.servers = contextlib.ExitStack()
+        self.toggl_server = self.servers.enter_context(FakeTogglServer(self.time_entries, create_projects(5)))
+        # the issue of the fifth project is missing
+        self.jira_server = self.servers.enter_context(FakeJiraServer(
+            ['PRJ-{0}'.format(index + 1) for index in range(4)] +
+            ['OPS-{0}'.format(index + 1) for index in range(20)]))
+        self.config_file = os.path.join(self.directory.name, 'config.ini')
+        with open(self.config_file, 'w') as config:
+            config.write(CONFIGURATION.format(
+                start_date=start.isoformat(), workers=2, jira_url=self.jira_server.url,
+                toggl_api_url=self.toggl_server.api_url, fetch_engine='timeEntries', jira_client_rate_limit=1000,
+                toggl_client_rate_limit=1000))
+
+    def tearDown(self):
+        self.servers.close()
+        self.directory.cleanup()
+
+    def run_main(self, *arguments):
+        with mock.patch.object(sys, 'argv', ['processTimeTrackingEntries.py', '-c', self.config_file] +
+                               list(arguments)):
+            processTimeTrackingEntries.main()
+
+    def assert_plan_is_executed(self, plan_file):
+        self.run_main('--plan', plan_file)
+        self.assertEqual([(method, path) for method, path in self.toggl_server.requests + self.jira_server.requests
+                          if method not in ('GET', 'POST') or path.endswith('/worklog')], [])
+        self.assertEqual(self.jira_server.worklogs, {})
+        self.assertFalse(any(time_entry['tags'] for time_entry in self.toggl_server.time_entries.values()))
+
+        plan = processTimeTrackingEntries.read_plan(plan_file)
+        planned_worklogs = sorted((planned_worklog.issue, planned_worklog.started, planned_worklog.time_spent)
+                                  for planned_worklog in plan if planned_worklog.action == 'worklog')
+        errors = {time_entry_id for planned_worklog in plan if planned_worklog.action == 'error'
+                  for time_entry_id in planned_worklog.time_entry_ids}
+        self.assertEqual(len(planned_worklogs), len(
+            {(time_entry['start'][:10], time_entry['project_id'], time_entry['description'])
+             for time_entry in self.time_entries if time_entry['description'] != 'Unassigned work'
+             and time_entry['project_id'] != 1004}))
+        self.assertEqual(errors, {time_entry['id'] for time_entry in self.time_entries
+                                  if time_entry['description'] == 'Unassigned work'
+                                  or time_entry['project_id'] == 1004})
+
+        self.run_main('--execute-plan', plan_file)
+        self.assertEqual(sorted((worklog['issue'], processTimeTrackingEntries.parse_datetime(worklog['started']),
+                                 '{0}m'.format(worklog['timeSpentSeconds'] // 60))
+                                for worklog in self.jira_server.worklogs.values()), planned_worklogs)
+        self.assertEqual({time_entry_id for time_entry_id, time_entry in self.toggl_server.time_entries.items()
+                          if time_entry['tags'] == ['jiraerror']}, errors)
+        self.assertTrue(all(time_entry['tags'] for time_entry in self.toggl_server.time_entries.values()))
+
+    def test_json_plan(self):
+        plan_file = os.path.join(self.directory.name, 'plan.json')
+        self.assert_plan_is_executed(plan_file)
+        with open(plan_file, encoding='utf-8') as plan:
+            self.assertEqual(set(json.load(plan)[0]), set(processTimeTrackingEntries.PLAN_FIELDS))
+
+    def test_csv_plan(self):
+        self.assert_plan_is_executed(os.path.join(self.directory.name, 'plan.csv'))
+
+    def test_plan_is_not_executed_twice(self):
+        plan_file = os.path.join(self.directory.name, 'plan.json')
+        self.assert_plan_is_executed(plan_file)
+        worklogs = dict(self.jira_server.worklogs)
+        for time_entry in self.toggl_server.time_entries.values():
+            time_entry['tags'] = []
+        self.run_main('--execute-plan', plan_file)
+        self.assertEqual(self.jira_server.worklogs, worklogs)
+        self.assertEqual({time_entry_id for time_entry_id, time_entry in self.toggl_server.time_entries.items()
+                          if time_entry['tags'] == ['jiraprocessed']},
+                         {time_entry_id for planned_worklog in processTimeTrackingEntries.read_plan(plan_file)
+                          if planned_worklog.action == 'worklog' for time_entry_id in planned_worklog.time_entry_ids})
+
+    def test_plan_is_refused_without_duplicate_check(self):
+        plan_file = os.path.join(self.directory.name, 'plan.json')
+        self.run_main('--plan', plan_file)
+        with mock.patch.object(processTimeTrackingEntries.ExistingWorklogIndex, 'fetch',
+                               side_effect=requests.ConnectionError('JIRA is not reachable')):
+            self.run_main('--execute-plan', plan_file)
+        self.assertEqual(self.jira_server.worklogs, {})
+        self.assertFalse(any(time_entry['tags'] for time_entry in self.toggl_server.time_entries.values()))
+
+
+class PlanFileTest(unittest.TestCase):
+
+    def test_plan_files_are_read_back(self):
+        plan = [
+            processTimeTrackingEntries.PlannedWorklog(
+                'alice.ini', 'worklog', 'PRJ-1', datetime.datetime(2024, 1, 8, 9, tzinfo=datetime.UTC), '45m',
+                'Development, "reviews"', [1, 2]),
+            processTimeTrackingEntries.PlannedWorklog('alice.ini', 'error', None, None, None, '', [3],
+                                                      '(missing start time)')
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ('plan.json', 'plan.csv'):
+                plan_file = os.path.join(directory, name)
+                processTimeTrackingEntries.write_plan(plan_file, plan)
+                self.assertEqual(processTimeTrackingEntries.read_plan(plan_file), plan)
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
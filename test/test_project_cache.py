@@ -0,0 +1,104 @@
+import json
+import os
+import re
+import tempfile
+import time
+import unittest
+import requests
+import processTimeTrackingEntries
+from types import SimpleNamespace
+
+
+class FakeProjectToggl:
+    """A fake Toggl client which serves the project list, the changed projects and single projects. Projects of
+    another workspace are only served by the project list."""
+
+    workspace_id = 123456
+
+    def __init__(self, projects):
+        self.projects = {project['id']: project for project in projects}
+        self.requests = []
+
+    def get(self, uri, params=None):
+        self.requests.append((uri, params))
+        match = re.fullmatch(r'/workspaces/\d+/projects/(\d+)', uri)
+        if match is not None:
+            project = self.projects.get(int(match.group(1)))
+            if project is None or project.get('workspace_id', self.workspace_id) != self.workspace_id:
+                raise requests.HTTPError('404 Client Error', response=SimpleNamespace(status_code=404))
+            return project
+        if params is not None and 'since' in params:
+            return [project for project in self.projects.values() if project.get('at', 0) >= params['since']]
+        return [project for project in self.projects.values() if project.get('active', True)]
+
+
+class TogglProjectCacheTest(unittest.TestCase):
+
+    matcher = processTimeTrackingEntries.IssueKeyMatcher(['([A-Z]+-[0-9]+) -.*'], [])
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.directory.name, 'projects.json')
+        self.toggl = FakeProjectToggl([{'id': 1, 'name': 'JIRA-1 - Project'},
+                                       {'id': 2, 'name': 'JIRA-2 - Archived', 'active': False}])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_unknown_projects_are_fetched_one_by_one(self):
+        project_cache = processTimeTrackingEntries.TogglProjectCache()
+        self.assertEqual(project_cache.get_issue_numbers(self.toggl, self.matcher, {1}), {1: 'JIRA-1'})
+        self.assertEqual(self.toggl.requests, [('/me/projects', None)])
+        self.assertEqual(project_cache.get_issue_numbers(self.toggl, self.matcher, {1, 2, 3}), {1: 'JIRA-1'})
+        # the missing project is looked for in the changed projects, in case it belongs to another workspace
+        self.assertEqual(self.toggl.requests[1:], [('/workspaces/123456/projects/2', None),
+                                                   ('/workspaces/123456/projects/3', None),
+                                                   ('/me/projects', {'since': int(project_cache.fetched_at)})])
+        project_cache.get_issue_numbers(self.toggl, self.matcher, {1, 2, 3})
+        self.assertEqual(len(self.toggl.requests), 4)
+
+    def test_new_projects_of_other_workspaces_are_found(self):
+        project_cache = processTimeTrackingEntries.TogglProjectCache()
+        project_cache.get_issue_numbers(self.toggl, self.matcher, {1})
+        self.toggl.projects[4] = {'id': 4, 'name': 'JIRA-4 - Other workspace', 'workspace_id': 654321,
+                                  'at': project_cache.synced_at}
+        self.assertEqual(project_cache.get_issue_numbers(self.toggl, self.matcher, {4}), {4: 'JIRA-4'})
+
+    def test_missing_projects_are_fetched_again_after_the_next_synchronization(self):
+        project_cache = processTimeTrackingEntries.TogglProjectCache(sync_interval=0)
+        self.assertEqual(project_cache.get_issue_numbers(self.toggl, self.matcher, {3}), {})
+        self.toggl.projects[3] = {'id': 3, 'name': 'JIRA-3 - Shared with me'}
+        time.sleep(0.01)
+        self.assertEqual(project_cache.get_issue_numbers(self.toggl, self.matcher, {3}), {3: 'JIRA-3'})
+
+    def test_changed_projects_are_fetched_since_the_last_synchronization(self):
+        processTimeTrackingEntries.TogglProjectCache(self.cache_file).get_issue_numbers(self.toggl, self.matcher, {1})
+        with open(self.cache_file, encoding='utf-8') as cache_file:
+            synced_at = json.load(cache_file)['synced_at']
+        self.toggl.projects[1] = {'id': 1, 'name': 'JIRA-11 - Renamed project', 'at': synced_at}
+        self.toggl.requests.clear()
+
+        project_cache = processTimeTrackingEntries.TogglProjectCache(self.cache_file, sync_interval=0)
+        time.sleep(0.01)
+        self.assertEqual(project_cache.get_issue_numbers(self.toggl, self.matcher, {1}), {1: 'JIRA-11'})
+        self.assertEqual(self.toggl.requests, [('/me/projects', {'since': int(synced_at)})])
+
+    def test_projects_are_fetched_again_after_the_ttl(self):
+        processTimeTrackingEntries.TogglProjectCache(self.cache_file).get_issue_numbers(self.toggl, self.matcher, {1})
+        self.toggl.requests.clear()
+        project_cache = processTimeTrackingEntries.TogglProjectCache(self.cache_file, cache_ttl=-1)
+        project_cache.get_issue_numbers(self.toggl, self.matcher, {1})
+        self.assertEqual(self.toggl.requests, [('/me/projects', None)])
+
+    def test_no_request_without_project_ids(self):
+        project_cache = processTimeTrackingEntries.TogglProjectCache(self.cache_file)
+        self.assertEqual(project_cache.get_issue_numbers(self.toggl, self.matcher, set()), {})
+        self.assertEqual(self.toggl.requests, [])
+        self.assertFalse(os.path.exists(self.cache_file))
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+import processTimeTrackingEntries
+from fake_servers import FakeTogglServer
+from test_worklog_submission import FakeJira
+
+CONFIGURATION = """
+[Common]
+startdate=2024-01-01T00:00:00+00:00
+[Logging]
+useLogFile=false
+level=DEBUG
+[Jira]
+url=https://jira.example.com
+user=foo
+password=bar
+remainingEstimatePolicy=auto
+[Toggl]
+apitoken=token
+apiurl={api_url}
+rateLimit=1000
+rateLimitBurst=100
+workspace=123456
+organization=1234567
+regex=([A-Z]+-[0-9]+) -.*
+groupTimeEntriesBy=day
+"""
+
+TIME_ENTRIES = [
+    {'id': 1, 'workspace_id': 123456, 'project_id': 201, 'description': 'Development',
+     'start': '2024-01-08T08:00:00+00:00', 'stop': '2024-01-08T09:00:00+00:00', 'duration': 3600, 'tags': []},
+    {'id': 2, 'workspace_id': 123456, 'project_id': 201, 'description': 'Development',
+     'start': '2024-01-08T10:00:00+00:00', 'stop': '2024-01-08T10:30:00+00:00', 'duration': 1800, 'tags': []},
+    {'id': 3, 'workspace_id': 123456, 'project_id': None, 'description': 'Unassigned',
+     'start': '2024-01-09T10:00:00+00:00', 'stop': '2024-01-09T10:30:00+00:00', 'duration': 1800, 'tags': []}
+]
+
+
+class PercentileTest(unittest.TestCase):
+
+    def test_nearest_rank(self):
+        values = [0.5, 0.1, 0.4, 0.2, 0.3]
+        self.assertEqual(processTimeTrackingEntries.get_percentile(values, 50), 0.3)
+        self.assertEqual(processTimeTrackingEntries.get_percentile(values, 95), 0.5)
+        self.assertEqual(processTimeTrackingEntries.get_percentile(values, 0), 0.1)
+        self.assertIsNone(processTimeTrackingEntries.get_percentile([], 50))
+
+
+class RunMetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_time_entries(self, shared_clients):
+        jira = FakeJira({'PRJ-1'})
+        with FakeTogglServer(TIME_ENTRIES, [{'id': 201, 'name': 'PRJ-1 - Development'}]) as server:
+            config_file = os.path.join(self.directory.name, 'config.ini')
+            with open(config_file, 'w') as config:
+                config.write(CONFIGURATION.format(api_url=server.api_url))
+            with mock.patch.object(shared_clients, 'get_jira_client', return_value=jira):
+                summary = processTimeTrackingEntries.process_time_entries(
+                    processTimeTrackingEntries.read_configuration(config_file), shared_clients=shared_clients)
+        return {config_file: summary}
+
+    def test_phases_are_accumulated(self):
+        metrics = processTimeTrackingEntries.RunMetrics(processTimeTrackingEntries.HttpStatistics())
+        for _ in range(3):
+            with metrics.phase('fetchTimeEntries'):
+                pass
+        with self.assertRaises(ValueError):
+            with metrics.phase('submitWorklogs'):
+                raise ValueError()
+        self.assertEqual(metrics.phases['fetchTimeEntries']['count'], 3)
+        self.assertEqual(metrics.phases['submitWorklogs']['count'], 1)
+        self.assertGreaterEqual(metrics.phases['fetchTimeEntries']['seconds'], 0.0)
+
+    def test_nested_phases_are_not_counted_twice(self):
+        metrics = processTimeTrackingEntries.RunMetrics(processTimeTrackingEntries.HttpStatistics())
+
+        def produce():
+            for item in range(2):
+                time.sleep(0.02)
+                yield item
+
+        with metrics.phase('submitWorklogs'):
+            self.assertEqual(list(metrics.timed('groupTimeEntries', produce())), [0, 1])
+        self.assertEqual(metrics.phases['groupTimeEntries']['count'], 3)
+        self.assertGreaterEqual(metrics.phases['groupTimeEntries']['seconds'], 0.04)
+        self.assertLess(metrics.phases['submitWorklogs']['seconds'], 0.02)
+
+    def test_metrics_files_are_written(self):
+        json_file = os.path.join(self.directory.name, 'metrics.json')
+        prometheus_file = os.path.join(self.directory.name, 'metrics.prom')
+        shared_clients = processTimeTrackingEntries.SharedClients(json_file, prometheus_file)
+        summaries = self.run_time_entries(shared_clients)
+        shared_clients.metrics.record_summaries(summaries)
+        shared_clients.metrics.write()
+
+        with open(json_file, encoding='utf-8') as metrics_file:
+            metrics = json.load(metrics_file)
+        self.assertEqual(metrics['totals'], {'runs': 1, 'timeEntries': 3, 'groups': 2, 'worklogs': 1, 'errors': 1,
+                                             'failedConfigurations': 0})
+        # the range since 2024-01-01 is fetched and submitted in chunks, only one of them has worklogs to insert
+        endpoint = metrics['endpoints']['GET /api/v9/me/time_entries']
+        chunks = endpoint['requests']
+        self.assertGreater(chunks, 1)
+        self.assertLessEqual(chunks, processTimeTrackingEntries.TOGGL_FETCH_MAX_CHUNKS)
+        for phase in ('fetchTimeEntries', 'fetchProjects'):
+            self.assertEqual(metrics['phases'][phase]['count'], chunks, phase)
+        for phase in ('connectJira', 'submitWorklogs'):
+            self.assertEqual(metrics['phases'][phase]['count'], 1, phase)
+        # the time entries are tagged after each day and at the end of each chunk
+        self.assertEqual(metrics['phases']['tagTimeEntries']['count'], 2 + chunks)
+        # the pipeline stages are measured per item they produce: two days and the end of each chunk, the issues of
+        # the projects are resolved before
+        self.assertEqual(metrics['phases']['groupTimeEntries']['count'], 2 + chunks)
+        self.assertEqual(metrics['phases']['resolveIssues']['count'], 4)
+        self.assertIsNotNone(endpoint['latencySeconds']['p50'])
+        self.assertLessEqual(endpoint['latencySeconds']['p50'], endpoint['latencySeconds']['p95'])
+
+        with open(prometheus_file, encoding='utf-8') as metrics_file:
+            lines = metrics_file.read().splitlines()
+        self.assertIn('# TYPE toggl_jira_http_latency_seconds summary', lines)
+        self.assertIn('toggl_jira_http_requests_total{endpoint="GET /api/v9/me/time_entries"} ' + str(float(chunks)),
+                      lines)
+        self.assertIn('toggl_jira_phase_runs_total{phase="submitWorklogs"} 1.0', lines)
+        self.assertIn('toggl_jira_worklogs_total 1.0', lines)
+        self.assertFalse(os.path.exists(prometheus_file + '.tmp'))
+
+    def test_no_metrics_without_files(self):
+        shared_clients = processTimeTrackingEntries.SharedClients()
+        self.assertIsNone(shared_clients.metrics)
+        self.assertIs(shared_clients.phase('fetchTimeEntries'), processTimeTrackingEntries.NO_PHASE)
+        self.run_time_entries(shared_clients)
+        self.assertTrue(all('latencies' not in statistics
+                            for statistics in shared_clients.http_statistics.endpoints.values()))
+        self.assertEqual(os.listdir(self.directory.name), ['config.ini'])
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+import datetime
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+import requests
+from jira import JIRAError
+import processTimeTrackingEntries
+from fake_servers import FakeTogglServer
+from test_worklog_submission import FakeJira, FakeTagger, create_group
+
+CONFIGURATION = """
+[Common]
+startdate=2024-01-01T00:00:00+00:00
+stateFile=state.sqlite
+incrementalSync=true
+[Logging]
+useLogFile=false
+level=DEBUG
+[Jira]
+url=https://jira.example.com
+user=foo
+password=bar
+remainingEstimatePolicy=auto
+[Toggl]
+apitoken=token
+apiurl={api_url}
+workspace=123456
+organization=1234567
+regex=([A-Z]+-[0-9]+) -.*
+groupTimeEntriesBy=day
+"""
+
+
+class FakeToggl:
+
+    def __init__(self, time_entries):
+        self.time_entries = time_entries
+        self.requests = []
+
+    def get(self, uri, params=None):
+        self.requests.append((uri, params))
+        return self.time_entries
+
+    def get_time_entries(self, start_date, end_date):
+        self.requests.append(('range', start_date, end_date))
+        return self.time_entries
+
+
+class StateStoreTest(unittest.TestCase):
+
+    configuration = {'togglFetchEngine': 'timeEntries', 'groupTimeEntriesBy': 'day', 'backfillChunkDays': 7,
+                     'backfillFetchWorkers': 2}
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.state_store = processTimeTrackingEntries.StateStore(os.path.join(self.directory.name, 'state.sqlite'))
+
+    def tearDown(self):
+        self.state_store.close()
+        self.directory.cleanup()
+
+    def test_processed_time_entries_and_watermark(self):
+        self.assertIsNone(self.state_store.get_watermark())
+        self.state_store.mark_processed([1, 2])
+        self.state_store.set_watermark(1700000000.5)
+        self.assertTrue(self.state_store.is_processed(1))
+        self.assertFalse(self.state_store.is_processed(3))
+        self.assertEqual(self.state_store.get_watermark(), 1700000000)
+        self.state_store.reset()
+        self.assertFalse(self.state_store.is_processed(1))
+        self.assertIsNone(self.state_store.get_watermark())
+
+    def test_full_fetch_without_watermark(self):
+        toggl = FakeToggl([{'id': 1, 'start': '2024-01-02T08:00:00+00:00'}])
+        chunks = list(processTimeTrackingEntries.fetch_time_entries(
+            toggl, self.configuration, '2024-01-01T00:00:00+00:00', '2024-01-03T00:00:00+00:00', self.state_store))
+        self.assertEqual(toggl.requests, [('range', '2024-01-01T00:00:00+00:00', '2024-01-03T00:00:00+00:00')])
+        self.assertEqual(chunks, [toggl.time_entries])
+
+    def test_full_fetch_in_chunks_newest_first(self):
+        toggl = FakeToggl([])
+        chunks = list(processTimeTrackingEntries.fetch_time_entries(
+            toggl, self.configuration, '2024-01-01T00:00:00+00:00', '2024-01-16T12:00:00+00:00', self.state_store))
+        self.assertEqual(sorted(toggl.requests, reverse=True), [
+            ('range', '2024-01-15T00:00:00+00:00', '2024-01-16T12:00:00+00:00'),
+            ('range', '2024-01-08T00:00:00+00:00', '2024-01-15T00:00:00+00:00'),
+            ('range', '2024-01-01T00:00:00+00:00', '2024-01-08T00:00:00+00:00')])
+        self.assertEqual(len(chunks), 3)
+
+    def test_long_ranges_are_fetched_in_longer_chunks(self):
+        toggl = FakeToggl([])
+        list(processTimeTrackingEntries.fetch_time_entries(
+            toggl, self.configuration, '2017-03-29T15:00:00+02:00', '2024-01-16T12:00:00+00:00', self.state_store))
+        self.assertLessEqual(len(toggl.requests), processTimeTrackingEntries.TOGGL_FETCH_MAX_CHUNKS)
+        self.assertEqual(min(request[1] for request in toggl.requests), '2017-03-29T15:00:00+02:00')
+        self.assertEqual(max(request[2] for request in toggl.requests), '2024-01-16T12:00:00+00:00')
+
+    def test_incremental_fetch_since_watermark(self):
+        watermark = int(time.time()) - 3600
+        self.state_store.set_watermark(watermark)
+        self.state_store.mark_processed([2])
+        toggl = FakeToggl([
+            {'id': 1, 'start': '2024-01-02T08:00:00+00:00'},
+            {'id': 2, 'start': '2024-01-02T09:00:00+00:00'},
+            {'id': 3, 'start': '2023-12-24T09:00:00+00:00'},
+            {'id': 4, 'start': '2024-01-02T10:00:00+00:00', 'server_deleted_at': '2024-01-02T11:00:00+00:00'}
+        ])
+        chunks = list(processTimeTrackingEntries.fetch_time_entries(
+            toggl, self.configuration, '2024-01-01T00:00:00+00:00', '2024-01-03T00:00:00+00:00', self.state_store))
+        self.assertEqual(toggl.requests, [('/me/time_entries', {'since': watermark})])
+        self.assertEqual([[time_entry['id'] for time_entry in time_entries] for time_entries in chunks], [[1]])
+
+
+class IncrementalSyncTest(unittest.TestCase):
+
+    def test_stopped_time_entries_of_a_skipped_group_are_fetched_again(self):
+        modified_at = (datetime.datetime.now(datetime.UTC) - datetime.timedelta(hours=2)).isoformat()
+        time_entries = [
+            {'id': 1, 'project_id': 201, 'description': 'Development', 'start': '2024-01-08T08:00:00+00:00',
+             'stop': '2024-01-08T09:00:00+00:00', 'duration': 3600, 'tags': [], 'at': modified_at},
+            {'id': 2, 'project_id': 201, 'description': 'Development', 'start': '2024-01-08T10:00:00+00:00',
+             'stop': None, 'duration': -1704708000, 'tags': [], 'at': modified_at}
+        ]
+        jira = FakeJira({'PRJ-1'})
+        with tempfile.TemporaryDirectory() as directory, FakeTogglServer(
+                time_entries, [{'id': 201, 'name': 'PRJ-1 - Development'}]) as server:
+            config_file = os.path.join(directory, 'config.ini')
+            with open(config_file, 'w') as config:
+                config.write(CONFIGURATION.format(api_url=server.api_url))
+            configuration = processTimeTrackingEntries.read_configuration(config_file)
+            shared_clients = processTimeTrackingEntries.SharedClients()
+            with mock.patch.object(shared_clients, 'get_jira_client', return_value=jira):
+                # the group is skipped while the second time entry is running
+                processTimeTrackingEntries.process_time_entries(configuration, shared_clients=shared_clients)
+                self.assertEqual(jira.added_worklogs, [])
+                server.time_entries[2].update(stop='2024-01-08T10:30:00+00:00', duration=1800,
+                                              at=datetime.datetime.now(datetime.UTC).isoformat())
+                processTimeTrackingEntries.process_time_entries(configuration, shared_clients=shared_clients)
+            self.assertEqual([(issue, time_spent) for issue, started, time_spent, comment in jira.added_worklogs],
+                             [('PRJ-1', '90m')])
+            self.assertEqual([time_entry['tags'] for time_entry in server.time_entries.values()],
+                             [['jiraprocessed'], ['jiraprocessed']])
+            self.assertEqual([path.split('?')[1] for method, path in server.requests
+                              if path.startswith('/api/v9/me/time_entries?since=')],
+                             ['since={0}'.format(int(datetime.datetime.fromisoformat(modified_at).timestamp())
+                                                 - processTimeTrackingEntries.TOGGL_WATERMARK_MARGIN)])
+
+    def test_time_entries_modified_by_a_lagging_toggl_clock_are_fetched(self):
+        jira = FakeJira({'PRJ-1'})
+        with tempfile.TemporaryDirectory() as directory, FakeTogglServer(
+                [], [{'id': 201, 'name': 'PRJ-1 - Development'}]) as server:
+            config_file = os.path.join(directory, 'config.ini')
+            with open(config_file, 'w') as config:
+                config.write(CONFIGURATION.format(api_url=server.api_url))
+            configuration = processTimeTrackingEntries.read_configuration(config_file)
+            shared_clients = processTimeTrackingEntries.SharedClients()
+            with mock.patch.object(shared_clients, 'get_jira_client', return_value=jira):
+                processTimeTrackingEntries.process_time_entries(configuration, shared_clients=shared_clients)
+                # the clock of Toggl is a minute behind the local clock
+                server.time_entries[1] = {
+                    'id': 1, 'project_id': 201, 'description': 'Development', 'start': '2024-01-08T08:00:00+00:00',
+                    'stop': '2024-01-08T09:00:00+00:00', 'duration': 3600, 'tags': [],
+                    'at': (datetime.datetime.now(datetime.UTC) - datetime.timedelta(minutes=1)).isoformat()}
+                processTimeTrackingEntries.process_time_entries(configuration, shared_clients=shared_clients)
+            self.assertEqual([(issue, time_spent) for issue, started, time_spent, comment in jira.added_worklogs],
+                             [('PRJ-1', '60m')])
+
+    def test_watermark_is_kept_after_a_stop_between_chunks(self):
+        stop_event = threading.Event()
+        submit_time_entries = processTimeTrackingEntries.submit_time_entries
+
+        def submit_and_stop(*args, **kwargs):
+            stop_event.set()
+            return submit_time_entries(*args, **kwargs)
+
+        with tempfile.TemporaryDirectory() as directory, FakeTogglServer([]) as server:
+            config_file = os.path.join(directory, 'config.ini')
+            with open(config_file, 'w') as config:
+                config.write(CONFIGURATION.format(api_url=server.api_url))
+            configuration = processTimeTrackingEntries.read_configuration(config_file)
+            with mock.patch.object(processTimeTrackingEntries, 'submit_time_entries',
+                                   side_effect=submit_and_stop) as submit:
+                processTimeTrackingEntries.process_time_entries(configuration, stop_event=stop_event)
+            # only the newest chunk has been submitted, the older ones are fetched again in the next run
+            self.assertEqual(submit.call_count, 1)
+            state_store = processTimeTrackingEntries.StateStore(configuration['stateFile'])
+            self.assertIsNone(state_store.get_watermark())
+            state_store.close()
+
+
+class WorklogJournalTest(unittest.TestCase):
+
+    configuration = {
+        'issue_number_regex_expression': '([A-Z]+-[0-9]+) -.*',
+        'jiraRePolicy': 'auto',
+        'workers': 1
+    }
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.state_store = processTimeTrackingEntries.StateStore(os.path.join(self.directory.name, 'state.sqlite'))
+        self.jira = FakeJira({'JIRA-1'})
+        self.group = create_group(4711, 'Meeting', (1, 0, 600), (2, 1, 1200))
+
+    def tearDown(self):
+        self.state_store.close()
+        self.directory.cleanup()
+
+    def submit(self, tagger):
+        return processTimeTrackingEntries.submit_worklog_group(
+            self.group, {4711: 'JIRA-1'}, self.configuration, processTimeTrackingEntries.JiraIssueResolver(self.jira),
+            self.jira, tagger, self.state_store)
+
+    def test_created_worklog_is_journaled_until_tagged(self):
+        self.assertTrue(self.submit(FakeTagger()))
+        worklogs = self.state_store.get_journaled_worklogs()
+        self.assertEqual([(worklog["status"], worklog["worklog_id"]) for worklog in worklogs], [('created', '1')])
+        self.assertEqual(self.state_store.get_journaled_time_entry_ids(), {1, 2})
+
+        self.state_store.mark_processed([1])
+        self.state_store.finish_worklogs()
+        self.assertEqual(len(self.state_store.get_journaled_worklogs()), 1)
+        self.state_store.mark_processed([2])
+        self.state_store.finish_worklogs()
+        self.assertEqual(self.state_store.get_journaled_worklogs(), [])
+
+    def test_created_worklog_is_tagged_again(self):
+        self.submit(FakeTagger())
+        tagger = FakeTagger()
+        processTimeTrackingEntries.reconcile_worklog_journal(self.state_store, self.jira, tagger)
+        self.assertEqual(tagger.processed, [1, 2])
+        self.assertEqual(len(self.jira.added_worklogs), 1)
+
+    def test_pending_worklog_which_has_been_inserted(self):
+        start_time = self.group["time_entries"][0].start_time
+        self.state_store.begin_worklog('JIRA-1', start_time, '30m', 'Meeting', [1, 2])
+        self.jira.add_worklog('JIRA-1', timeSpent='30m', comment='Meeting', started=start_time)
+        tagger = FakeTagger()
+        processTimeTrackingEntries.reconcile_worklog_journal(self.state_store, self.jira, tagger)
+        self.assertEqual(tagger.processed, [1, 2])
+        self.assertEqual([worklog["status"] for worklog in self.state_store.get_journaled_worklogs()], ['created'])
+
+    def test_failed_worklog_stays_pending_unless_rejected(self):
+        for exception, status in [(JIRAError(status_code=500), 'pending'), (JIRAError(status_code=None), 'pending'),
+                                  (JIRAError(status_code=429), 'pending'), (requests.ReadTimeout(), 'pending'),
+                                  (requests.ConnectionError(), 'pending'), (JIRAError(status_code=400), None)]:
+            tagger = FakeTagger()
+            with mock.patch.object(self.jira, 'add_worklog', side_effect=exception):
+                result = self.submit(tagger)
+            worklogs = self.state_store.get_journaled_worklogs()
+            self.assertEqual([worklog["status"] for worklog in worklogs], [status] if status else [], repr(exception))
+            if status == 'pending':
+                self.assertIsNone(result)
+                self.assertEqual(tagger.errors, [])
+                self.state_store.abort_worklog(worklogs[0]["journal_id"])
+            else:
+                self.assertFalse(result)
+                self.assertEqual(tagger.errors, [1, 2])
+
+    def test_pending_worklog_with_trimmed_comment(self):
+        start_time = self.group["time_entries"][0].start_time
+        self.state_store.begin_worklog('JIRA-1', start_time, '30m', 'Meeting ', [1, 2])
+        self.jira.add_worklog('JIRA-1', timeSpent='30m', comment='Meeting', started=start_time)
+        tagger = FakeTagger()
+        processTimeTrackingEntries.reconcile_worklog_journal(self.state_store, self.jira, tagger)
+        self.assertEqual(tagger.processed, [1, 2])
+
+    def test_pending_worklog_which_cannot_be_checked(self):
+        self.state_store.begin_worklog('JIRA-1', self.group["time_entries"][0].start_time, '30m', 'Meeting',
+                                       [1, 2])
+        tagger = FakeTagger()
+        with mock.patch.object(self.jira, 'worklogs', side_effect=requests.ReadTimeout()):
+            processTimeTrackingEntries.reconcile_worklog_journal(self.state_store, self.jira, tagger)
+        self.assertEqual(tagger.processed, [])
+        self.assertEqual([worklog["status"] for worklog in self.state_store.get_journaled_worklogs()], ['pending'])
+
+    def test_pending_worklog_which_has_not_been_inserted(self):
+        self.state_store.begin_worklog('JIRA-1', self.group["time_entries"][0].start_time, '30m', 'Meeting',
+                                       [1, 2])
+        tagger = FakeTagger()
+        processTimeTrackingEntries.reconcile_worklog_journal(self.state_store, self.jira, tagger)
+        self.assertEqual(tagger.processed, [])
+        self.assertEqual(self.state_store.get_journaled_worklogs(), [])
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
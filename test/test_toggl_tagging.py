@@ -0,0 +1,77 @@
+import unittest
+import processTimeTrackingEntries
+from fake_servers import FakeTogglServer
+
+
+class TogglTaggingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeTogglServer(
+            {'id': time_entry_id, 'tags': ['billable'] if time_entry_id % 2 else None}
+            for time_entry_id in range(1, 251))
+        self.server.__enter__()
+        self.tagger = processTimeTrackingEntries.TogglTagger(
+            processTimeTrackingEntries.TogglClient(self.server.api_url, 'token', 123456), chunk_size=100)
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+
+    def test_tags_are_sent_in_chunks(self):
+        for time_entry_id in range(1, 251):
+            self.tagger.add_processed(time_entry_id, 'description')
+        results = self.tagger.flush()
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertTrue(all(method == 'PATCH' for method, path in self.server.requests))
+        succeeded, failed = results[processTimeTrackingEntries.TOGGL_PROCESSED_TAG]
+        self.assertEqual(len(succeeded), 250)
+        self.assertEqual(failed, {})
+
+    def test_full_chunks_are_sent_at_once(self):
+        for time_entry_id in range(1, 151):
+            self.tagger.add_processed(time_entry_id, 'description')
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.server.time_entries[100]['tags'], ['jiraprocessed'])
+        succeeded, failed = self.tagger.flush()[processTimeTrackingEntries.TOGGL_PROCESSED_TAG]
+        self.assertEqual(sorted(succeeded), list(range(1, 151)))
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.tagger.flush(), {})
+
+    def test_nothing_is_sent_before_flush_when_planning(self):
+        tagger = processTimeTrackingEntries.TogglTagger(None, chunk_size=2, send_full_chunks=False)
+        for time_entry_id in range(1, 6):
+            tagger.add_processed(time_entry_id, 'description')
+        self.assertEqual(len(tagger.pending[processTimeTrackingEntries.TOGGL_PROCESSED_TAG]), 5)
+
+    def test_tags_are_added_to_existing_tags(self):
+        self.tagger.add_processed(1, 'description')
+        self.tagger.add_error(2, 'description')
+        self.tagger.flush()
+        self.assertEqual(self.server.time_entries[1]['tags'], ['billable', 'jiraprocessed'])
+        self.assertEqual(self.server.time_entries[2]['tags'], ['jiraerror'])
+        self.assertEqual(len(self.server.requests), 2)
+
+        # a time entry which has been tagged as error before loses the error tag once it has been processed
+        self.tagger.add_processed(2, 'description')
+        self.tagger.add_error(1, 'description')
+        self.tagger.flush()
+        self.assertEqual(self.server.time_entries[2]['tags'], ['jiraprocessed'])
+        self.assertEqual(self.server.time_entries[1]['tags'], ['billable', 'jiraerror'])
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_failures_are_reported_per_id(self):
+        self.tagger.add_processed(1, 'description')
+        self.tagger.add_processed(4711, 'unknown')
+        succeeded, failed = self.tagger.flush()[processTimeTrackingEntries.TOGGL_PROCESSED_TAG]
+        self.assertEqual(succeeded, [1])
+        self.assertEqual(list(failed), [4711])
+
+    def test_flush_without_pending_tags_sends_nothing(self):
+        self.assertEqual(self.tagger.flush(), {})
+        self.assertEqual(self.server.requests, [])
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
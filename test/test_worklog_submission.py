@@ -0,0 +1,156 @@
+import datetime
+import re
+import threading
+import time
+import unittest
+import processTimeTrackingEntries
+from types import SimpleNamespace
+from jira import JIRAError, Worklog
+
+
+class FakeTagger:
+
+    def __init__(self):
+        self.processed = []
+        self.errors = []
+
+    def add_processed(self, time_entry_id, time_entry_description):
+        self.processed.append(time_entry_id)
+
+    def add_error(self, time_entry_id, time_entry_description):
+        self.errors.append(time_entry_id)
+
+
+class FakeJira:
+
+    def __init__(self, existing_issues, latency=0.0):
+        self.existing_issues = existing_issues
+        self.latency = latency
+        self.added_worklogs = []
+        self.searches = []
+        self.issue_requests = []
+        self._lock = threading.Lock()
+
+    def search_issues(self, jql_str, maxResults=50, validate_query=True, fields=None):
+        self.searches.append(jql_str)
+        return [SimpleNamespace(key=key) for key in re.findall(r'"([^"]+)"', jql_str) if key in self.existing_issues]
+
+    def issue(self, key, fields=None):
+        self.issue_requests.append(key)
+        if key not in self.existing_issues:
+            raise JIRAError(status_code=404, text='Issue does not exist')
+        return SimpleNamespace(key=key)
+
+    def add_worklog(self, issue, adjustEstimate=None, timeSpent=None, comment=None, started=None):
+        time.sleep(self.latency)
+        with self._lock:
+            self.added_worklogs.append((issue, started, timeSpent, comment))
+            return Worklog({}, None, {'id': str(len(self.added_worklogs))})
+
+    def worklogs(self, issue):
+        return [Worklog({}, None, {
+            'id': str(index + 1),
+            'started': started.strftime("%Y-%m-%dT%H:%M:%S.000%z"),
+            'timeSpentSeconds': int(time_spent.rstrip('m')) * 60,
+            'comment': comment
+        }) for index, (worklog_issue, started, time_spent, comment) in enumerate(self.added_worklogs)
+            if worklog_issue == issue]
+
+
+def create_group(pid, description, *time_entries):
+    return {
+        "pid": pid,
+        "description": description,
+        "time_entries": [processTimeTrackingEntries.TimeEntry(
+            time_entry_id, datetime.datetime(2024, 1, 8, 9, tzinfo=datetime.UTC) + datetime.timedelta(hours=offset),
+            duration, description) for time_entry_id, offset, duration in time_entries]
+    }
+
+
+class WorklogSubmissionTest(unittest.TestCase):
+
+    configuration = {
+        'issue_number_regex_expression': '([A-Z]+-[0-9]+) -.*',
+        'jiraRePolicy': 'auto',
+        'workers': 1
+    }
+
+    def test_worklog_is_inserted_and_tagged(self):
+        jira = FakeJira({'JIRA-1'})
+        tagger = FakeTagger()
+        group = create_group(4711, 'Meeting', (1, 0, 600), (2, 1, 1200))
+        self.assertTrue(processTimeTrackingEntries.submit_worklog_group(
+            group, {4711: 'JIRA-1'}, self.configuration, processTimeTrackingEntries.JiraIssueResolver(jira), jira,
+            tagger))
+        self.assertEqual(jira.added_worklogs, [('JIRA-1', group["time_entries"][0].start_time, '30m', 'Meeting')])
+        self.assertEqual(tagger.processed, [1, 2])
+
+    def test_issue_from_description(self):
+        jira = FakeJira({'JIRA-2'})
+        tagger = FakeTagger()
+        group = create_group(None, 'JIRA-2 - Review', (1, 0, 60))
+        self.assertTrue(processTimeTrackingEntries.submit_worklog_group(
+            group, {}, self.configuration, processTimeTrackingEntries.JiraIssueResolver(jira), jira, tagger))
+        self.assertEqual(jira.added_worklogs[0][0], 'JIRA-2')
+
+    def test_missing_issue_is_tagged_as_error(self):
+        jira = FakeJira(set())
+        tagger = FakeTagger()
+        group = create_group(4711, 'Meeting', (1, 0, 600))
+        self.assertFalse(processTimeTrackingEntries.submit_worklog_group(
+            group, {4711: 'JIRA-1'}, self.configuration, processTimeTrackingEntries.JiraIssueResolver(jira), jira,
+            tagger))
+        self.assertEqual(tagger.errors, [1])
+        self.assertEqual(tagger.processed, [])
+
+    def test_running_time_entry_is_skipped(self):
+        jira = FakeJira({'JIRA-1'})
+        tagger = FakeTagger()
+        group = create_group(4711, 'Meeting', (1, 0, -1), (2, 1, 600))
+        self.assertIsNone(processTimeTrackingEntries.submit_worklog_group(
+            group, {4711: 'JIRA-1'}, self.configuration, processTimeTrackingEntries.JiraIssueResolver(jira), jira,
+            tagger))
+        self.assertEqual(jira.added_worklogs, [])
+
+    def test_concurrent_submission(self):
+        jira = FakeJira({'JIRA-1'}, latency=0.05)
+        tagger = FakeTagger()
+        groups = [create_group(4711, 'Meeting {0}'.format(index), (index, 0, 600)) for index in range(40)]
+        configuration = dict(self.configuration, workers=10)
+        started = time.monotonic()
+        results = processTimeTrackingEntries.submit_worklog_groups(
+            groups, {4711: 'JIRA-1'}, configuration, processTimeTrackingEntries.JiraIssueResolver(jira), jira, tagger)
+        self.assertLess(time.monotonic() - started, 40 * 0.05 / 2)
+        self.assertEqual(results, [True] * 40)
+        self.assertEqual(sorted(tagger.processed), list(range(40)))
+
+
+class GroupingTest(unittest.TestCase):
+
+    def test_days_of_different_years_are_not_grouped(self):
+        self.assertNotEqual(
+            processTimeTrackingEntries.get_group_key(4711, 'Meeting', datetime.datetime(2023, 1, 8, 9), 'day'),
+            processTimeTrackingEntries.get_group_key(4711, 'Meeting', datetime.datetime(2024, 1, 8, 9), 'day'))
+
+    def test_weeks_of_different_years_are_not_grouped(self):
+        self.assertNotEqual(
+            processTimeTrackingEntries.get_group_key(4711, 'Meeting', datetime.datetime(2023, 1, 9, 9), 'week'),
+            processTimeTrackingEntries.get_group_key(4711, 'Meeting', datetime.datetime(2024, 1, 8, 9), 'week'))
+
+    def test_iso_week_spans_new_year(self):
+        self.assertEqual(
+            processTimeTrackingEntries.get_group_key(4711, 'Meeting', datetime.datetime(2024, 12, 30, 9), 'week'),
+            processTimeTrackingEntries.get_group_key(4711, 'Meeting', datetime.datetime(2025, 1, 3, 9), 'week'))
+
+    def test_toggl_and_jira_dates_are_parsed(self):
+        expected = datetime.datetime(2024, 1, 8, 9, tzinfo=datetime.UTC)
+        self.assertEqual(processTimeTrackingEntries.parse_datetime('2024-01-08T09:00:00Z'), expected)
+        self.assertEqual(processTimeTrackingEntries.parse_datetime('2024-01-08T09:00:00.000+0000'), expected)
+        self.assertEqual(processTimeTrackingEntries.parse_datetime('Jan 8 2024 09:00 UTC'), expected)
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()